@@ -1,51 +1,134 @@
-import sqlite3
+import asyncio
 import threading
-from queue import Queue
+from concurrent.futures import Future
+from queue import Queue, Empty
+from storage import get_connection, close_thread_connections
+
+import logging
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
 
 class DatabaseManager:
-    def __init__(self, db_path):
+    def __init__(self, db_path, max_batch: int = 256):
+        """
+        Менеджер записи в SQLite через один рабочий поток
+
+        Каждый запрос получает свой Future, поэтому ответы не перепутываются
+        между потоками. Накопившиеся в очереди запросы выполняются одной
+        транзакцией (по SAVEPOINT на запрос, ошибка одного не откатывает остальные).
+        Чтение без очереди — через read().
+        """
         self.db_path = db_path
         self.connection = None
+        self.max_batch = max_batch
         self.lock = threading.Lock()
         self.request_queue = Queue()
-        self.response_queue = Queue()
         self.worker_thread = threading.Thread(target=self._db_worker, daemon=True)
         self.worker_thread.start()
 
     def _db_worker(self):
         """Рабочий поток для выполнения запросов к БД"""
-        self.connection = sqlite3.connect(self.db_path)
-        while True:
-            request = self.request_queue.get()
-            if request == "STOP":
-                break
-            method, args, kwargs = request
+        self.connection = get_connection(self.db_path)
+        running = True
+        while running:
+            batch = [self.request_queue.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self.request_queue.get_nowait())
+                except Empty:
+                    break
+
+            if _STOP in batch:
+                running = False
+                batch = [request for request in batch if request is not _STOP]
+            if batch:
+                self._execute_batch(batch)
+        close_thread_connections()
+
+    def _execute_batch(self, batch):
+        """Выполняет пачку запросов одной транзакцией"""
+        results = []
+        try:
+            self.connection.execute("BEGIN IMMEDIATE")
+            for future, method, query, params in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                self.connection.execute("SAVEPOINT request")
+                try:
+                    result = getattr(self, method)(query, params)
+                    self.connection.execute("RELEASE request")
+                    results.append((future, True, result))
+                except Exception as e:
+                    self.connection.execute("ROLLBACK TO request")
+                    self.connection.execute("RELEASE request")
+                    results.append((future, False, e))
+            self.connection.commit()
+        except Exception as e:
+            logger.error(f"[DatabaseManager] Ошибка транзакции {self.db_path}: {e}")
             try:
-                result = getattr(self, method)(*args, **kwargs)
-                self.response_queue.put((True, result))
-            except Exception as e:
-                self.response_queue.put((False, str(e)))
-        self.connection.close()
+                self.connection.rollback()
+            except Exception:
+                pass
+            for future, *_ in batch:
+                if not future.done():
+                    future.set_exception(RuntimeError(str(e)))
+            return
 
-    def execute(self, query, params=()):
-        """Выполняет SQL-запрос через очередь"""
-        self.request_queue.put(("_execute", (query, params), {}))
-        success, result = self.response_queue.get()
-        if not success:
-            raise RuntimeError(result)
-        return result
+        for future, success, result in results:
+            if success:
+                future.set_result(result)
+            else:
+                error = RuntimeError(str(result))
+                error.__cause__ = result
+                future.set_exception(error)
 
     def _execute(self, query, params):
         """Внутренний метод выполнения запроса"""
-        cursor = self.connection.cursor()
-        cursor.execute(query, params)
-        self.connection.commit()
-        if query.strip().upper().startswith("SELECT"):
+        cursor = self.connection.execute(query, params)
+        if cursor.description is not None:
             return cursor.fetchall()
-        return None
+        return cursor.rowcount
+
+    def _executemany(self, query, seq_of_params):
+        cursor = self.connection.executemany(query, seq_of_params)
+        return cursor.rowcount
+
+    def submit(self, query, params=()) -> Future:
+        """Ставит запрос в очередь и сразу возвращает Future"""
+        future = Future()
+        self.request_queue.put((future, "_execute", query, params))
+        return future
+
+    def submit_many(self, query, seq_of_params) -> Future:
+        future = Future()
+        self.request_queue.put((future, "_executemany", query, list(seq_of_params)))
+        return future
+
+    def execute(self, query, params=()):
+        """
+        Выполняет SQL-запрос через очередь и ждёт фиксации транзакции
+
+        :return: строки для SELECT, иначе количество изменённых строк
+        """
+        return self.submit(query, params).result()
+
+    def executemany(self, query, seq_of_params) -> int:
+        return self.submit_many(query, seq_of_params).result()
+
+    async def execute_async(self, query, params=()):
+        """То же, что execute, но без блокировки цикла событий"""
+        return await asyncio.wrap_future(self.submit(query, params))
+
+    async def executemany_async(self, query, seq_of_params) -> int:
+        return await asyncio.wrap_future(self.submit_many(query, seq_of_params))
+
+    def read(self, query, params=()) -> list:
+        """Чтение в вызывающем потоке через его WAL-соединение, без очереди"""
+        return get_connection(self.db_path).execute(query, params).fetchall()
 
     def close(self):
         """Завершает работу менеджера"""
-        self.request_queue.put("STOP")
+        self.request_queue.put(_STOP)
         self.worker_thread.join()
-
@@ -0,0 +1,78 @@
+import threading
+import time
+from collections import OrderedDict
+
+from migrations import migrate_db
+from storage import transaction
+import logging
+
+logger = logging.getLogger(__name__)
+
+CLAIM_QUERY = "INSERT OR IGNORE INTO processed_events (event_id, created_at) VALUES (?, ?)"
+PROCESSED_QUERY = "SELECT 1 FROM processed_events WHERE event_id = ?"
+PRUNE_QUERY = "DELETE FROM processed_events WHERE created_at < ?"
+
+
+class EventDedup:
+    def __init__(self, db_path: str, max_memory: int = 10000, retention_days: int = 30):
+        """
+        Дедупликация событий биржи, переживающая перезапуск
+
+        Идентификаторы хранятся в таблице processed_events; последние
+        max_memory из них дополнительно держатся в памяти (LRU), чтобы
+        повторные события не обращались к БД. Событие записывается в БД
+        (claim) в той же транзакции, что и его обработка, — при ошибке
+        обработки отметка откатывается вместе с ней.
+
+        :param db_path: БД позиций (таблица processed_events, миграция positions v3)
+        :param max_memory: размер кеша в памяти
+        :param retention_days: сколько дней хранить идентификаторы в БД
+        """
+        self.db_path = db_path
+        self.max_memory = max_memory
+        self.retention_days = retention_days
+        self._recent = OrderedDict()
+        self._lock = threading.Lock()
+        migrate_db(db_path, "positions")
+        self.prune()
+
+    def remember(self, event_id: str):
+        """Запоминает событие только в памяти (до перезапуска)"""
+        with self._lock:
+            self._recent[event_id] = None
+            self._recent.move_to_end(event_id)
+            while len(self._recent) > self.max_memory:
+                self._recent.popitem(last=False)
+
+    def is_processed(self, event_id: str) -> bool:
+        """Событие уже обработано (в памяти или в БД)"""
+        with self._lock:
+            if event_id in self._recent:
+                self._recent.move_to_end(event_id)
+                return True
+        with transaction(self.db_path) as conn:
+            found = conn.execute(PROCESSED_QUERY, (event_id,)).fetchone() is not None
+        if found:
+            self.remember(event_id)
+        return found
+
+    @staticmethod
+    def claim(conn, event_id: str) -> bool:
+        """
+        Отмечает событие обработанным в транзакции вызывающего (conn)
+
+        После фиксации транзакции вызывающий вызывает remember().
+        :return: True, если событие новое; False, если его уже отметил другой поток
+        """
+        inserted = conn.execute(CLAIM_QUERY, (event_id, time.time())).rowcount
+        return bool(inserted)
+
+    def prune(self):
+        """Удаляет из БД идентификаторы старше retention_days"""
+        try:
+            with transaction(self.db_path) as conn:
+                removed = conn.execute(PRUNE_QUERY, (time.time() - self.retention_days * 86400,)).rowcount
+            if removed:
+                logger.info(f"[Dedup] Удалено устаревших событий: {removed}")
+        except Exception as e:
+            logger.warning(f"[Dedup] Ошибка очистки processed_events: {e}")
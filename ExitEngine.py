@@ -0,0 +1,134 @@
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Tuple
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class ExitEngine:
+    def __init__(self, handler: Callable, workers: int = 4, max_pending: int = 1000):
+        """
+        Проверка условий выхода по тикерам на фиксированном пуле потоков
+
+        Для каждого символа хранится только последняя цена: пока символ ждёт
+        в очереди или проверяется, новые тикеры лишь заменяют цену. Один
+        символ никогда не проверяется в двух потоках одновременно.
+
+        :param handler: handler(symbol, price) — например PositionMonitor._check_position
+        :param workers: число рабочих потоков
+        :param max_pending: предел символов в ожидании, сверх него тикеры отбрасываются
+        """
+        self.handler = handler
+        self.workers = workers
+        self.max_pending = max_pending
+        self._latest: Dict[str, Tuple[object, float]] = {}
+        self._queue = deque()
+        self._in_flight = set()
+        self._cond = threading.Condition()
+        self._threads = []
+        self._running = False
+
+        self.submitted = 0
+        self.processed = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.errors = 0
+        self.latency_max = 0.0
+        self._latency_total = 0.0
+
+    def start(self):
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+            self._threads = [
+                threading.Thread(target=self._worker, name=f"exit-engine-{i}", daemon=True)
+                for i in range(self.workers)
+            ]
+        for thread in self._threads:
+            thread.start()
+        logger.info(f"[ExitEngine] ✅ Запущен: {self.workers} потоков, лимит очереди {self.max_pending}")
+
+    def submit(self, symbol: str, price) -> bool:
+        """
+        Передаёт новую цену символа на проверку
+
+        :return: False, если тикер отброшен из-за переполнения
+        """
+        with self._cond:
+            self.submitted += 1
+            if symbol in self._latest:
+                # Символ уже ждёт — обновляем цену, время ожидания считаем от первого тикера
+                self._latest[symbol] = (price, self._latest[symbol][1])
+                self.coalesced += 1
+                return True
+
+            if len(self._latest) >= self.max_pending:
+                self.dropped += 1
+                if self.dropped % 100 == 1:
+                    logger.warning(f"[ExitEngine] Очередь переполнена, отброшено тикеров: {self.dropped}")
+                return False
+
+            self._latest[symbol] = (price, time.monotonic())
+            # Символ в работе — его поставит в очередь освободившийся поток
+            if symbol not in self._in_flight:
+                self._queue.append(symbol)
+                self._cond.notify()
+            return True
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while self._running and not self._queue:
+                    self._cond.wait()
+                if not self._running:
+                    return
+                symbol = self._queue.popleft()
+                price, queued_at = self._latest.pop(symbol)
+                self._in_flight.add(symbol)
+
+            latency = time.monotonic() - queued_at
+            failed = False
+            try:
+                self.handler(symbol, price)
+            except Exception as e:
+                failed = True
+                logger.error(f"[ExitEngine] Ошибка проверки {symbol}: {e}")
+
+            with self._cond:
+                self._in_flight.discard(symbol)
+                self.processed += 1
+                self.errors += failed
+                self.latency_max = max(self.latency_max, latency)
+                self._latency_total += latency
+                # Пока шла проверка, пришла новая цена — проверяем снова
+                if symbol in self._latest:
+                    self._queue.append(symbol)
+                    self._cond.notify()
+
+    def stats(self) -> dict:
+        """Счётчики и задержка от тикера до начала проверки (сек)"""
+        with self._cond:
+            return {
+                "pending": len(self._latest),
+                "in_flight": len(self._in_flight),
+                "submitted": self.submitted,
+                "processed": self.processed,
+                "coalesced": self.coalesced,
+                "dropped": self.dropped,
+                "errors": self.errors,
+                "latency_max": round(self.latency_max, 4),
+                "latency_avg": round(self._latency_total / self.processed, 4) if self.processed else 0.0,
+            }
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._latest.clear()
+            self._queue.clear()
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout=5)
+        logger.info(f"[ExitEngine] Остановлен, метрики: {self.stats()}")
@@ -0,0 +1,124 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from config import ORDER_FILL_DEADLINE
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Конечные состояния ордера OKX
+FINAL_STATES = {"filled", "canceled", "mmp_canceled"}
+
+
+class FillWaiter:
+    def __init__(self, deadline: float = 5, initial_delay: float = 0.05, max_delay: float = 0.5,
+                 push_grace: float = 0.5, max_recent: int = 1000):
+        """
+        Ожидание исполнения ордера вместо фиксированного sleep
+
+        Состояние берётся из событий канала orders (on_order_event), а если
+        событие не пришло — из get_order с экспоненциальной паузой
+        initial_delay → max_delay. Возвращает управление сразу после
+        перехода ордера в конечное состояние или по истечении deadline.
+
+        :param deadline: предельное время ожидания по умолчанию, сек
+        :param push_grace: при живом WebSocket столько ждать событие до первого опроса REST
+        :param max_recent: сколько последних событий хранить (событие может прийти раньше wait)
+        """
+        self.deadline = deadline
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.push_grace = push_grace
+        self.max_recent = max_recent
+        self.push_source = None
+        self._recent = OrderedDict()
+        self._waiters = {}
+        self._lock = threading.Lock()
+
+        self.confirmed = 0
+        self.timeouts = 0
+        self.polls = 0
+        self._latency_total = 0.0
+
+    def on_order_event(self, order: dict):
+        """Обработчик канала orders приватного WebSocket"""
+        ord_id = order.get("ordId")
+        if not ord_id or order.get("state") not in FINAL_STATES:
+            return
+        with self._lock:
+            self._recent[ord_id] = order
+            while len(self._recent) > self.max_recent:
+                self._recent.popitem(last=False)
+            event = self._waiters.get(ord_id)
+        if event is not None:
+            event.set()
+
+    def _poll(self, trade_api, inst_id: str, ord_id: str) -> Optional[dict]:
+        self.polls += 1
+        try:
+            res = trade_api.get_order(instId=inst_id, ordId=ord_id)
+            if res.get("code") == "0" and res.get("data"):
+                order = res["data"][0]
+                if order.get("state") in FINAL_STATES:
+                    return order
+        except Exception as e:
+            logger.warning(f"[Fill] Ошибка запроса состояния ордера {ord_id}: {e}")
+        return None
+
+    def wait(self, trade_api, inst_id: str, ord_id: Optional[str], deadline: Optional[float] = None) -> Optional[dict]:
+        """
+        Ждёт конечного состояния ордера
+
+        :return: данные ордера (state, avgPx, fillSz...) или None по истечении срока
+        """
+        if not ord_id:
+            return None
+        started = time.monotonic()
+        until = started + (self.deadline if deadline is None else deadline)
+
+        event = threading.Event()
+        with self._lock:
+            order = self._recent.get(ord_id)
+            if order is None:
+                self._waiters[ord_id] = event
+        try:
+            if order is None:
+                delay = self.initial_delay
+                if self.push_source is not None and self.push_source.is_connected():
+                    delay = self.push_grace
+                while order is None:
+                    remaining = until - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    if event.wait(min(delay, remaining)):
+                        order = self._recent.get(ord_id)
+                        break
+                    order = self._poll(trade_api, inst_id, ord_id)
+                    delay = min(delay * 2, self.max_delay)
+        finally:
+            with self._lock:
+                self._waiters.pop(ord_id, None)
+
+        latency = time.monotonic() - started
+        if order is None:
+            self.timeouts += 1
+            logger.warning(f"[Fill] {inst_id}: ордер {ord_id} не подтверждён за {latency:.2f} сек")
+            return None
+
+        self.confirmed += 1
+        self._latency_total += latency
+        logger.info(f"[Fill] {inst_id}: ордер {ord_id} {order.get('state')} за {latency:.3f} сек")
+        return order
+
+    def stats(self) -> dict:
+        return {
+            "confirmed": self.confirmed,
+            "timeouts": self.timeouts,
+            "polls": self.polls,
+            "latency_avg": round(self._latency_total / self.confirmed, 3) if self.confirmed else 0.0,
+        }
+
+
+fill_waiter = FillWaiter(ORDER_FILL_DEADLINE)
@@ -0,0 +1,116 @@
+import json
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+from config import INSTRUMENTS_CACHE_FILE, INSTRUMENTS_CACHE_TTL
+import logging
+
+logger = logging.getLogger(__name__)
+
+INSTRUMENT_FIELDS = ("instId", "ctVal", "lotSz", "minSz", "tickSz", "state")
+
+
+class InstrumentRegistry:
+    def __init__(self, snapshot_path: str, ttl: int = 3600, miss_refresh_interval: int = 60):
+        """
+        Реестр SWAP-инструментов OKX по точному instId (ctVal, lotSz, minSz, tickSz)
+
+        :param snapshot_path: JSON-снимок для быстрого старта
+        :param ttl: период фонового обновления, сек
+        :param miss_refresh_interval: не чаще этого интервала обновлять реестр
+                                      из-за неизвестного instId (новый листинг)
+        """
+        self.snapshot_path = snapshot_path
+        self.ttl = ttl
+        self.miss_refresh_interval = miss_refresh_interval
+        self._instruments: Dict[str, dict] = {}
+        self._updated_at = 0.0
+        self._last_miss_refresh = 0.0
+        self._lock = threading.Lock()
+        self._refresh_thread = None
+        self._load_snapshot()
+
+    def _load_snapshot(self):
+        try:
+            with open(self.snapshot_path, encoding="utf-8") as f:
+                snapshot = json.load(f)
+            self._instruments = {inst["instId"]: inst for inst in snapshot.get("instruments", [])}
+            self._updated_at = float(snapshot.get("updated_at", 0))
+            logger.info(f"[Instruments] Загружен снимок: {len(self._instruments)} инструментов")
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"[Instruments] Не удалось прочитать снимок {self.snapshot_path}: {e}")
+
+    def _save_snapshot(self):
+        tmp_path = f"{self.snapshot_path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"updated_at": self._updated_at, "instruments": list(self._instruments.values())}, f)
+            os.replace(tmp_path, self.snapshot_path)
+        except Exception as e:
+            logger.warning(f"[Instruments] Не удалось сохранить снимок: {e}")
+
+    def is_stale(self) -> bool:
+        return time.time() - self._updated_at >= self.ttl
+
+    def refresh(self, account_api) -> bool:
+        """Загружает все SWAP-инструменты одним запросом"""
+        with self._lock:
+            try:
+                res = account_api.get_instruments(instType="SWAP")
+                if res.get("code") != "0":
+                    raise ValueError(res.get("msg"))
+
+                self._instruments = {
+                    inst["instId"]: {field: inst.get(field) for field in INSTRUMENT_FIELDS}
+                    for inst in res.get("data", [])
+                }
+                self._updated_at = time.time()
+                self._save_snapshot()
+                logger.info(f"[Instruments] Реестр обновлён: {len(self._instruments)} инструментов")
+                return True
+            except Exception as e:
+                logger.error(f"[Instruments] Ошибка обновления реестра инструментов: {e}")
+                return False
+
+    def get(self, inst_id: str, account_api=None) -> Optional[dict]:
+        """
+        Данные инструмента без сетевого запроса
+
+        Запрос к бирже выполняется, только если реестр пуст или instId
+        в нём нет (не чаще miss_refresh_interval).
+        """
+        instrument = self._instruments.get(inst_id)
+        if instrument is not None or account_api is None:
+            return instrument
+
+        now = time.time()
+        if self._instruments and now - self._last_miss_refresh < self.miss_refresh_interval:
+            return None
+        self._last_miss_refresh = now
+        self.refresh(account_api)
+        return self._instruments.get(inst_id)
+
+    def inst_ids(self) -> list:
+        return list(self._instruments)
+
+    def start_background_refresh(self, account_api):
+        """Обновляет реестр в фоне раз в ttl секунд"""
+        if self._refresh_thread is not None:
+            return
+
+        def loop():
+            while True:
+                if self.is_stale():
+                    self.refresh(account_api)
+                time.sleep(max(30.0, self.ttl - (time.time() - self._updated_at)))
+
+        self._refresh_thread = threading.Thread(target=loop, daemon=True)
+        self._refresh_thread.start()
+        logger.info(f"[Instruments] ✅ Фоновое обновление реестра каждые {self.ttl} сек.")
+
+
+instrument_registry = InstrumentRegistry(INSTRUMENTS_CACHE_FILE, INSTRUMENTS_CACHE_TTL)
@@ -0,0 +1,148 @@
+import asyncio
+import time
+from typing import Dict, Iterable, Optional
+
+import aiohttp
+from KlineStore import KlineStore
+from get_klines import BINANCE_KLINES_URL, BINANCE_KLINES_MAX_LIMIT, build_klines_params, merge_klines
+import logging
+
+logger = logging.getLogger(__name__)
+
+KLINES_REQUEST_WEIGHT = 2
+USED_WEIGHT_HEADER = "X-MBX-USED-WEIGHT-1M"
+
+
+class WeightLimiter:
+    def __init__(self, weight_per_minute: int, safety_ratio: float = 0.8):
+        """
+        Token bucket по весу запросов Binance
+
+        Токены пополняются равномерно, а после каждого ответа остаток
+        сверяется с X-MBX-USED-WEIGHT-1M, чтобы учитывать чужие запросы с того же IP.
+        """
+        self.capacity = weight_per_minute * safety_ratio
+        self.rate = self.capacity / 60
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, weight: int):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self._blocked_until:
+                    await asyncio.sleep(self._blocked_until - now)
+                    continue
+                if self.tokens >= weight:
+                    self.tokens -= weight
+                    return
+                await asyncio.sleep((weight - self.tokens) / self.rate)
+
+    def update_from_headers(self, headers):
+        used = headers.get(USED_WEIGHT_HEADER)
+        if used is None:
+            return
+        try:
+            self.tokens = min(self.tokens, self.capacity - int(used))
+        except ValueError:
+            pass
+
+    def block(self, seconds: float):
+        """Останавливает все запросы на seconds (после 429/418)"""
+        self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+        self.tokens = min(self.tokens, 0)
+
+
+class AsyncKlineFetcher:
+    def __init__(self, INTERVAL, K_PERIOD, store: Optional[KlineStore] = None,
+                 concurrency: int = 10, weight_per_minute: int = 6000, max_retries: int = 3):
+        """
+        Асинхронная загрузка свечей по всем символам через одну keep-alive сессию
+
+        :param concurrency: максимум одновременных запросов
+        :param weight_per_minute: лимит веса запросов Binance на минуту
+        """
+        self.interval = INTERVAL
+        self.k_period = K_PERIOD
+        self.store = store
+        self.concurrency = concurrency
+        self.weight_per_minute = weight_per_minute
+        self.max_retries = max_retries
+
+    async def _fetch_one(self, session: aiohttp.ClientSession, limiter: WeightLimiter,
+                         semaphore: asyncio.Semaphore, symbol: str, params: dict) -> Optional[list]:
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                async with semaphore:
+                    await limiter.acquire(KLINES_REQUEST_WEIGHT)
+                    async with session.get(BINANCE_KLINES_URL, params=params) as response:
+                        limiter.update_from_headers(response.headers)
+                        if response.status in (418, 429):
+                            retry_after = int(response.headers.get("Retry-After", 60))
+                            logger.warning(f"{symbol}: лимит Binance ({response.status}), пауза {retry_after} сек")
+                            limiter.block(retry_after)
+                            continue
+                        response.raise_for_status()
+                        data = await response.json()
+
+                if not data or isinstance(data, dict):
+                    return None
+                return data
+            except Exception as e:
+                logger.error(f"{symbol}: Ошибка API (попытка {attempt}) - {e}")
+                await asyncio.sleep(0.5 * attempt)
+        return None
+
+    async def fetch_raw(self, requests_by_symbol: Dict[str, dict]) -> Dict[str, Optional[list]]:
+        """Параллельно выполняет запросы свечей, возвращает ответы Binance по символам"""
+        limiter = WeightLimiter(self.weight_per_minute)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        connector = aiohttp.TCPConnector(limit=self.concurrency, ttl_dns_cache=300)
+        timeout = aiohttp.ClientTimeout(total=10)
+
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            results = await asyncio.gather(*(
+                self._fetch_one(session, limiter, semaphore, symbol, params)
+                for symbol, params in requests_by_symbol.items()
+            ))
+        return dict(zip(requests_by_symbol, results))
+
+    def fetch(self, symbols: Iterable[str], limit: Optional[int] = None) -> Dict[str, Optional[list]]:
+        """
+        Загружает окно K_PERIOD + 2 свечей (или limit) для всех символов
+
+        :param limit: длина окна, если нужна более длинная история (ресемплинг для K_GRID)
+        :return: symbol -> список свечей (последняя незакрытая) или None при ошибке
+        """
+        limit = min(limit or self.k_period + 2, BINANCE_KLINES_MAX_LIMIT)
+        started = time.perf_counter()
+
+        requests_by_symbol = {}
+        for symbol in symbols:
+            try:
+                requests_by_symbol[symbol] = build_klines_params(symbol, self.interval, limit, self.store)
+            except Exception as e:
+                logger.error(f"{symbol}: Ошибка чтения хранилища свечей - {e}")
+
+        raw = asyncio.run(self.fetch_raw(requests_by_symbol))
+
+        klines_by_symbol = {symbol: None for symbol in symbols}
+        for symbol, data in raw.items():
+            if data is None:
+                continue
+            try:
+                klines_by_symbol[symbol] = merge_klines(symbol, self.interval, data, limit, self.store,
+                                                        backfilled="startTime" not in requests_by_symbol[symbol])
+            except Exception as e:
+                logger.error(f"{symbol}: Ошибка сохранения свечей - {e}")
+
+        logger.info(f"[KlineFetcher] Загружено {sum(v is not None for v in klines_by_symbol.values())}"
+                    f"/{len(klines_by_symbol)} символов за {time.perf_counter() - started:.2f} сек")
+        return klines_by_symbol
@@ -0,0 +1,118 @@
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from migrations import migrate_db
+from storage import transaction
+
+import logging
+logger = logging.getLogger(__name__)
+
+INTERVAL_UNITS_MS = {
+    "s": 1000,
+    "m": 60 * 1000,
+    "h": 60 * 60 * 1000,
+    "d": 24 * 60 * 60 * 1000,
+    "w": 7 * 24 * 60 * 60 * 1000,
+    "M": 31 * 24 * 60 * 60 * 1000,
+}
+
+
+def interval_to_ms(interval: str) -> int:
+    """Длительность интервала Binance ("15m", "6h", "1d") в миллисекундах"""
+    return int(interval[:-1]) * INTERVAL_UNITS_MS[interval[-1]]
+
+
+LAST_CLOSE_QUERY = """
+    SELECT close_time FROM klines
+    WHERE symbol = ? AND interval = ?
+    ORDER BY open_time DESC
+    LIMIT 1
+"""
+LOAD_QUERY = """
+    SELECT open_time, open, high, low, close, volume, close_time FROM klines
+    WHERE symbol = ? AND interval = ?
+    ORDER BY open_time DESC
+    LIMIT ?
+"""
+
+
+class KlineStore:
+    COLUMNS = ("open_time", "open", "high", "low", "close", "volume", "close_time")
+
+    def __init__(self, db_path: str):
+        """
+        Локальное хранилище закрытых свечей по (symbol, interval)
+
+        :param db_path: путь к SQLite-файлу
+        """
+        self.db_path = db_path
+        self._depths: Optional[Dict[Tuple[str, str], int]] = None
+        self._lock = threading.Lock()
+        self._init_db()
+        logger.info(f"[KlineStore] Хранилище свечей: {db_path}")
+
+    def _init_db(self):
+        migrate_db(self.db_path, "klines")
+
+    def last_close_time(self, symbol: str, interval: str) -> Optional[int]:
+        """close_time последней сохранённой свечи (мс) или None"""
+        with transaction(self.db_path) as conn:
+            row = conn.execute(LAST_CLOSE_QUERY, (symbol, interval)).fetchone()
+        return row[0] if row else None
+
+    def save(self, symbol: str, interval: str, klines: list) -> int:
+        """
+        Сохраняет закрытые свечи из ответа Binance, незакрытые пропускает
+
+        :return: количество записанных свечей
+        """
+        now_ms = int(time.time() * 1000)
+        rows = [
+            (symbol, interval, int(k[0]), float(k[1]), float(k[2]), float(k[3]), float(k[4]), float(k[5]), int(k[6]))
+            for k in klines
+            if int(k[6]) < now_ms
+        ]
+        if not rows:
+            return 0
+
+        with transaction(self.db_path) as conn:
+            conn.executemany("""
+                INSERT OR REPLACE INTO klines
+                (symbol, interval, open_time, open, high, low, close, volume, close_time)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, rows)
+        return len(rows)
+
+    def backfill_depth(self, symbol: str, interval: str) -> int:
+        """На какую глубину (свечей) история уже загружалась целиком; 0 — не загружалась"""
+        depths = self._depths
+        if depths is None:
+            with self._lock:
+                if self._depths is None:
+                    with transaction(self.db_path) as conn:
+                        self._depths = {
+                            (row[0], row[1]): row[2]
+                            for row in conn.execute("SELECT symbol, interval, depth FROM kline_backfill")
+                        }
+                depths = self._depths
+        return depths.get((symbol, interval), 0)
+
+    def set_backfill_depth(self, symbol: str, interval: str, depth: int):
+        """Отмечает полную загрузку окна depth (даже если у биржи свечей меньше — новый листинг)"""
+        self.backfill_depth(symbol, interval)
+        with self._lock:
+            if self._depths.get((symbol, interval), 0) >= depth:
+                return
+            with transaction(self.db_path) as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO kline_backfill (symbol, interval, depth) VALUES (?, ?, ?)",
+                    (symbol, interval, depth)
+                )
+            self._depths = {**self._depths, (symbol, interval): depth}
+
+    def load(self, symbol: str, interval: str, limit: int) -> List[tuple]:
+        """Последние limit закрытых свечей в порядке возрастания времени"""
+        with transaction(self.db_path) as conn:
+            rows = conn.execute(LOAD_QUERY, (symbol, interval, limit)).fetchall()
+        rows.reverse()
+        return rows
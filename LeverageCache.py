@@ -0,0 +1,86 @@
+import threading
+from decimal import Decimal
+from typing import Dict, Iterable, Tuple
+
+from InstrumentRegistry import instrument_registry
+import logging
+
+logger = logging.getLogger(__name__)
+
+# get_leverage принимает до 20 instId через запятую
+LEVERAGE_BATCH = 20
+
+
+class LeverageCache:
+    def __init__(self):
+        """
+        Текущее плечо по (instId, posSide, mgnMode)
+
+        Загружается пачками через get_leverage при старте; set_leverage
+        вызывается перед ордером, только если нужное плечо отличается
+        от известного.
+        """
+        self._levers: Dict[Tuple[str, str, str], str] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.updates = 0
+
+    @staticmethod
+    def _normalize(lever) -> str:
+        """Плечо строкой без потери дробной части ("2.50" и 2.5 -> "2.5")"""
+        return format(Decimal(str(lever)).normalize(), "f")
+
+    def load(self, account_api, inst_ids: Iterable[str], mgn_mode: str = "isolated") -> int:
+        """Загружает плечо для инструментов пачками по LEVERAGE_BATCH"""
+        inst_ids = list(inst_ids)
+        loaded = 0
+        for i in range(0, len(inst_ids), LEVERAGE_BATCH):
+            chunk = inst_ids[i:i + LEVERAGE_BATCH]
+            try:
+                res = account_api.get_leverage(instId=",".join(chunk), mgnMode=mgn_mode)
+                if res.get("code") != "0":
+                    raise ValueError(res.get("msg"))
+                with self._lock:
+                    for item in res.get("data", []):
+                        key = (item["instId"], item.get("posSide", "net"), item.get("mgnMode", mgn_mode))
+                        self._levers[key] = self._normalize(item["lever"])
+                        loaded += 1
+            except Exception as e:
+                logger.warning(f"[Leverage] Ошибка загрузки плеча для {chunk[0]}…: {e}")
+        logger.info(f"[Leverage] Загружено плечо для {loaded} позиций-сторон")
+        return loaded
+
+    def load_all(self, account_api, mgn_mode: str = "isolated") -> int:
+        """Загружает плечо для всех USDT-SWAP из реестра инструментов"""
+        if not instrument_registry.inst_ids():
+            instrument_registry.refresh(account_api)
+        inst_ids = [inst_id for inst_id in instrument_registry.inst_ids() if inst_id.endswith("-USDT-SWAP")]
+        return self.load(account_api, inst_ids, mgn_mode)
+
+    def ensure(self, account_api, inst_id: str, lever, pos_side: str, mgn_mode: str = "isolated") -> bool:
+        """
+        Устанавливает плечо, только если оно отличается от известного
+
+        :return: True, если был вызван set_leverage
+        :raises ValueError: биржа отклонила установку плеча
+        """
+        key = (inst_id, pos_side, mgn_mode)
+        lever = self._normalize(lever)
+        if self._levers.get(key) == lever:
+            self.hits += 1
+            return False
+
+        res = account_api.set_leverage(instId=inst_id, lever=lever, mgnMode=mgn_mode, posSide=pos_side)
+        if res.get("code") != "0":
+            raise ValueError(f"Ошибка установки плеча: {res.get('msg')}")
+        with self._lock:
+            self._levers[key] = lever
+            self.updates += 1
+        logger.info(f"[Leverage] {inst_id} {pos_side}: плечо {lever}x установлено")
+        return True
+
+    def stats(self) -> dict:
+        return {"known": len(self._levers), "hits": self.hits, "updates": self.updates}
+
+
+leverage_cache = LeverageCache()
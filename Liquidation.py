@@ -2,14 +2,24 @@ import time
 from datetime import datetime, timedelta
 import traceback
 from decimal import Decimal
-import sqlite3
 from typing import Optional, Callable, Dict, Any
-from config import UPDATE_LIQUID
+from config import UPDATE_LIQUID, POSITIONS_DB
+from storage import transaction
 import logging
 import threading
+from PositionBook import position_book
+from EventDedup import EventDedup
+from TimerScheduler import timer_scheduler
 
 logger = logging.getLogger(__name__)
 
+CLOSE_LIQUIDATED_QUERY = """
+    UPDATE short_positions
+    SET closed=1, exit_price=?, pnl_usdt=?, pnl_percent=?,
+        exit_time=?, reason='liquidation', amount=?, fee=?
+    WHERE pos_id=? AND closed=0
+"""
+
 
 class LiquidationChecker:
     def __init__(
@@ -17,7 +27,10 @@ class LiquidationChecker:
             account_api,
             on_position_closed: Optional[Callable] = None,
             sheet_logger: Optional[Any] = None,
-            timer_storage: Optional[Any] = None
+            timer_storage: Optional[Any] = None,
+            push_source: Optional[Any] = None,
+            connected_interval: int = 300,
+            push_recheck_limit: float = 120
     ):
         """
         Инициализация проверщика ликвидаций
@@ -26,13 +39,26 @@ class LiquidationChecker:
         :param on_position_closed: callback при закрытии позиции
         :param sheet_logger: логгер в Google Sheets
         :param timer_storage: хранилище таймеров
+        :param push_source: приватный WebSocket (is_connected()); пока он на связи,
+                            фоновый опрос REST идёт раз в connected_interval сек
+        :param push_recheck_limit: сколько секунд после push-события перепроверять историю,
+                                   пока в ней не появится ликвидация этого instId
         """
         self.account_api = account_api
         self.on_position_closed = on_position_closed
         self.sheet_logger = sheet_logger
         self.timer_storage = timer_storage
-        self._seen_liquidations = set()  # хранит уникальные ID ликвидаций (instId:ts)
+        self.push_source = push_source
+        self.connected_interval = connected_interval
+        self.push_recheck_limit = push_recheck_limit
+        # ID ликвидаций (instId:ts) в processed_events, последние — в памяти
+        self.dedup = EventDedup(POSITIONS_DB)
         self._last_check_time = datetime.utcnow()
+        # instId -> (время события, мс; крайний срок перепроверок, monotonic)
+        self._awaiting: Dict[str, tuple] = {}
+        # instId -> uTime последней ликвидации, увиденной в истории
+        self._seen: Dict[str, int] = {}
+        self._lock = threading.Lock()
 
     def check(self, force: bool = False) -> bool:
         """
@@ -53,13 +79,50 @@ class LiquidationChecker:
             traceback.print_exc()
             return False
 
+    def on_liquidation_event(self, inst_id: str):
+        """
+        Push-событие ликвидации из приватного WebSocket
+
+        История позиций на бирже появляется с задержкой, поэтому проверка
+        повторяется с паузой 1 → 30 сек, пока в истории не появится ликвидация
+        этого instId, но не дольше push_recheck_limit. События одной серии
+        (orders и balance_and_position по одной ликвидации) объединяются.
+        """
+        with self._lock:
+            if inst_id in self._awaiting:
+                return
+            # Запас на расхождение часов с биржей
+            event_ms = int(time.time() * 1000) - 60_000
+            self._awaiting[inst_id] = (event_ms, time.monotonic() + self.push_recheck_limit)
+        logger.info(f"[LIQUIDATION] Событие по {inst_id}, проверяем историю позиций")
+        timer_scheduler.schedule(0, self._recheck, inst_id, 1.0)
+
+    def _recheck(self, inst_id: str, delay: float):
+        self.check(force=True)
+        with self._lock:
+            event_ms, deadline = self._awaiting.get(inst_id, (0, 0))
+            if self._seen.get(inst_id, 0) >= event_ms:
+                self._awaiting.pop(inst_id, None)
+                return
+            if time.monotonic() + delay > deadline:
+                self._awaiting.pop(inst_id, None)
+                logger.warning(f"[LIQUIDATION] Ликвидация {inst_id} не появилась в истории за "
+                               f"{self.push_recheck_limit:.0f} сек, остаётся фоновый опрос")
+                return
+        timer_scheduler.schedule(delay, self._recheck, inst_id, min(delay * 2, 30.0))
+
     def start_background_checking(self, interval: int = 30):
         def loop():
+            last_poll = float("-inf")
             while True:
-                try:
-                    self.check(force=True)
-                except Exception as e:
-                    logger.error(f"[LIQUIDATION BACKGROUND] Ошибка: {e}")
+                # При живом WebSocket ликвидации приходят push-событиями, REST — страховка реже
+                connected = self.push_source is not None and self.push_source.is_connected()
+                if not connected or time.monotonic() - last_poll >= self.connected_interval:
+                    last_poll = time.monotonic()
+                    try:
+                        self.check(force=True)
+                    except Exception as e:
+                        logger.error(f"[LIQUIDATION BACKGROUND] Ошибка: {e}")
                 time.sleep(interval)
 
         thread = threading.Thread(target=loop, daemon=True)
@@ -80,6 +143,12 @@ class LiquidationChecker:
             return False
 
         liquidations = res.get("data", [])
+        with self._lock:
+            for pos in liquidations:
+                inst_id = pos.get("instId")
+                ts = int(pos.get("uTime") or pos.get("cTime") or 0)
+                if inst_id and ts > self._seen.get(inst_id, 0):
+                    self._seen[inst_id] = ts
         if not liquidations:
             return True  # Ликвидаций нет, но проверка выполнена
 
@@ -104,10 +173,8 @@ class LiquidationChecker:
             logger.warning(f"[WARN] Некорректные данные ликвидации: {pos_data}")
             return False
 
-        if unique_id in self._seen_liquidations:
+        if self.dedup.is_processed(unique_id):
             return False  # уже обработано
-
-        self._seen_liquidations.add(unique_id)
         logger.info(f"[LIQUIDATION] Обнаружена ликвидация: {inst_id}")
 
         # Основная обработка
@@ -120,25 +187,20 @@ class LiquidationChecker:
             amount = Decimal(str(pos_data.get("pos", "0")))
             fee = Decimal(str(pos_data.get("fee", "0")))
 
-            # Обновляем базу данных
-            with sqlite3.connect("data/positions.db") as conn:
-                # Проверяем, есть ли такая позиция в БД
-                cursor = conn.execute("""
-                    SELECT 1 FROM short_positions 
-                    WHERE pos_id=? AND closed=0 LIMIT 1
-                """, (pos_id,))
-
-                if not cursor.fetchone():
-                    logger.warning(f"[WARN] Ликвидация {pos_id} не найдена в БД")
-                    return False
-
+            # Проверяем, есть ли такая открытая позиция
+            symbol = position_book.find_by_pos_id(pos_id)
+            if symbol is None:
+                # Не наша позиция или уже закрыта: в БД не отмечаем, в памяти — до перезапуска
+                logger.warning(f"[WARN] Ликвидация {pos_id} не найдена в БД")
+                self.dedup.remember(unique_id)
+                return False
+
+            # Обновляем базу данных; отметка об обработке — в той же транзакции
+            with transaction(POSITIONS_DB) as conn:
+                if not self.dedup.claim(conn, unique_id):
+                    return False  # параллельная проверка уже обработала
                 # Обновляем позицию
-                conn.execute("""
-                    UPDATE short_positions
-                    SET closed=1, exit_price=?, pnl_usdt=?, pnl_percent=?,
-                        exit_time=?, reason='liquidation', amount=?, fee=?
-                    WHERE pos_id=? AND closed=0
-                """, (
+                conn.execute(CLOSE_LIQUIDATED_QUERY, (
                     float(exit_price),
                     float(pnl_usdt),
                     float(pnl_percent),
@@ -147,6 +209,8 @@ class LiquidationChecker:
                     float(fee),
                     pos_id
                 ))
+            self.dedup.remember(unique_id)
+            position_book.remove(symbol)
 
             # Уведомление в Telegram
             if self.on_position_closed:
@@ -0,0 +1,113 @@
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from typing import List
+
+import logging
+logger = logging.getLogger(__name__)
+
+# place_multiple_orders OKX принимает до 20 ордеров за запрос
+MAX_BATCH_ORDERS = 20
+
+
+class OrderBatcher:
+    def __init__(self, trade_api, window: float = 0.05, max_batch: int = MAX_BATCH_ORDERS):
+        """
+        Объединение ордеров в place_multiple_orders
+
+        place_order() из разных потоков копятся до window секунд (или до
+        max_batch штук) и уходят одним запросом; каждый вызывающий получает
+        ответ в формате обычного place_order по своему ордеру.
+        place_batch() отправляет заранее собранный список пачками.
+        Остальные методы проксируются в trade_api.
+
+        :param window: сколько ждать попутные ордера, сек
+        """
+        self.trade_api = trade_api
+        self.window = window
+        self.max_batch = max_batch
+        self._pending = []
+        self._cond = threading.Condition()
+        self._thread = None
+
+        self.orders = 0
+        self.requests = 0
+
+    def __getattr__(self, name):
+        return getattr(self.trade_api, name)
+
+    @staticmethod
+    def _with_client_id(order: dict) -> dict:
+        order = dict(order)
+        order.setdefault("clOrdId", uuid.uuid4().hex)
+        return order
+
+    def _send(self, orders: List[dict]) -> List[dict]:
+        """Один запрос; результат по каждому ордеру в формате ответа place_order"""
+        self.requests += 1
+        self.orders += len(orders)
+        if len(orders) == 1:
+            return [self.trade_api.place_order(**orders[0])]
+
+        res = self.trade_api.place_multiple_orders(orders)
+        items = {item.get("clOrdId"): item for item in res.get("data", []) or []}
+        results = []
+        for order in orders:
+            item = items.get(order["clOrdId"])
+            if item is None:
+                # Запрос отклонён целиком (лимит, авторизация) — ошибка на каждый ордер
+                results.append({"code": res.get("code", "-1"), "msg": res.get("msg", ""), "data": []})
+            else:
+                code = item.get("sCode", "0")
+                results.append({"code": code, "msg": item.get("sMsg", ""), "data": [item]})
+        return results
+
+    def place_batch(self, orders: List[dict]) -> List[dict]:
+        """Отправляет ордера пачками по max_batch; результаты — в порядке orders"""
+        orders = [self._with_client_id(order) for order in orders]
+        results = []
+        for i in range(0, len(orders), self.max_batch):
+            chunk = orders[i:i + self.max_batch]
+            try:
+                results.extend(self._send(chunk))
+            except Exception as e:
+                logger.error(f"[Batch] Ошибка пакетного ордера ({len(chunk)} шт.): {e}")
+                results.extend({"code": "-1", "msg": str(e), "data": []} for _ in chunk)
+        return results
+
+    def place_order(self, **order) -> dict:
+        """Как trade_api.place_order, но попутные ордера уходят одним запросом"""
+        future = Future()
+        with self._cond:
+            self._pending.append((self._with_client_id(order), future))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="order-batcher", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return future.result()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                deadline = time.monotonic() + self.window
+                while len(self._pending) < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = self._pending[:self.max_batch]
+                self._pending = self._pending[self.max_batch:]
+
+            try:
+                results = self._send([order for order, _ in batch])
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+
+    def stats(self) -> dict:
+        return {"orders": self.orders, "requests": self.requests}
@@ -0,0 +1,230 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from decimal import Decimal
+from typing import Callable, Dict, Optional
+
+import logging
+logger = logging.getLogger(__name__)
+
+# Лимиты REST OKX на аккаунт: метод SDK -> (запросов, за секунд)
+OKX_RATE_LIMITS = {
+    "place_order": (60, 2),
+    "place_multiple_orders": (300, 2),
+    "get_order": (60, 2),
+    "set_leverage": (20, 2),
+    "get_leverage": (20, 2),
+    "get_account_balance": (10, 2),
+    "get_positions": (10, 2),
+    "get_positions_history": (10, 2),
+    "get_instruments": (20, 2),
+    "get_ticker": (20, 2),
+    "get_tickers": (20, 2),
+}
+
+
+class RateLimiter:
+    def __init__(self, calls: int, period: float):
+        """Скользящее окно: не более calls вызовов за period секунд"""
+        self.calls = calls
+        self.period = period
+        self._times = deque()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                while self._times and now - self._times[0] >= self.period:
+                    self._times.popleft()
+                if len(self._times) < self.calls:
+                    self._times.append(now)
+                    return
+                wait = self.period - (now - self._times[0])
+            time.sleep(wait)
+
+
+class RateLimitedAPI:
+    """Обёртка над клиентом OKX SDK: методы из лимитов ждут свободного слота"""
+
+    def __init__(self, api, limits: Optional[Dict[str, tuple]] = None):
+        self._api = api
+        self._limiters = {name: RateLimiter(*limit) for name, limit in (limits or OKX_RATE_LIMITS).items()}
+
+    def __getattr__(self, name):
+        attr = getattr(self._api, name)
+        limiter = self._limiters.get(name)
+        if limiter is None or not callable(attr):
+            return attr
+
+        def limited(*args, **kwargs):
+            limiter.acquire()
+            return attr(*args, **kwargs)
+        return limited
+
+
+class BalanceLedger:
+    def __init__(self, account_api, ccy: str = "USDT", max_age: float = 30):
+        """
+        Общий учёт свободной маржи для параллельных ордеров
+
+        Баланс запрашивается не чаще раза в max_age секунд; каждый ордер
+        резервирует маржу до отправки и подтверждает (commit) или освобождает
+        (release) её после. Так параллельные ордера не превышают баланс.
+        """
+        self.account_api = account_api
+        self.ccy = ccy
+        self.max_age = max_age
+        self._balance = Decimal("0")
+        self._pending = Decimal("0")
+        self._spent = Decimal("0")
+        self._updated_at = float("-inf")
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        res = self.account_api.get_account_balance(ccy=self.ccy)
+        if res.get("code") != "0":
+            raise ValueError(f"Ошибка получения баланса: {res.get('msg')}")
+        self._balance = Decimal(res["data"][0]["details"][0]["availBal"])
+        # Подтверждённые ордера уже учтены биржей в новом availBal
+        self._spent = Decimal("0")
+        self._updated_at = time.monotonic()
+
+    def available(self) -> Decimal:
+        with self._lock:
+            if time.monotonic() - self._updated_at >= self.max_age:
+                self._refresh()
+            return self._balance - self._spent - self._pending
+
+    def reserve(self, amount: Decimal) -> bool:
+        """Резервирует маржу; False, если свободных средств недостаточно"""
+        with self._lock:
+            if time.monotonic() - self._updated_at >= self.max_age:
+                self._refresh()
+            free = self._balance - self._spent - self._pending
+            if free < amount:
+                logger.error(f"[Ledger] 💸 Недостаточно средств: нужно {amount}, доступно {free}")
+                return False
+            self._pending += amount
+            return True
+
+    def commit(self, amount: Decimal):
+        """Ордер отправлен — маржа занята до следующего обновления баланса"""
+        with self._lock:
+            self._pending -= amount
+            self._spent += amount
+
+    def release(self, amount: Decimal):
+        """Ордер не отправлен — резерв возвращается"""
+        with self._lock:
+            self._pending -= amount
+
+
+class OrderPipeline:
+    def __init__(self, handler: Callable[[str, str, BalanceLedger], bool], ledger: BalanceLedger,
+                 workers: int = 8, timezone=None):
+        """
+        Параллельное исполнение торговых сигналов
+
+        Разные символы исполняются одновременно (лимиты запросов — в
+        RateLimitedAPI), повторный сигнал по символу, который ещё исполняется,
+        отбрасывается. Для каждого ордера считается задержка от сигнала и от
+        закрытия свечи до исполнения: handler возвращается после подтверждения
+        исполнения ордера (fill_waiter).
+
+        :param handler: handler(symbol, signal, ledger) -> bool, открывает позицию
+        :param ledger: общий учёт маржи
+        :param workers: число параллельных ордеров
+        :param timezone: часовой пояс для временных меток сигналов без зоны
+        """
+        self.handler = handler
+        self.ledger = ledger
+        self.timezone = timezone
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="order")
+        self._in_flight = set()
+        self._futures = []
+        self._lock = threading.Lock()
+
+        self.succeeded = 0
+        self.failed = 0
+        self.latency_max = 0.0
+        self._latency_total = 0.0
+
+    def submit(self, symbol: str, signal: str, signal_ts: Optional[str] = None) -> Optional[Future]:
+        """
+        Ставит сигнал в исполнение
+
+        :param signal_ts: ISO-время закрытия свечи сигнала, для задержки от свечи
+        """
+        with self._lock:
+            if symbol in self._in_flight:
+                logger.warning(f"[Orders] {symbol}: ордер уже исполняется, сигнал {signal} пропущен")
+                return None
+            self._in_flight.add(symbol)
+            future = self._executor.submit(self._run, symbol, signal, signal_ts, time.monotonic())
+            self._futures.append(future)
+            return future
+
+    def _run(self, symbol: str, signal: str, signal_ts: Optional[str], submitted_at: float) -> bool:
+        success = False
+        try:
+            success = bool(self.handler(symbol, signal, self.ledger))
+        except Exception as e:
+            logger.error(f"[Orders] {symbol}: ❌ Ошибка исполнения {signal}: {e}")
+        finally:
+            latency = time.monotonic() - submitted_at
+            with self._lock:
+                self._in_flight.discard(symbol)
+                if success:
+                    self.succeeded += 1
+                    self.latency_max = max(self.latency_max, latency)
+                    self._latency_total += latency
+                else:
+                    self.failed += 1
+
+        if success:
+            candle_lag = self._candle_lag(signal_ts)
+            logger.info(
+                f"[Orders] {symbol} {signal}: позиция открыта через {latency:.2f} сек после сигнала"
+                + (f", {candle_lag:.1f} сек после закрытия свечи" if candle_lag is not None else "")
+            )
+        return success
+
+    def _candle_lag(self, signal_ts: Optional[str]) -> Optional[float]:
+        if not signal_ts:
+            return None
+        try:
+            ts = datetime.fromisoformat(signal_ts)
+            if ts.tzinfo is None and self.timezone is not None:
+                ts = self.timezone.localize(ts)
+            return (datetime.now(ts.tzinfo) - ts).total_seconds()
+        except Exception:
+            return None
+
+    def drain(self, timeout: Optional[float] = None) -> dict:
+        """Ждёт исполнения всех поставленных сигналов и возвращает метрики"""
+        with self._lock:
+            futures, self._futures = self._futures, []
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for future in futures:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                future.result(timeout=remaining)
+            except Exception:
+                pass
+        return self.stats()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "in_flight": len(self._in_flight),
+                "succeeded": self.succeeded,
+                "failed": self.failed,
+                "latency_max": round(self.latency_max, 3),
+                "latency_avg": round(self._latency_total / self.succeeded, 3) if self.succeeded else 0.0,
+            }
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
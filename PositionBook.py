@@ -0,0 +1,117 @@
+import threading
+from typing import Dict, Optional
+
+from config import POSITIONS_DB
+from migrations import migrate_db
+from storage import transaction
+import logging
+
+logger = logging.getLogger(__name__)
+
+LOAD_OPEN_QUERY = """
+    SELECT symbol, 'long', entry_price, order_id, NULL, amount, entry_time
+    FROM long_positions WHERE closed = 0
+    UNION ALL
+    SELECT symbol, 'short', entry_price, order_id, pos_id, amount, entry_time
+    FROM short_positions WHERE closed = 0
+"""
+
+
+class PositionBook:
+    def __init__(self, db_path: str):
+        """
+        Открытые позиции в памяти: symbol -> {type, entry_price, order_id, pos_id, amount, entry_time}
+
+        Источник истины для чтения на горячем пути. Заполняется из БД при первом обращении,
+        дальше обновляется сквозной записью при открытии и закрытии позиций.
+        Запись копирует словарь целиком, поэтому чтение идёт без блокировок.
+        """
+        self.db_path = db_path
+        self._positions: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    def load(self):
+        """Перечитывает открытые позиции из БД"""
+        migrate_db(self.db_path, "positions")
+        positions = {}
+        with transaction(self.db_path) as conn:
+            for row in conn.execute(LOAD_OPEN_QUERY):
+                positions[row[0]] = self._entry(*row[1:])
+
+        with self._lock:
+            self._positions = positions
+            self._loaded = True
+        logger.info(f"[PositionBook] Загружено открытых позиций: {len(positions)}")
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self.load()
+
+    @staticmethod
+    def _entry(pos_type, entry_price, order_id, pos_id=None, amount=None, entry_time=None) -> dict:
+        return {
+            "type": pos_type,
+            "entry_price": entry_price,
+            "order_id": order_id,
+            "pos_id": pos_id,
+            "amount": amount,
+            "entry_time": entry_time,
+        }
+
+    def add(self, symbol: str, pos_type: str, entry_price, order_id, pos_id=None, amount=None, entry_time=None):
+        self._ensure_loaded()
+        with self._lock:
+            positions = dict(self._positions)
+            positions[symbol] = self._entry(pos_type.lower(), entry_price, order_id, pos_id, amount, entry_time)
+            self._positions = positions
+
+    def update(self, symbol: str, **fields):
+        self._ensure_loaded()
+        with self._lock:
+            if symbol not in self._positions:
+                return
+            positions = dict(self._positions)
+            positions[symbol] = {**positions[symbol], **fields}
+            self._positions = positions
+
+    def remove(self, symbol: str) -> Optional[dict]:
+        self._ensure_loaded()
+        with self._lock:
+            if symbol not in self._positions:
+                return None
+            positions = dict(self._positions)
+            removed = positions.pop(symbol)
+            self._positions = positions
+        return removed
+
+    def get(self, symbol: str) -> Optional[dict]:
+        self._ensure_loaded()
+        return self._positions.get(symbol)
+
+    def has(self, symbol: str) -> bool:
+        self._ensure_loaded()
+        return symbol in self._positions
+
+    def get_type(self, symbol: str) -> Optional[str]:
+        position = self.get(symbol)
+        return position["type"] if position else None
+
+    def find_by_pos_id(self, pos_id: str) -> Optional[str]:
+        """symbol открытой позиции с данным posId"""
+        self._ensure_loaded()
+        for symbol, position in self._positions.items():
+            if position["pos_id"] == pos_id:
+                return symbol
+        return None
+
+    def snapshot(self, pos_type: Optional[str] = None) -> Dict[str, dict]:
+        """Неизменяемый на время чтения снимок открытых позиций"""
+        self._ensure_loaded()
+        positions = self._positions
+        if pos_type is None:
+            return positions
+        return {symbol: p for symbol, p in positions.items() if p["type"] == pos_type}
+
+
+position_book = PositionBook(POSITIONS_DB)
@@ -0,0 +1,131 @@
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from config import POSITIONS_REFRESH_SECONDS
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class PositionSnapshot:
+    def __init__(self, refresh_seconds: float = 5, miss_refresh_seconds: float = 1):
+        """
+        Снимок открытых SWAP-позиций OKX по ключу (instId, posSide)
+
+        Все позиции загружаются одним get_positions(instType="SWAP") не чаще
+        раза в refresh_seconds, либо приходят из приватного канала positions.
+        Поиск по символу идёт в памяти.
+
+        :param refresh_seconds: через сколько секунд снимок считается устаревшим
+        :param miss_refresh_seconds: при отсутствии позиции в снимке старше этого
+                                     возраста он обновляется принудительно (новая позиция)
+        """
+        self.refresh_seconds = refresh_seconds
+        self.miss_refresh_seconds = miss_refresh_seconds
+        self._positions: Dict[Tuple[str, str], dict] = {}
+        self._updated_at = float("-inf")
+        self._lock = threading.Lock()
+        self.refreshes = 0
+        self.hits = 0
+
+    @staticmethod
+    def _is_open(position: dict) -> bool:
+        try:
+            return float(position.get("pos") or 0) != 0
+        except (TypeError, ValueError):
+            return False
+
+    def age(self) -> float:
+        return time.monotonic() - self._updated_at
+
+    def refresh(self, account_api, max_age: float = 0) -> None:
+        """
+        Перезагружает все позиции одним запросом
+
+        Если за время ожидания блокировки другой поток уже обновил снимок
+        (моложе max_age), повторный запрос не выполняется.
+        """
+        with self._lock:
+            if max_age and self.age() < max_age:
+                return
+            res = account_api.get_positions(instType="SWAP")
+            if res.get("code") != "0":
+                raise RuntimeError(f"Ошибка получения позиций: {res.get('msg', 'Unknown error')}")
+
+            self._positions = {
+                (pos["instId"], pos.get("posSide", "net")): pos
+                for pos in res.get("data", [])
+                if self._is_open(pos)
+            }
+            self._updated_at = time.monotonic()
+            self.refreshes += 1
+            logger.debug(f"[Positions] Снимок обновлён: {len(self._positions)} позиций")
+
+    def apply_update(self, positions: List[dict]) -> None:
+        """Применяет push-обновление канала positions (pos=0 — позиция закрыта)"""
+        with self._lock:
+            updated = dict(self._positions)
+            for pos in positions:
+                key = (pos["instId"], pos.get("posSide", "net"))
+                if self._is_open(pos):
+                    updated[key] = pos
+                else:
+                    updated.pop(key, None)
+            self._positions = updated
+            self._updated_at = time.monotonic()
+
+    def replace_all(self, positions: List[dict]) -> None:
+        """Полный снимок из канала positions (первое сообщение после подписки)"""
+        with self._lock:
+            self._positions = {
+                (pos["instId"], pos.get("posSide", "net")): pos
+                for pos in positions
+                if self._is_open(pos)
+            }
+            self._updated_at = time.monotonic()
+
+    def _find(self, inst_id: str, pos_side: Optional[str]) -> Optional[dict]:
+        positions = self._positions
+        if pos_side is not None:
+            return positions.get((inst_id, pos_side))
+        for side in ("long", "short", "net"):
+            position = positions.get((inst_id, side))
+            if position is not None:
+                return position
+        return None
+
+    def get(self, inst_id: str, pos_side: Optional[str] = None, account_api=None,
+            force: bool = False) -> Optional[dict]:
+        """
+        Открытая позиция по instId (и posSide, если указан)
+
+        С account_api устаревший снимок обновляется перед поиском, а при
+        промахе — ещё раз, если снимок старше miss_refresh_seconds.
+        Ошибка API пробрасывается как RuntimeError.
+        """
+        if account_api is not None:
+            if force:
+                self.refresh(account_api)
+            elif self.age() >= self.refresh_seconds:
+                self.refresh(account_api, max_age=self.refresh_seconds)
+
+        position = self._find(inst_id, pos_side)
+        if position is None and account_api is not None and not force \
+                and self.age() >= self.miss_refresh_seconds:
+            self.refresh(account_api, max_age=self.miss_refresh_seconds)
+            position = self._find(inst_id, pos_side)
+
+        if position is not None:
+            self.hits += 1
+        return position
+
+    def all(self) -> List[dict]:
+        return list(self._positions.values())
+
+    def stats(self) -> dict:
+        return {"positions": len(self._positions), "refreshes": self.refreshes,
+                "hits": self.hits, "age": round(self.age(), 1)}
+
+
+position_snapshot = PositionSnapshot(POSITIONS_REFRESH_SECONDS)
@@ -0,0 +1,114 @@
+import threading
+import time
+from decimal import Decimal
+from typing import Dict, Iterable, Optional, Tuple
+
+from config import PRICE_MAX_AGE
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class PriceCache:
+    def __init__(self, max_age: float = 5, min_refresh_interval: float = 1):
+        """
+        Кеш последних цен SWAP-инструментов OKX с отметкой времени
+
+        Наполняется потоком тикеров (update_many) и пакетным
+        get_tickers(instType="SWAP"). Цена старше max_age считается устаревшей
+        и при чтении с market_api обновляется одним запросом сразу для всех
+        инструментов.
+
+        :param max_age: предельный возраст цены, сек
+        :param min_refresh_interval: не чаще этого интервала делать пакетный запрос
+        """
+        self.max_age = max_age
+        self.min_refresh_interval = min_refresh_interval
+        self._prices: Dict[str, Tuple[Decimal, float]] = {}
+        self._refreshed_at = float("-inf")
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+
+    def update(self, inst_id: str, price) -> None:
+        self._prices[inst_id] = (Decimal(str(price)), time.monotonic())
+
+    def update_many(self, tickers: Iterable[dict]) -> None:
+        """Обновление из тикеров OKX (WebSocket tickers или ответ get_tickers)"""
+        now = time.monotonic()
+        for ticker in tickers:
+            inst_id = ticker.get("instId")
+            last = ticker.get("last")
+            if inst_id and last:
+                self._prices[inst_id] = (Decimal(last), now)
+
+    def _fresh(self, inst_id: str, max_age: float) -> Optional[Decimal]:
+        entry = self._prices.get(inst_id)
+        if entry is not None and time.monotonic() - entry[1] <= max_age:
+            return entry[0]
+        return None
+
+    def refresh(self, market_api) -> bool:
+        """Пакетное обновление всех SWAP-цен одним запросом"""
+        with self._lock:
+            # Параллельный поток уже обновил кеш, пока мы ждали блокировку
+            if time.monotonic() - self._refreshed_at < self.min_refresh_interval:
+                return True
+            try:
+                res = market_api.get_tickers(instType="SWAP")
+                if res.get("code") != "0":
+                    raise ValueError(res.get("msg"))
+                self.update_many(res.get("data", []))
+                self._refreshed_at = time.monotonic()
+                self.refreshes += 1
+                return True
+            except Exception as e:
+                logger.error(f"[PriceCache] Ошибка пакетного обновления цен: {e}")
+                return False
+
+    def get(self, inst_id: str, market_api=None, max_age: Optional[float] = None) -> Optional[Decimal]:
+        """
+        Свежая цена инструмента или None
+
+        :param market_api: при отсутствии свежей цены — пакетное обновление,
+                           для инструмента вне пакета — одиночный get_ticker
+        :param max_age: допустимый возраст цены вместо self.max_age
+        """
+        max_age = self.max_age if max_age is None else max_age
+        price = self._fresh(inst_id, max_age)
+        if price is not None:
+            self.hits += 1
+            return price
+
+        self.misses += 1
+        if market_api is None:
+            return None
+
+        if self.refresh(market_api):
+            price = self._fresh(inst_id, max_age)
+            if price is not None:
+                return price
+
+        try:
+            data = market_api.get_ticker(inst_id)
+            if data.get("code") == "0" and data.get("data"):
+                self.update_many(data["data"])
+                return self._fresh(inst_id, max_age)
+        except Exception as e:
+            logger.error(f"[PriceCache] Ошибка при получении цены для {inst_id}: {e}")
+        return None
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "symbols": len(self._prices),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "refreshes": self.refreshes,
+        }
+
+
+price_cache = PriceCache(PRICE_MAX_AGE)
@@ -0,0 +1,293 @@
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from config import POSITIONS_DB
+from storage import transaction
+from PositionBook import position_book
+from PositionSnapshot import position_snapshot
+import logging
+
+logger = logging.getLogger(__name__)
+
+# get_positions_history отдаёт до 100 записей за запрос
+HISTORY_PAGE_LIMIT = 100
+
+# type записи истории позиций OKX -> reason в БД
+CLOSE_REASONS = {"3": "liquidation", "4": "liquidation", "5": "adl"}
+
+# {table} — long_positions или short_positions, {assignments} — "amount=?, pos_id=?"
+CLOSE_RECONCILED_QUERY = """
+    UPDATE {table}
+    SET closed=1, exit_price=?, pnl_usdt=?, pnl_percent=?, exit_time=?, reason=?, fee=?
+    WHERE symbol=? AND closed=0
+"""
+UPDATE_RECONCILED_QUERY = "UPDATE {table} SET {assignments} WHERE symbol=? AND closed=0"
+
+
+def fetch_positions_history(account_api, since_ms: int, max_pages: int,
+                            inst_id: Optional[str] = None) -> Tuple[List[dict], int]:
+    """
+    Закрытые позиции SWAP новее since_ms, от новых к старым, постранично
+
+    :param inst_id: только один инструмент (иначе — все)
+    :return: (записи истории, число запросов)
+    """
+    records = []
+    after = None
+    requests = 0
+    for _ in range(max_pages):
+        params = {"instType": "SWAP", "limit": str(HISTORY_PAGE_LIMIT)}
+        if inst_id:
+            params["instId"] = inst_id
+        if after:
+            params["after"] = after
+        res = account_api.get_positions_history(**params)
+        requests += 1
+        if res.get("code") != "0":
+            raise RuntimeError(f"Ошибка получения истории позиций: {res.get('msg', 'Unknown error')}")
+        page = res.get("data", [])
+        records.extend(page)
+        if len(page) < HISTORY_PAGE_LIMIT:
+            break
+        after = page[-1].get("uTime")
+        if not after or int(after) < since_ms:
+            break
+    return records, requests
+
+
+class PositionReconciler:
+    def __init__(
+            self,
+            account_api,
+            db_path: str = POSITIONS_DB,
+            on_position_closed: Optional[Callable] = None,
+            sheet_logger: Optional[Any] = None,
+            timer_storage: Optional[Any] = None,
+            history_pages: int = 5,
+            history_window: timedelta = timedelta(days=7),
+            closing: Optional[Callable[[], frozenset]] = None
+    ):
+        """
+        Периодическая сверка открытых позиций с биржей
+
+        За проход: один get_positions (снимок позиций) и, если есть
+        расхождения, несколько страниц get_positions_history. Позиции, которых
+        больше нет на бирже, закрываются по данным истории; у открытых
+        обновляются объём и posId. Все исправления пишутся одной транзакцией.
+
+        Чтобы не перехватить закрытие, которое ещё исполняется, позиция
+        закрывается, только если её нет на бирже два прохода подряд
+        (reconcile(confirm=False) — сразу, при запуске). Позиции, которые
+        сейчас закрывает бот (closing), пропускаются: их запишет в БД он сам.
+
+        :param history_pages: максимум страниц истории за проход
+        :param history_window: насколько глубоко искать закрытие, если время входа неизвестно
+        :param closing: символы, закрытие которых уже идёт (PositionMonitor.closing)
+        """
+        self.account_api = account_api
+        self.db_path = db_path
+        self.on_position_closed = on_position_closed
+        self.sheet_logger = sheet_logger
+        self.timer_storage = timer_storage
+        self.history_pages = history_pages
+        self.history_window = history_window
+        self.closing = closing
+        self._suspects = set()
+        self._lock = threading.Lock()
+
+        self.passes = 0
+        self.closed = 0
+        self.updated = 0
+        self.orphans = 0
+        self.requests = 0
+        self.last_duration = 0.0
+
+    @staticmethod
+    def _entry_ms(position: dict) -> Optional[int]:
+        """Время входа из PositionBook (ISO, локальное время) в мс"""
+        try:
+            return int(datetime.fromisoformat(str(position["entry_time"])).timestamp() * 1000)
+        except (TypeError, ValueError):
+            return None
+
+    def _fetch_history(self, since_ms: int) -> List[dict]:
+        records, requests = fetch_positions_history(self.account_api, since_ms, self.history_pages)
+        self.requests += requests
+        return records
+
+    @staticmethod
+    def _find_close(history: List[dict], symbol: str, position: dict, entry_ms: Optional[int]) -> Optional[dict]:
+        """Последняя запись истории по instId и стороне, закрытая после входа"""
+        for record in history:
+            if record.get("instId") != symbol or record.get("posSide") not in (position["type"], "net"):
+                continue
+            if entry_ms is not None and int(record.get("uTime") or 0) < entry_ms:
+                continue
+            return record
+        return None
+
+    def reconcile(self, confirm: bool = True) -> dict:
+        """
+        Один проход сверки
+
+        :param confirm: закрывать позицию только со второго прохода, где её нет на бирже
+        :return: метрики прохода (closed, updated, orphans, duration)
+        """
+        with self._lock:
+            started = time.monotonic()
+            position_snapshot.refresh(self.account_api)
+            self.requests += 1
+            on_exchange = {(pos["instId"], pos.get("posSide", "net")): pos for pos in position_snapshot.all()}
+            book = position_book.snapshot()
+            closing = self.closing() if self.closing else frozenset()
+
+            missing, updates = [], []
+            for symbol, position in book.items():
+                if symbol in closing:
+                    continue
+                pos = on_exchange.get((symbol, position["type"])) or on_exchange.get((symbol, "net"))
+                if pos is None:
+                    missing.append(symbol)
+                    continue
+                fields = {}
+                size = abs(float(pos.get("pos") or 0))
+                if position["amount"] is not None and abs(float(position["amount"]) - size) > 1e-9:
+                    fields["amount"] = size
+                if position["type"] == "short" and pos.get("posId") and position["pos_id"] != pos["posId"]:
+                    fields["pos_id"] = pos["posId"]
+                if fields:
+                    updates.append((symbol, position["type"], fields))
+
+            booked = {(symbol, position["type"]) for symbol, position in book.items()}
+            orphans = [key for key in on_exchange if key not in booked and (key[0], "long") not in booked
+                       and (key[0], "short") not in booked]
+
+            # Закрываем только подтверждённые расхождения
+            to_close = [symbol for symbol in missing if not confirm or symbol in self._suspects]
+            self._suspects = set(missing) - set(to_close)
+
+            closes = []
+            if to_close:
+                entry_times = {symbol: self._entry_ms(book[symbol]) for symbol in to_close}
+                known = [ms for ms in entry_times.values() if ms is not None]
+                since_ms = min(known) if len(known) == len(entry_times) else \
+                    int((datetime.now() - self.history_window).timestamp() * 1000)
+                history = self._fetch_history(since_ms)
+                for symbol in to_close:
+                    record = self._find_close(history, symbol, book[symbol], entry_times[symbol])
+                    closes.append((symbol, book[symbol], record))
+
+            closes = self._apply(closes, updates)
+            self.passes += 1
+            self.orphans = len(orphans)
+            self.last_duration = time.monotonic() - started
+
+        if closes or updates or orphans or self._suspects:
+            logger.info(
+                f"[Reconcile] Закрыто: {len(closes)}, обновлено: {len(updates)}, "
+                f"ждут подтверждения: {len(self._suspects)}, нет в БД: {len(orphans)} "
+                f"({self.last_duration:.2f} сек)"
+            )
+        for inst_id, pos_side in orphans:
+            logger.warning(f"[Reconcile] ⚠️ Позиция {inst_id} ({pos_side}) открыта на бирже, но не найдена в БД")
+
+        for symbol, position, record in closes:
+            self._notify_closed(symbol, position, record)
+
+        return {"closed": len(closes), "updated": len(updates), "orphans": len(orphans),
+                "duration": round(self.last_duration, 3)}
+
+    @staticmethod
+    def _close_values(position: dict, record: Optional[dict]) -> Tuple[float, float, float, float, str]:
+        """(exit_price, pnl_usdt, pnl_percent, fee, reason) из записи истории"""
+        if record is None:
+            return 0.0, 0.0, 0.0, 0.0, "reconciled"
+        exit_price = Decimal(str(record.get("closeAvgPx") or "0"))
+        pnl_usdt = Decimal(str(record.get("realizedPnl") or record.get("pnl") or "0"))
+        pnl_percent = Decimal(str(record.get("pnlRatio") or "0")) * 100
+        fee = Decimal(str(record.get("fee") or "0"))
+        reason = CLOSE_REASONS.get(str(record.get("type")), "reconciled")
+        return float(exit_price), float(pnl_usdt), float(pnl_percent), float(fee), reason
+
+    def _apply(self, closes: List[tuple], updates: List[tuple]) -> List[tuple]:
+        """
+        Все исправления одной транзакцией, затем — PositionBook
+
+        :return: закрытия, записанные этим проходом (без уже закрытых в БД ботом или ликвидацией)
+        """
+        if not closes and not updates:
+            return []
+        exit_time = datetime.now().isoformat()
+        applied = []
+        with transaction(self.db_path) as conn:
+            for symbol, position, record in closes:
+                exit_price, pnl_usdt, pnl_percent, fee, reason = self._close_values(position, record)
+                table = "long_positions" if position["type"] == "long" else "short_positions"
+                if conn.execute(CLOSE_RECONCILED_QUERY.format(table=table),
+                                (exit_price, pnl_usdt, pnl_percent, exit_time, reason, fee, symbol)).rowcount == 1:
+                    applied.append((symbol, position, record))
+            for symbol, pos_type, fields in updates:
+                table = "long_positions" if pos_type == "long" else "short_positions"
+                assignments = ", ".join(f"{column}=?" for column in fields)
+                conn.execute(UPDATE_RECONCILED_QUERY.format(table=table, assignments=assignments),
+                             (*fields.values(), symbol))
+
+        for symbol, _, _ in closes:
+            position_book.remove(symbol)
+        for symbol, _, fields in updates:
+            position_book.update(symbol, **fields)
+        self.closed += len(applied)
+        self.updated += len(updates)
+        return applied
+
+    def _notify_closed(self, symbol: str, position: dict, record: Optional[dict]):
+        exit_price, pnl_usdt, pnl_percent, fee, reason = self._close_values(position, record)
+        entry_price = float(position["entry_price"] or 0)
+        logger.info(f"[Reconcile] {symbol}: позиция закрыта на бирже ({reason}), запись в БД закрыта")
+        try:
+            if self.timer_storage and self.timer_storage.has_position(symbol):
+                self.timer_storage.close_position(symbol)
+
+            if self.on_position_closed:
+                self.on_position_closed(symbol, entry_price, exit_price, pnl_percent, pnl_usdt, reason, fee)
+
+            if self.sheet_logger and record is not None:
+                self.sheet_logger.log_closed_position({
+                    "symbol": symbol,
+                    "pos_type": position["type"],
+                    "entry_price": entry_price,
+                    "close_price": exit_price,
+                    "pnl_usd": pnl_usdt,
+                    "pnl_percent": pnl_percent,
+                    "fee": fee,
+                    "timestamp": datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S"),
+                    "reason": reason
+                })
+        except Exception as e:
+            logger.error(f"[Reconcile] Ошибка уведомления о закрытии {symbol}: {e}")
+
+    def start_background(self, interval: int = 300):
+        """Первый проход — сразу и без подтверждения (восстановление после перезапуска)"""
+        def loop():
+            confirm = False
+            while True:
+                try:
+                    self.reconcile(confirm=confirm)
+                    confirm = True
+                except Exception as e:
+                    logger.error(f"[Reconcile] Ошибка сверки позиций: {e}")
+                    traceback.print_exc()
+                time.sleep(interval)
+
+        thread = threading.Thread(target=loop, name="reconciler", daemon=True)
+        thread.start()
+        logger.info(f"[Reconcile] ✅ Сверка позиций с биржей каждые {interval} сек.")
+
+    def stats(self) -> dict:
+        return {"passes": self.passes, "closed": self.closed, "updated": self.updated,
+                "orphans": self.orphans, "requests": self.requests,
+                "last_duration": round(self.last_duration, 3)}
@@ -0,0 +1,82 @@
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class StartupSequence:
+    def __init__(self, started_at: Optional[float] = None):
+        """
+        Поэтапный запуск бота с замером времени
+
+        Шаги регистрируются через add() и выполняются параллельно; шаг с
+        after=(...) ждёт завершения указанных шагов. report() выводит время
+        каждого шага и общее время от started_at (по умолчанию — от создания).
+
+        :param started_at: time.monotonic() начала отсчёта, например до импортов
+        """
+        self.started_at = time.monotonic() if started_at is None else started_at
+        self._steps: List[Tuple[str, Callable[[], Any], Tuple[str, ...]]] = []
+        # name -> (начало от started_at, длительность, успех)
+        self.timings: Dict[str, Tuple[float, float, bool]] = {}
+        self.ready_at: Optional[float] = None
+
+    def add(self, name: str, func: Callable[[], Any], after: Tuple[str, ...] = ()):
+        """Регистрирует шаг; зависимости должны быть добавлены раньше"""
+        known = {step[0] for step in self._steps}
+        missing = [dep for dep in after if dep not in known]
+        if missing:
+            raise ValueError(f"Шаг {name}: неизвестные зависимости {missing}")
+        self._steps.append((name, func, tuple(after)))
+
+    def _run_step(self, name: str, func: Callable[[], Any], deps: List[Future]) -> Any:
+        for dep in deps:
+            dep.result()  # упавшая зависимость прерывает шаг
+        started = time.monotonic()
+        ok = False
+        try:
+            result = func()
+            ok = True
+            return result
+        finally:
+            self.timings[name] = (started - self.started_at, time.monotonic() - started, ok)
+
+    def run(self) -> Dict[str, Any]:
+        """
+        Выполняет зарегистрированные шаги и очищает список
+
+        :return: name -> результат шага (None, если шаг или его зависимость упали)
+        """
+        steps, self._steps = self._steps, []
+        if not steps:
+            return {}
+        futures: Dict[str, Future] = {}
+        with ThreadPoolExecutor(max_workers=len(steps), thread_name_prefix="startup") as executor:
+            for name, func, after in steps:
+                futures[name] = executor.submit(self._run_step, name, func, [futures[dep] for dep in after])
+
+        results = {}
+        for name, future in futures.items():
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                logger.error(f"[Startup] ❌ Шаг {name} не выполнен: {e}")
+                results[name] = None
+        return results
+
+    def mark_ready(self):
+        """Отмечает готовность к торговле"""
+        self.ready_at = time.monotonic()
+
+    def report(self) -> str:
+        """Время шагов и общее время холодного старта"""
+        lines = ["[Startup] ⏱ Время запуска:"]
+        for name, (offset, duration, ok) in sorted(self.timings.items(), key=lambda item: item[1][0]):
+            lines.append(f"  {'✅' if ok else '❌'} {name:<14} старт +{offset:6.2f} сек, {duration:6.2f} сек")
+        ready_at = self.ready_at if self.ready_at is not None else time.monotonic()
+        lines.append(f"  Готов к торговле через {ready_at - self.started_at:.2f} сек")
+        text = "\n".join(lines)
+        logger.info(text)
+        return text
@@ -0,0 +1,98 @@
+import json
+import os
+import threading
+import time
+from typing import Iterable
+
+import requests
+import logging
+
+logger = logging.getLogger(__name__)
+
+BINANCE_EXCHANGE_INFO_URL = "https://api.binance.com/api/v3/exchangeInfo"
+
+
+class BinanceSymbolCache:
+    def __init__(self, snapshot_path: str, ttl: int = 3600, quote_asset: str = "USDT"):
+        """
+        Кеш торговых пар Binance (SPOT)
+
+        :param snapshot_path: путь к JSON-снимку для быстрого рестарта
+        :param ttl: через сколько секунд список пар считается устаревшим
+        :param quote_asset: котируемая валюта пар
+        """
+        self.snapshot_path = snapshot_path
+        self.ttl = ttl
+        self.quote_asset = quote_asset
+        self._symbols = frozenset()
+        self._updated_at = 0.0
+        self._lock = threading.Lock()
+        self._load_snapshot()
+
+    def _load_snapshot(self):
+        """Загружает сохранённый снимок списка пар, если он есть"""
+        try:
+            with open(self.snapshot_path, encoding="utf-8") as f:
+                snapshot = json.load(f)
+            self._symbols = frozenset(snapshot.get("symbols", []))
+            self._updated_at = float(snapshot.get("updated_at", 0))
+            logger.info(f"[SymbolCache] Загружен снимок: {len(self._symbols)} пар")
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"[SymbolCache] Не удалось прочитать снимок {self.snapshot_path}: {e}")
+
+    def _save_snapshot(self):
+        """Атомарно сохраняет текущий список пар на диск"""
+        tmp_path = f"{self.snapshot_path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"updated_at": self._updated_at, "symbols": sorted(self._symbols)}, f)
+            os.replace(tmp_path, self.snapshot_path)
+        except Exception as e:
+            logger.warning(f"[SymbolCache] Не удалось сохранить снимок: {e}")
+
+    def is_stale(self) -> bool:
+        return time.time() - self._updated_at >= self.ttl
+
+    def refresh(self, force: bool = False) -> bool:
+        """
+        Загружает exchangeInfo одним запросом, если кеш устарел
+
+        :return: True если в кеше есть актуальные или хотя бы сохранённые данные
+        """
+        with self._lock:
+            if not force and not self.is_stale():
+                return True
+
+            try:
+                response = requests.get(BINANCE_EXCHANGE_INFO_URL, timeout=10)
+                if response.status_code != 200:
+                    raise ValueError(f"код ответа {response.status_code}")
+
+                symbols = response.json().get("symbols", [])
+                self._symbols = frozenset(
+                    item["symbol"] for item in symbols
+                    if item.get("status") == "TRADING" and item.get("quoteAsset") == self.quote_asset
+                )
+                self._updated_at = time.time()
+                self._save_snapshot()
+                logger.info(f"[SymbolCache] Обновлён список пар Binance: {len(self._symbols)} активных")
+                return True
+            except Exception as e:
+                if self._symbols:
+                    logger.warning(f"[SymbolCache] Ошибка обновления exchangeInfo, используем сохранённый список: {e}")
+                    return True
+                logger.error(f"[SymbolCache] Ошибка запроса к Binance: {e}")
+                return False
+
+    def is_valid(self, symbol: str) -> bool:
+        """Проверяет, торгуется ли пара SYMBOL/USDT (без сетевого запроса)"""
+        return f"{symbol.upper()}{self.quote_asset}" in self._symbols
+
+    def filter_valid(self, symbols: Iterable[str]) -> tuple:
+        """Разделяет символы на валидные и невалидные"""
+        valid, invalid = [], []
+        for symbol in symbols:
+            (valid if self.is_valid(symbol) else invalid).append(symbol)
+        return valid, invalid
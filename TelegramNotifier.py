@@ -0,0 +1,222 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+import requests
+
+from config import TELEGRAM_TOKEN, TELEGRAM_CHAT_ID, TELEGRAM_SPOOL_FILE
+import logging
+
+logger = logging.getLogger(__name__)
+
+TELEGRAM_MAX_LENGTH = 4096
+MESSAGE_SEPARATOR = "\n\n"
+
+
+class TelegramNotifier:
+    def __init__(self, token: Optional[str], chat_id: Optional[str], spool_path: str,
+                 max_queue: int = 1000, chat_interval: float = 1.0, timeout: float = 10):
+        """
+        Фоновая отправка сообщений в Telegram
+
+        send() только ставит сообщение в очередь; отправляет один поток
+        через keep-alive сессию. Подряд идущие сообщения в один чат
+        склеиваются в одно (до 4096 символов), между отправками в чат
+        выдерживается chat_interval, на 429 — retry_after. Неотправленные
+        сообщения хранятся в spool-файле (JSON lines) и досылаются после
+        перезапуска: send() дописывает в него одну строку, целиком файл
+        перезаписывает только поток отправки.
+
+        :param max_queue: предел очереди, сверх него старые сообщения отбрасываются
+        :param chat_interval: минимальный интервал между сообщениями в один чат, сек
+        """
+        self.url = f"https://api.telegram.org/bot{token}/sendMessage"
+        self.enabled = bool(token and chat_id)
+        self.chat_id = chat_id
+        self.spool_path = spool_path
+        self.max_queue = max_queue
+        self.chat_interval = chat_interval
+        self.timeout = timeout
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._next_allowed: Dict[str, float] = {}
+        self._session = requests.Session()
+        self._thread = None
+        self._sending = False
+
+        self.sent = 0
+        self.merged = 0
+        self.dropped = 0
+        self.failed = 0
+        self._load_spool()
+
+    def _load_spool(self):
+        messages = []
+        try:
+            with open(self.spool_path, encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        try:
+                            messages.append(json.loads(line))
+                        except ValueError:
+                            logger.warning(f"[Telegram] Повреждённая строка spool пропущена: {line[:80]}")
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"[Telegram] Не удалось прочитать spool {self.spool_path}: {e}")
+        self._queue.extend(messages[-self.max_queue:])
+        if messages:
+            logger.info(f"[Telegram] Из spool восстановлено {len(messages)} неотправленных сообщений")
+
+    def _append_spool(self, message: dict):
+        """Дописывает одно сообщение в spool; вызывается под self._cond"""
+        try:
+            with open(self.spool_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(message, ensure_ascii=False) + "\n")
+        except Exception as e:
+            logger.warning(f"[Telegram] Не удалось дописать spool: {e}")
+
+    def _rewrite_spool(self):
+        """Перезаписывает spool очередью (поток отправки); вызывается под self._cond"""
+        tmp_path = f"{self.spool_path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for message in self._queue:
+                    f.write(json.dumps(message, ensure_ascii=False) + "\n")
+            os.replace(tmp_path, self.spool_path)
+        except Exception as e:
+            logger.warning(f"[Telegram] Не удалось сохранить spool: {e}")
+
+    def start(self):
+        with self._cond:
+            if self._thread is not None or not self.enabled:
+                return
+            self._thread = threading.Thread(target=self._run, name="telegram", daemon=True)
+            self._thread.start()
+
+    def send(self, text: str, parse_mode: str = "Markdown", chat_id: Optional[str] = None):
+        """Ставит сообщение в очередь и сразу возвращает управление"""
+        if not self.enabled:
+            logger.error("❌ Не указан TELEGRAM_TOKEN или TELEGRAM_CHAT_ID")
+            return
+
+        if len(text) > TELEGRAM_MAX_LENGTH:
+            logger.warning("⚠️ Сообщение слишком длинное и было обрезано до 4096 символов")
+            text = text[:TELEGRAM_MAX_LENGTH]
+
+        with self._cond:
+            if len(self._queue) >= self.max_queue:
+                self._queue.popleft()
+                self.dropped += 1
+                logger.warning(f"[Telegram] Очередь переполнена, отброшено сообщений: {self.dropped}")
+            message = {"chat_id": chat_id or self.chat_id, "text": text, "parse_mode": parse_mode}
+            self._queue.append(message)
+            self._append_spool(message)
+            self._cond.notify()
+        self.start()
+
+    def _take_batch(self) -> List[dict]:
+        """Первое сообщение очереди и следующие за ним в тот же чат, пока влезают в 4096"""
+        first = self._queue.popleft()
+        batch = [first]
+        length = len(first["text"])
+        while self._queue:
+            candidate = self._queue[0]
+            if (candidate["chat_id"] != first["chat_id"] or candidate["parse_mode"] != first["parse_mode"]
+                    or length + len(MESSAGE_SEPARATOR) + len(candidate["text"]) > TELEGRAM_MAX_LENGTH):
+                break
+            batch.append(self._queue.popleft())
+            length += len(MESSAGE_SEPARATOR) + len(candidate["text"])
+        return batch
+
+    def _run(self):
+        backoff = 1.0
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._sending = False
+                    self._cond.notify_all()
+                    self._cond.wait()
+                self._sending = True
+                chat_id = self._queue[0]["chat_id"]
+                wait = self._next_allowed.get(chat_id, 0) - time.monotonic()
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+                batch = self._take_batch()
+
+            # Пачка остаётся в spool, пока не отправлена: файл перезаписывается только после ответа
+            status, retry_after = self._post(batch)
+
+            with self._cond:
+                self._next_allowed[chat_id] = time.monotonic() + self.chat_interval
+                if status == "ok":
+                    backoff = 1.0
+                    self.sent += 1
+                    self.merged += len(batch) - 1
+                elif status == "retry":
+                    # Пачка возвращается в начало очереди и остаётся в spool
+                    self._queue.extendleft(reversed(batch))
+                    delay = retry_after if retry_after is not None else backoff
+                    backoff = min(backoff * 2, 60)
+                    self._next_allowed[chat_id] = time.monotonic() + delay
+                else:
+                    self.failed += len(batch)
+                self._rewrite_spool()
+
+    def _post(self, batch: List[dict]):
+        """:return: ("ok" | "retry" | "drop", retry_after)"""
+        first = batch[0]
+        payload = {
+            "chat_id": first["chat_id"],
+            "text": MESSAGE_SEPARATOR.join(message["text"] for message in batch),
+            "parse_mode": first["parse_mode"],
+            "disable_web_page_preview": True,
+        }
+        try:
+            response = self._session.post(self.url, json=payload, timeout=self.timeout)
+            if response.status_code == 200:
+                logger.info(f" Сообщение успешно отправлено ({len(batch)} шт.)")
+                return "ok", None
+            if response.status_code == 429:
+                retry_after = response.json().get("parameters", {}).get("retry_after", 10)
+                logger.warning(f"⏳ Превышен лимит. Повтор через {retry_after} сек")
+                return "retry", retry_after
+            if response.status_code == 400 and payload.get("parse_mode"):
+                # Склейка могла сломать разметку — отправляем как обычный текст
+                payload.pop("parse_mode")
+                response = self._session.post(self.url, json=payload, timeout=self.timeout)
+                if response.status_code == 200:
+                    logger.info(" Сообщение отправлено без разметки")
+                    return "ok", None
+            if response.status_code >= 500:
+                logger.warning(f"⏳ Telegram недоступен ({response.status_code}), повторим позже")
+                return "retry", None
+            logger.error(f"❌ Ошибка при отправке сообщения: {response.status_code} {response.text}")
+            return "drop", None
+        except Exception as e:
+            logger.warning(f"❌ Исключение при отправке в Telegram: {e}, повторим позже")
+            return "retry", None
+
+    def flush(self, timeout: float = 10) -> bool:
+        """Ждёт отправки очереди (при остановке бота); недосланное остаётся в spool"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._queue or self._sending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self._thread is None:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {"queued": len(self._queue), "sent": self.sent, "merged": self.merged,
+                    "dropped": self.dropped, "failed": self.failed}
+
+
+telegram_notifier = TelegramNotifier(TELEGRAM_TOKEN, TELEGRAM_CHAT_ID, TELEGRAM_SPOOL_FILE)
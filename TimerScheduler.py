@@ -0,0 +1,160 @@
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class TimerHandle:
+    """Ссылка на запланированный вызов, аналог threading.Timer.cancel()"""
+    __slots__ = ("when", "callback", "args", "cancelled", "_scheduler")
+
+    def __init__(self, when: float, callback: Callable, args: tuple, scheduler: "TimerScheduler"):
+        self.when = when
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+        self._scheduler = scheduler
+
+    def cancel(self):
+        self._scheduler._cancel(self)
+
+    def remaining(self) -> float:
+        return max(0.0, self.when - time.monotonic())
+
+
+class TimerScheduler:
+    def __init__(self, workers: int = 4, lag_warning: float = 1.0):
+        """
+        Планировщик таймеров на одном потоке с кучей по времени срабатывания
+
+        Вставка O(log n), отмена O(1) (запись помечается и выбрасывается при
+        извлечении). Колбэки выполняются в небольшом пуле, поэтому долгое
+        закрытие позиции не задерживает остальные таймеры.
+
+        :param workers: размер пула для выполнения колбэков
+        :param lag_warning: порог задержки срабатывания для предупреждения в лог, сек
+        """
+        self.workers = workers
+        self.lag_warning = lag_warning
+        self._heap = []
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._cancelled = 0
+        self._thread = None
+        self._executor = None
+        self._running = False
+
+        self._stats_lock = threading.Lock()
+        self.fired = 0
+        self.lag_last = 0.0
+        self.lag_max = 0.0
+        self._lag_total = 0.0
+
+    def start(self):
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="timer-cb")
+            self._thread = threading.Thread(target=self._run, name="timer-scheduler", daemon=True)
+            self._thread.start()
+        logger.info(f"[Scheduler] ✅ Планировщик таймеров запущен ({self.workers} потоков для колбэков)")
+
+    def schedule(self, delay: float, callback: Callable, *args) -> TimerHandle:
+        """Планирует callback(*args) через delay секунд"""
+        if not self._running:
+            self.start()
+
+        handle = TimerHandle(time.monotonic() + max(0.0, delay), callback, args, self)
+        with self._cond:
+            heapq.heappush(self._heap, (handle.when, next(self._counter), handle))
+            # Будим поток, только если новый таймер стал ближайшим
+            if self._heap[0][2] is handle:
+                self._cond.notify()
+        return handle
+
+    def _cancel(self, handle: TimerHandle):
+        with self._cond:
+            if handle.cancelled:
+                return
+            handle.cancelled = True
+            self._cancelled += 1
+            # Отменённых записей больше половины — перестраиваем кучу,
+            # чтобы память не росла при частых отменах
+            if self._cancelled > 64 and self._cancelled * 2 > len(self._heap):
+                self._heap = [entry for entry in self._heap if not entry[2].cancelled]
+                heapq.heapify(self._heap)
+                self._cancelled = 0
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._running:
+                    while self._heap and self._heap[0][2].cancelled:
+                        heapq.heappop(self._heap)
+                        self._cancelled -= 1
+                    if not self._heap:
+                        self._cond.wait()
+                        continue
+                    timeout = self._heap[0][0] - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    self._cond.wait(timeout)
+                if not self._running:
+                    return
+                _, _, handle = heapq.heappop(self._heap)
+                # Помечаем как отработавший, чтобы поздний cancel() не искажал счётчик
+                handle.cancelled = True
+
+            try:
+                self._executor.submit(self._fire, handle)
+            except RuntimeError:
+                return
+
+    def _fire(self, handle: TimerHandle):
+        lag = time.monotonic() - handle.when
+        with self._stats_lock:
+            self.fired += 1
+            self.lag_last = lag
+            self.lag_max = max(self.lag_max, lag)
+            self._lag_total += lag
+        if lag > self.lag_warning:
+            logger.warning(f"[Scheduler] Таймер сработал с задержкой {lag:.2f} сек")
+        try:
+            handle.callback(*handle.args)
+        except Exception as e:
+            logger.error(f"[Scheduler] Ошибка в колбэке таймера: {e}")
+
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._heap) - self._cancelled
+
+    def stats(self) -> dict:
+        """Метрики: ожидающие таймеры и задержка срабатывания (сек)"""
+        return {
+            "pending": self.pending(),
+            "fired": self.fired,
+            "lag_last": round(self.lag_last, 4),
+            "lag_max": round(self.lag_max, 4),
+            "lag_avg": round(self._lag_total / self.fired, 4) if self.fired else 0.0,
+        }
+
+    def stop(self, wait: bool = False):
+        """Останавливает планировщик; незапущенные таймеры отбрасываются"""
+        with self._cond:
+            if not self._running:
+                return
+            self._running = False
+            self._heap.clear()
+            self._cancelled = 0
+            self._cond.notify()
+        self._executor.shutdown(wait=wait)
+        logger.info("[Scheduler] Планировщик таймеров остановлен")
+
+
+timer_scheduler = TimerScheduler()
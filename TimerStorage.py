@@ -1,29 +1,27 @@
 import time
 from datetime import datetime
-from threading import Lock
 from DatabaseManger import DatabaseManager
-import os
+from migrations import migrate_db
+from config import TIMERS_DB
 
 import logging
 logger = logging.getLogger(__name__)
 
+HAS_TIMER_QUERY = "SELECT 1 FROM active_timers WHERE symbol = ?"
+UPDATE_ELAPSED_QUERY = "UPDATE active_timers SET elapsed_time = ? WHERE symbol = ?"
+DELETE_TIMER_QUERY = "DELETE FROM active_timers WHERE symbol = ?"
+
 
 class TimerStorage:
-    def __init__(self, db_path=os.path.abspath("data/timers.db")):
-        self.db = DatabaseManager(db_path)
-        self.lock = Lock()
+    def __init__(self, db_path=TIMERS_DB):
+        self.db_path = db_path
         self._init_db()
+        self.db = DatabaseManager(db_path)
         logger.info(f"TimerStorage инициализирован с базой {db_path}")
 
     def _init_db(self):
         """Инициализация таблицы для хранения активных таймеров"""
-        self.db.execute("""
-        CREATE TABLE IF NOT EXISTS active_timers (
-            symbol TEXT PRIMARY KEY,
-            entry_time REAL NOT NULL,
-            elapsed_time REAL DEFAULT 0
-        )
-        """)
+        migrate_db(self.db_path, "timers")
         logger.info("[TimerStorage] Таблица active_timers создана")
 
     def safe_add_position(self, symbol: str, entry_time: float = None, elapsed_time: float = 0) -> bool:
@@ -34,50 +32,34 @@ class TimerStorage:
         if entry_time is None:
             entry_time = time.time()
 
-        with self.lock:
-            exists = self.db.execute(
-                "SELECT 1 FROM active_timers WHERE symbol = ?",
-                (symbol,)
-            )
-            if exists and len(exists) > 0:
-                print(f"[Storage] {symbol} - уже существует, пропускаем")
-                return False
-
-            self.db.execute(
-                "INSERT INTO active_timers (symbol, entry_time, elapsed_time) VALUES (?, ?, ?)",
-                (symbol, entry_time, elapsed_time)
-            )
-            logger.info(f"[Storage] {symbol} - добавлена в хранилище")
-            return True
+        inserted = self.db.execute(
+            "INSERT OR IGNORE INTO active_timers (symbol, entry_time, elapsed_time) VALUES (?, ?, ?)",
+            (symbol, entry_time, elapsed_time)
+        )
+        if not inserted:
+            print(f"[Storage] {symbol} - уже существует, пропускаем")
+            return False
+
+        logger.info(f"[Storage] {symbol} - добавлена в хранилище")
+        return True
 
     def update_elapsed_time(self, symbol: str, elapsed: float):
         """Обновляет время, прошедшее для позиции"""
-        self.db.execute("""
-        UPDATE active_timers 
-        SET elapsed_time = ?
-        WHERE symbol = ?
-        """, (elapsed, symbol))
+        self.db.execute(UPDATE_ELAPSED_QUERY, (elapsed, symbol))
 
     def close_position(self, symbol: str):
         """Удаляет позицию из таблицы активных таймеров"""
-        self.db.execute("""
-        DELETE FROM active_timers 
-        WHERE symbol = ?
-        """, (symbol,))
+        self.db.execute(DELETE_TIMER_QUERY, (symbol,))
         logger.info(f"[TimerStorage] Позиция {symbol} удалена из активных таймеров")
 
     def has_position(self, symbol: str) -> bool:
         """Проверяет, есть ли позиция в хранилище"""
-        with self.lock:
-            res = self.db.execute(
-                "SELECT 1 FROM active_timers WHERE symbol = ?",
-                (symbol,)
-            )
-        return bool(res and len(res) > 0)
+        res = self.db.read(HAS_TIMER_QUERY, (symbol,))
+        return bool(res)
 
     def get_active_positions(self) -> dict:
         """Возвращает все активные позиции с их временем входа и прошедшим временем"""
-        results = self.db.execute("""
+        results = self.db.read("""
         SELECT symbol, entry_time, elapsed_time 
         FROM active_timers
         """)
@@ -1,11 +1,50 @@
-import sqlite3
-from datetime import datetime
+from datetime import datetime, timedelta
+from config import K_OVERSOLD, K_OVERBOUGHT, K_GRID
+from storage import transaction
 import logging
 
 logger = logging.getLogger(__name__)
 
-def analyze_pairs(DB_NAME, TIMEZONE, determine_signal, send_signal_message):
-    with sqlite3.connect(DB_NAME) as conn:
+# Последние два значения %K по каждому символу и варианту K_GRID и предварительная классификация
+# пересечений. Окончательное решение остаётся за determine_signal. INDEXED BY ограничивает чтение
+# окном lookback_days, иначе планировщик обходит весь индекс (symbol, timestamp).
+# Записи до появления вариантов (interval IS NULL) относятся к основному варианту.
+LAST_PAIRS_QUERY = """
+    SELECT symbol, ts_prev, k_prev, ts_curr, k_curr,
+           CASE
+               WHEN k_prev < :oversold AND k_curr >= :oversold THEN 'BUY'
+               WHEN k_prev > :overbought AND k_curr <= :overbought THEN 'SELL'
+               ELSE 'HOLD'
+           END AS signal,
+           interval, k_period
+    FROM (
+        SELECT symbol,
+               COALESCE(interval, :interval) AS interval,
+               COALESCE(k_period, :k_period) AS k_period,
+               timestamp AS ts_curr,
+               k_value AS k_curr,
+               LEAD(timestamp) OVER w AS ts_prev,
+               LEAD(k_value) OVER w AS k_prev,
+               ROW_NUMBER() OVER w AS rn
+        FROM signals INDEXED BY idx_signals_ts
+        WHERE timestamp >= :since
+        WINDOW w AS (PARTITION BY symbol, COALESCE(interval, :interval), COALESCE(k_period, :k_period)
+                     ORDER BY timestamp DESC)
+    )
+    WHERE rn = 1 AND k_prev IS NOT NULL
+"""
+
+# Сигнал записывается один раз: уникальный индекс (symbol, signal, timestamp_curr)
+INSERT_TRADE_QUERY = """
+    INSERT OR IGNORE INTO trades_log (symbol, signal, k_prev, k_curr, timestamp_prev, timestamp_curr, created_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+def analyze_pairs(DB_NAME, TIMEZONE, determine_signal, send_signal_message, lookback_days: int = 7):
+    """Сделки открываются только по основному варианту K_GRID; остальные варианты пишутся в лог"""
+    interval, k_period = K_GRID[0]
+    with transaction(DB_NAME) as conn:
         cursor = conn.cursor()
 
         # Используем единую таблицу signals вместо daily таблиц
@@ -14,52 +53,35 @@ def analyze_pairs(DB_NAME, TIMEZONE, determine_signal, send_signal_message):
             logger.warning("Таблица signals не найдена для анализа")
             return
 
-        cursor.execute("SELECT DISTINCT symbol FROM signals")
-        symbols = [row[0] for row in cursor.fetchall()]
+        since = (datetime.now(TIMEZONE) - timedelta(days=lookback_days)).isoformat()
+        rows = cursor.execute(LAST_PAIRS_QUERY, {
+            "oversold": K_OVERSOLD,
+            "overbought": K_OVERBOUGHT,
+            "since": since,
+            "interval": interval,
+            "k_period": k_period,
+        }).fetchall()
 
-        for symbol in symbols:
-            cursor.execute("""
-                SELECT id, timestamp, k_value FROM signals
-                WHERE symbol=?
-                ORDER BY timestamp DESC
-                LIMIT 2
-            """, (symbol,))
-            rows = cursor.fetchall()
+        crossings = [row for row in rows if row[5] != "HOLD"]
+        logger.info(f"Проанализировано {len(rows)} пар %K, пересечений уровней: {len(crossings)}")
 
-            if len(rows) < 2:
+        new_signals = []
+        created_at = datetime.now(TIMEZONE).isoformat()
+        for symbol, ts_old, k_old, ts_new, k_new, classified, row_interval, row_period in crossings:
+            if (row_interval, row_period) != (interval, k_period):
+                logger.info(f"{symbol}: [{row_interval}, K={row_period}] {ts_old} -> {ts_new} | "
+                            f"%K {k_old:.2f} -> {k_new:.2f} | Сигнал варианта: {classified}")
                 continue
-
-            (id_new, ts_new, k_new), (id_old, ts_old, k_old) = rows
-
             signal = determine_signal(k_old, k_new)
+            logger.info(f"{symbol}: Анализ {ts_old} -> {ts_new} | %K {k_old:.2f} -> {k_new:.2f} | Сигнал: {signal}")
+            if signal not in ("BUY", "SELL"):
+                continue
 
-            if signal in ("BUY", "SELL"):
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS trades_log (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        symbol TEXT,
-                        signal TEXT,
-                        k_prev REAL,
-                        k_curr REAL,
-                        timestamp_prev TEXT,
-                        timestamp_curr TEXT,
-                        created_at TEXT
-                    )
-                """)
-                cursor.execute("""
-                    SELECT COUNT(*) FROM trades_log
-                    WHERE symbol=? AND signal=? AND timestamp_curr=?
-                """, (symbol, signal, ts_new))
-                already_logged = cursor.fetchone()[0]
-
-                if already_logged == 0:
-                    cursor.execute("""
-                        INSERT INTO trades_log (symbol, signal, k_prev, k_curr, timestamp_prev, timestamp_curr, created_at)
-                        VALUES (?, ?, ?, ?, ?, ?, ?)
-                    """, (symbol, signal, k_old, k_new, ts_old, ts_new, datetime.now(TIMEZONE).isoformat()))
-
-                    send_signal_message(symbol, signal, k_old, k_new, ts_old, ts_new)
+            cursor.execute(INSERT_TRADE_QUERY, (symbol, signal, k_old, k_new, ts_old, ts_new, created_at))
+            if cursor.rowcount == 1:
+                new_signals.append((symbol, signal, k_old, k_new, ts_old, ts_new))
 
-            logger.info(f"{symbol}: Анализ {ts_old} -> {ts_new} | %K {k_old:.2f} -> {k_new:.2f} | Сигнал: {signal}")
+        conn.commit()
 
-        conn.commit()
\ No newline at end of file
+    for symbol, signal, k_old, k_new, ts_old, ts_new in new_signals:
+        send_signal_message(symbol, signal, k_old, k_new, ts_old, ts_new)
@@ -1,9 +1,15 @@
-import pandas as pd
-from typing import Optional, List, Tuple
+from collections import deque
+import numpy as np
+from typing import Optional, List, Tuple, Dict, TYPE_CHECKING
 from datetime import datetime
+from KlineStore import interval_to_ms
 import logging
 logger = logging.getLogger(__name__)
-def calculate_k(symbol: str, df: pd.DataFrame, K_PERIOD) -> Tuple[Optional[float], Optional[datetime]]:
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+def calculate_k(symbol: str, df: "pd.DataFrame", K_PERIOD) -> Tuple[Optional[float], Optional[datetime]]:
     if len(df) < K_PERIOD + 1:
         return None, None
 
@@ -17,4 +23,266 @@ def calculate_k(symbol: str, df: pd.DataFrame, K_PERIOD) -> Tuple[Optional[float
         return k, last['close_time']
     except Exception as e:
         logger.error(f"{symbol}: Ошибка расчета %K: {e}")
-        return None, None
\ No newline at end of file
+        return None, None
+
+
+def stack_klines(klines_by_symbol: Dict[str, list], length: int) -> Tuple[List[str], np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Собирает последние length свечей каждого символа в матрицы (символы × свечи)
+
+    Символы с более короткой историей пропускаются.
+    :return: symbols, high, low, close, close_time (мс)
+    """
+    symbols = [s for s, rows in klines_by_symbol.items() if rows and len(rows) >= length]
+    if not symbols:
+        empty = np.empty((0, length))
+        return [], empty, empty, empty, empty.astype(np.int64)
+
+    raw = np.array([[row[:7] for row in klines_by_symbol[s][-length:]] for s in symbols], dtype=object)
+    high = raw[:, :, 2].astype(np.float64)
+    low = raw[:, :, 3].astype(np.float64)
+    close = raw[:, :, 4].astype(np.float64)
+    close_time = raw[:, :, 6].astype(np.int64)
+    return symbols, high, low, close, close_time
+
+
+def k_grid_history(grid: List[Tuple[str, int]], base_interval: str, max_candles: int) -> int:
+    """
+    Сколько свечей base_interval нужно для самого длинного варианта сетки %K
+
+    :raises ValueError: интервал варианта не строится из base_interval или
+                        требует истории больше max_candles (одного запроса свечей)
+    """
+    base_ms = interval_to_ms(base_interval)
+    required = 0
+    for interval, k_period in grid:
+        target_ms = interval_to_ms(interval)
+        if target_ms % base_ms or interval[-1] not in "smhd":
+            raise ValueError(f"K_GRID: интервал {interval} нельзя получить из {base_interval}")
+        candles = (k_period + 2) * (target_ms // base_ms)
+        if candles > max_candles:
+            raise ValueError(f"K_GRID: вариант ({interval}, {k_period}) требует {candles} свечей {base_interval}, "
+                             f"за один запрос доступно {max_candles}")
+        required = max(required, candles)
+    return required
+
+
+def resample_klines(rows: list, base_interval: str, interval: str) -> list:
+    """
+    Свечи старшего интервала из свечей базового
+
+    Группы выравниваются по open_time, кратному длительности интервала (как у
+    Binance для интервалов до 1d). Неполные группы (начало истории, пропуски)
+    отбрасываются, кроме последней — это текущая незакрытая свеча.
+
+    :raises ValueError: интервал не кратен базовому
+    """
+    base_ms, target_ms = interval_to_ms(base_interval), interval_to_ms(interval)
+    if target_ms % base_ms or interval[-1] not in "smhd":
+        raise ValueError(f"Интервал {interval} нельзя получить из {base_interval}")
+    ratio = target_ms // base_ms
+    if ratio == 1:
+        return rows
+
+    groups = []
+    for row in rows:
+        bucket = int(row[0]) // target_ms
+        if groups and groups[-1][0] == bucket:
+            groups[-1][1].append(row)
+        else:
+            groups.append((bucket, [row]))
+
+    resampled = []
+    for i, (bucket, group) in enumerate(groups):
+        if len(group) < ratio and i < len(groups) - 1:
+            continue
+        open_time = bucket * target_ms
+        resampled.append([
+            open_time,
+            float(group[0][1]),
+            max(float(row[2]) for row in group),
+            min(float(row[3]) for row in group),
+            float(group[-1][4]),
+            sum(float(row[5]) for row in group),
+            open_time + target_ms - 1,
+        ])
+    return resampled
+
+
+def calculate_k_batch(high: np.ndarray, low: np.ndarray, close: np.ndarray, close_time: np.ndarray,
+                      K_PERIOD) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    %K для всех символов за один проход
+
+    Последний столбец — текущая незакрытая свеча, как и в calculate_k:
+    окно — K_PERIOD свечей до неё, close — предпоследняя свеча.
+    :return: вектор %K (NaN, если данных нет) и close_time предпоследней свечи
+    """
+    n_symbols = high.shape[0]
+    if high.ndim != 2 or high.shape[1] < K_PERIOD + 1:
+        return np.full(n_symbols, np.nan), np.zeros(n_symbols, dtype=np.int64)
+
+    window_low = low[:, -(K_PERIOD + 1):-1].min(axis=1)
+    window_high = high[:, -(K_PERIOD + 1):-1].max(axis=1)
+    last_close = close[:, -2]
+
+    spread = window_high - window_low
+    flat = spread == 0
+    k = np.where(flat, 50.0, 100 * (last_close - window_low) / np.where(flat, 1.0, spread))
+    return k, close_time[:, -2]
+
+
+class RollingK:
+    def __init__(self, K_PERIOD):
+        """
+        Потоковый %K: на каждую закрытую свечу — амортизированно O(1)
+
+        Для каждого символа хранятся монотонные деки максимумов high и минимумов low
+        за последние K_PERIOD свечей. Результат совпадает с calculate_k по тем же свечам.
+        Окна свечей из KlineFetcher подаются через feed(): первый вызов прогревает
+        деки историей из KlineStore, следующие учитывают только новые закрытые свечи.
+        """
+        self.k_period = K_PERIOD
+        self._windows: Dict[str, dict] = {}
+
+    def update(self, symbol: str, high: float, low: float, close: float,
+               close_time=None) -> Tuple[Optional[float], Optional[object]]:
+        """
+        Добавляет закрытую свечу символа
+
+        :return: (%K, close_time) или (None, None), пока окно не заполнено
+        или если свеча уже была учтена
+        """
+        window = self._windows.get(symbol)
+        if window is None:
+            window = {"index": -1, "highs": deque(), "lows": deque(), "last_close_time": None,
+                      "last": (None, None)}
+            self._windows[symbol] = window
+
+        if close_time is not None and window["last_close_time"] is not None \
+                and close_time <= window["last_close_time"]:
+            return None, None
+
+        window["index"] += 1
+        index = window["index"]
+        highs, lows = window["highs"], window["lows"]
+        high, low = float(high), float(low)
+
+        while highs and highs[-1][1] <= high:
+            highs.pop()
+        highs.append((index, high))
+        while lows and lows[-1][1] >= low:
+            lows.pop()
+        lows.append((index, low))
+
+        expired = index - self.k_period
+        while highs[0][0] <= expired:
+            highs.popleft()
+        while lows[0][0] <= expired:
+            lows.popleft()
+
+        window["last_close_time"] = close_time
+        if index + 1 < self.k_period:
+            return None, None
+
+        window_high, window_low = highs[0][1], lows[0][1]
+        close = float(close)
+        k = 100 * (close - window_low) / (window_high - window_low) if window_high != window_low else 50
+        window["last"] = (k, close_time)
+        return k, close_time
+
+    def feed(self, symbol: str, klines: list) -> Tuple[Optional[float], Optional[int]]:
+        """
+        Учитывает закрытые свечи из окна Binance, ещё не поданные в update
+
+        Последняя свеча окна — текущая незакрытая (как в calculate_k) и пропускается.
+        Новые свечи ищутся с конца окна, поэтому цикл без новой свечи стоит O(1),
+        с одной новой — амортизированно O(1).
+        :return: (%K, close_time) последней закрытой свечи или (None, None), пока окно не заполнено
+        """
+        closed = klines[:-1]
+        window = self._windows.get(symbol)
+        last_close_time = window["last_close_time"] if window else None
+        start = len(closed)
+        while start > 0 and (last_close_time is None or int(closed[start - 1][6]) > last_close_time):
+            start -= 1
+        for row in closed[start:]:
+            self.update(symbol, row[2], row[3], row[4], int(row[6]))
+        window = self._windows.get(symbol)
+        return window["last"] if window else (None, None)
+
+    def warm_up(self, symbol: str, klines: list) -> Tuple[Optional[float], Optional[object]]:
+        """Прогоняет закрытые свечи Binance (например из KlineStore.load), возвращает последний %K"""
+        result = (None, None)
+        for row in klines:
+            result = self.update(symbol, row[2], row[3], row[4], int(row[6]))
+        return result
+
+    def reset(self, symbol: str):
+        self._windows.pop(symbol, None)
+
+
+if __name__ == "__main__":
+    import time
+    import pandas as pd
+
+    # Совпадение RollingK с calculate_k на каждой свече: длинный ряд, плоские окна, повторы и пропуски циклов
+    rng = np.random.default_rng(1)
+    for k_period in (1, 3, 14):
+        length = 300
+        close = np.round(100 + rng.standard_normal(length).cumsum(), 1)
+        close[50:50 + k_period + 5] = close[50]  # high == low -> 50
+        high = np.where(np.arange(length) % 7 == 0, close, close + np.round(rng.random(length), 1))
+        low = np.where(np.arange(length) % 7 == 0, close, close - np.round(rng.random(length), 1))
+        high[50:50 + k_period + 5] = low[50:50 + k_period + 5] = close[50]
+        klines = [[i * 3600_000, close[i], high[i], low[i], close[i], 0.0, (i + 1) * 3600_000 - 1]
+                  for i in range(length)]
+        frame = pd.DataFrame({"high": high, "low": low, "close": close, "close_time": [k[6] for k in klines]})
+
+        rolling = RollingK(k_period)
+        end = k_period + 1
+        while end <= length:
+            expected = calculate_k("X", frame.iloc[:end], k_period)
+            streamed = rolling.feed("X", klines[max(0, end - 50):end])
+            assert streamed[1] == expected[1] and np.isclose(streamed[0], expected[0]), \
+                f"K={k_period}, свечей {end}: RollingK {streamed} != calculate_k {expected}"
+            assert rolling.feed("X", klines[max(0, end - 50):end]) == streamed  # повторный цикл без новой свечи
+            end += 1 if end % 11 else 4  # иногда пропускаем несколько циклов
+    print("RollingK совпадает с calculate_k на каждой свече")
+
+    # Сравнение с расчётом по одному символу: python calculate_k.py
+    n_symbols, k_period = 500, 14
+    length = k_period + 2
+    rng = np.random.default_rng(0)
+    close = 100 + rng.standard_normal((n_symbols, length)).cumsum(axis=1)
+    high = close + rng.random((n_symbols, length))
+    low = close - rng.random((n_symbols, length))
+    close_time = np.tile(np.arange(length, dtype=np.int64) * 3600_000, (n_symbols, 1))
+
+    frames = [
+        pd.DataFrame({"high": high[i], "low": low[i], "close": close[i], "close_time": close_time[i]})
+        for i in range(n_symbols)
+    ]
+
+    started = time.perf_counter()
+    single = [calculate_k(str(i), df, k_period)[0] for i, df in enumerate(frames)]
+    single_elapsed = time.perf_counter() - started
+
+    started = time.perf_counter()
+    batch, _ = calculate_k_batch(high, low, close, close_time, k_period)
+    batch_elapsed = time.perf_counter() - started
+
+    assert np.allclose(batch, single)
+
+    rolling = RollingK(k_period)
+    started = time.perf_counter()
+    for i in range(n_symbols):
+        for j in range(length - 1):
+            streamed, _ = rolling.update(str(i), high[i, j], low[i, j], close[i, j], int(close_time[i, j]))
+        assert np.isclose(streamed, single[i])
+    rolling_elapsed = time.perf_counter() - started
+
+    print(f"calculate_k:       {single_elapsed * 1000:.2f} мс на {n_symbols} символов")
+    print(f"calculate_k_batch: {batch_elapsed * 1000:.2f} мс на {n_symbols} символов "
+          f"(x{single_elapsed / batch_elapsed:.0f})")
+    print(f"RollingK.update:   {rolling_elapsed / (n_symbols * (length - 1)) * 1e6:.2f} мкс на свечу")
@@ -0,0 +1,75 @@
+import threading
+from typing import Any, Callable, Dict
+
+from config import (API_KEY_DEMO as API_KEY,
+                    API_SECRET_DEMO as API_SECRET,
+                    PASSPHRASE_DEMO as PASSPHRASE,
+                    IS_DEMO,
+                    CREDS_FILE,
+                    SHEET_ID)
+import logging
+
+logger = logging.getLogger(__name__)
+
+OKX_DOMAIN = "https://www.okx.com"
+
+_instances: Dict[str, Any] = {}
+_lock = threading.Lock()
+
+
+def _lazy(name: str, factory: Callable[[], Any]) -> Any:
+    """Создаёт объект при первом обращении и дальше возвращает его же"""
+    instance = _instances.get(name)
+    if instance is None:
+        with _lock:
+            instance = _instances.get(name)
+            if instance is None:
+                instance = _instances[name] = factory()
+    return instance
+
+
+def get_trade_api():
+    """TradeAPI OKX с общими лимитами запросов на аккаунт"""
+    def build():
+        from okx.Trade import TradeAPI
+        from OrderPipeline import RateLimitedAPI
+        return RateLimitedAPI(TradeAPI(API_KEY, API_SECRET, PASSPHRASE, flag=IS_DEMO, domain=OKX_DOMAIN))
+    return _lazy("trade_api", build)
+
+
+def get_account_api():
+    """AccountAPI OKX с общими лимитами запросов на аккаунт"""
+    def build():
+        from okx.Account import AccountAPI
+        from OrderPipeline import RateLimitedAPI
+        return RateLimitedAPI(AccountAPI(API_KEY, API_SECRET, PASSPHRASE, flag=IS_DEMO, domain=OKX_DOMAIN))
+    return _lazy("account_api", build)
+
+
+def get_market_api():
+    """MarketAPI OKX с общими лимитами запросов на аккаунт"""
+    def build():
+        from okx.MarketData import MarketAPI
+        from OrderPipeline import RateLimitedAPI
+        return RateLimitedAPI(MarketAPI(API_KEY, API_SECRET, PASSPHRASE, flag=IS_DEMO, domain=OKX_DOMAIN))
+    return _lazy("market_api", build)
+
+
+def get_sheet_logger():
+    """
+    Журнал закрытий в Google Sheets без авторизации
+
+    Авторизация — отдельным шагом sheet_logger.connect(); до неё строки
+    копятся в буфере. None, если таблица не настроена или gspread недоступен.
+    """
+    if not SHEET_ID:
+        return None
+
+    def build():
+        try:
+            from googlesheets import GoogleSheetsLogger
+            return GoogleSheetsLogger(CREDS_FILE, SHEET_ID, connect=False)
+        except Exception as e:
+            logger.error(f"Ошибка инициализации Google Sheets: {str(e)}")
+            return False
+    return _lazy("sheet_logger", build) or None
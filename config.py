@@ -6,7 +6,16 @@ from datetime import time as dtime
 
 load_dotenv()
 DB_NAME = os.path.abspath("data/signals.db")
+KLINES_DB = os.path.abspath("data/klines.db")
+POSITIONS_DB = os.path.abspath("data/positions.db")
+TIMERS_DB = os.path.abspath("data/timers.db")
 COINS_FILE = "coins_list.txt"
+SYMBOLS_CACHE_FILE = os.path.abspath("data/binance_symbols.json")
+SYMBOLS_CACHE_TTL = int(os.getenv("SYMBOLS_CACHE_TTL", 3600))
+INSTRUMENTS_CACHE_FILE = os.path.abspath("data/okx_instruments.json")
+TELEGRAM_SPOOL_FILE = os.path.abspath("data/telegram_spool.jsonl")
+SHEETS_SPOOL_FILE = os.path.abspath("data/sheets_spool.jsonl")
+INSTRUMENTS_CACHE_TTL = int(os.getenv("INSTRUMENTS_CACHE_TTL", 3600))
 
 # Telegram settings
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
@@ -19,17 +28,32 @@ PASSPHRASE_DEMO = os.getenv('PASSPHRASE')
 SHEET_ID = os.getenv('GOOGLE_SHEETS_ID')
 CREDS_FILE = 'credentials.json'
 K_PERIOD = 14
+K_OVERSOLD = 20
+K_OVERBOUGHT = 80
 IS_DEMO = "0"
 
 MAX_WORKERS = 10
+BINANCE_WEIGHT_LIMIT = int(os.getenv("BINANCE_WEIGHT_LIMIT", 6000))
+EXIT_WORKERS = int(os.getenv("EXIT_WORKERS", 4))
+ORDER_WORKERS = int(os.getenv("ORDER_WORKERS", 8))
+POSITIONS_REFRESH_SECONDS = float(os.getenv("POSITIONS_REFRESH_SECONDS", 5))
+PRICE_MAX_AGE = float(os.getenv("PRICE_MAX_AGE", 5))
+ORDER_FILL_DEADLINE = float(os.getenv("ORDER_FILL_DEADLINE", 5))
 AMOUNT_USDT = os.getenv('AMOUNT_USDT')
 LEVERAGE = int(os.getenv('LEVERAGE'))
 LEVERAGE_LONG = int(os.getenv('LEVERAGE_LONG'))
 CLOSE_AFTER_MINUTES = int(os.getenv('CLOSE_AFTER_MINUTES'))
 PROFIT_PERCENT = float(os.getenv('PROFIT_PERCENT'))
 UPDATE_LIQUID = int(os.getenv('UPDATE_LIQUID'))
+RECONCILE_INTERVAL = int(os.getenv("RECONCILE_INTERVAL", 300))
 
 # Time settings
 TIMEZONE = pytz.timezone('Europe/Moscow')
 INTERVAL = os.getenv("INTERVAL")
+# Сетка вариантов %K: (интервал, период). Первый — основной, только по нему открываются сделки.
+# Дополнительные задаются как K_GRID=12h:14,1d:9 — интервалы кратны INTERVAL и строятся из его свечей
+K_GRID = [(INTERVAL, K_PERIOD)] + [
+    (item.split(":")[0].strip(), int(item.split(":")[1]))
+    for item in os.getenv("K_GRID", "").split(",") if item.strip()
+]
 UPDATE_TIMES = [dtime(3, 1), dtime(9, 1), dtime(15, 1), dtime(21, 1)]
\ No newline at end of file
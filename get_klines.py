@@ -1,27 +1,90 @@
-import pandas as pd
+import time
 import requests
-from typing import Optional
+from typing import Optional, TYPE_CHECKING
+from KlineStore import KlineStore, interval_to_ms
 import logging
 logger = logging.getLogger(__name__)
 
-def get_klines(symbol: str, TIMEZONE, INTERVAL, K_PERIOD) -> Optional[pd.DataFrame]:
-    url = f"https://api.binance.com/api/v3/klines?symbol={symbol}USDT&interval={INTERVAL}&limit={K_PERIOD + 2}"
+if TYPE_CHECKING:
+    import pandas as pd
+
+BINANCE_KLINES_URL = "https://api.binance.com/api/v3/klines"
+BINANCE_KLINES_MAX_LIMIT = 1000
+
+
+def build_klines_params(symbol: str, INTERVAL, limit: int, store: Optional[KlineStore] = None) -> dict:
+    """Параметры запроса: полная загрузка или только свечи новее последней сохранённой"""
+    params = {"symbol": f"{symbol}USDT", "interval": INTERVAL, "limit": limit}
+    if store is None:
+        return params
+
+    last_close = store.last_close_time(symbol, INTERVAL)
+    if last_close is None:
+        return params
+    if store.backfill_depth(symbol, INTERVAL) < limit:
+        # Окно выросло (например, новый вариант в K_GRID) — один раз догружаем историю целиком
+        return params
+
+    missing = (int(time.time() * 1000) - last_close) // interval_to_ms(INTERVAL) + 1
+    if missing < BINANCE_KLINES_MAX_LIMIT:
+        params["startTime"] = last_close + 1
+        params["limit"] = min(max(missing + 1, 2), BINANCE_KLINES_MAX_LIMIT)
+    else:
+        # Пробел в истории длиннее одной страницы — загружаем окно заново
+        logger.info(f"{symbol}: пропущено {missing} свечей, повторная загрузка")
+    return params
+
+
+def merge_klines(symbol: str, INTERVAL, data: list, limit: int, store: Optional[KlineStore] = None,
+                 backfilled: bool = False) -> list:
+    """
+    Сохраняет закрытые свечи и возвращает окно: limit - 1 закрытых + текущая незакрытая
+
+    :param backfilled: ответ на полный запрос окна (без startTime) — запоминается глубина
+    """
+    if store is None:
+        return data
+
+    store.save(symbol, INTERVAL, data)
+    if backfilled:
+        store.set_backfill_depth(symbol, INTERVAL, limit)
+    now_ms = int(time.time() * 1000)
+    open_candles = [k for k in data if int(k[6]) >= now_ms]
+    closed = store.load(symbol, INTERVAL, limit - len(open_candles))
+    return [list(row) for row in closed] + [k[:7] for k in open_candles]
+
+
+def klines_to_frame(data: list, TIMEZONE) -> "pd.DataFrame":
+    import pandas as pd  # нужен только здесь — не грузим pandas при импорте модуля
+
+    df = pd.DataFrame([k[:7] for k in data], columns=[
+        'open_time', 'open', 'high', 'low', 'close', 'volume', 'close_time'
+    ])
+    df['close_time'] = pd.to_datetime(df['close_time'], unit='ms').dt.tz_localize('UTC').dt.tz_convert(TIMEZONE)
+    for col in ['open', 'high', 'low', 'close']:
+        df[col] = pd.to_numeric(df[col], errors='coerce')
+    return df.dropna()
+
+
+def fetch_klines(symbol: str, INTERVAL, K_PERIOD, store: Optional[KlineStore] = None) -> Optional[list]:
+    """Сырые свечи Binance (списки) для окна K_PERIOD + 2, последняя — незакрытая"""
+    limit = K_PERIOD + 2
     try:
-        response = requests.get(url, timeout=10)
+        params = build_klines_params(symbol, INTERVAL, limit, store)
+        response = requests.get(BINANCE_KLINES_URL, params=params, timeout=10)
         response.raise_for_status()
         data = response.json()
         if not data or isinstance(data, dict):
             return None
 
-        df = pd.DataFrame(data, columns=[
-            'open_time', 'open', 'high', 'low', 'close', 'volume',
-            'close_time', 'quote_volume', 'trades', 'taker_buy_base',
-            'taker_buy_quote', 'ignore'
-        ])
-        df['close_time'] = pd.to_datetime(df['close_time'], unit='ms').dt.tz_localize('UTC').dt.tz_convert(TIMEZONE)
-        for col in ['open', 'high', 'low', 'close']:
-            df[col] = pd.to_numeric(df[col], errors='coerce')
-        return df.dropna()
+        return merge_klines(symbol, INTERVAL, data, limit, store, backfilled="startTime" not in params)
     except Exception as e:
         logger.error(f"{symbol}: Ошибка API - {e}")
-        return None
\ No newline at end of file
+        return None
+
+
+def get_klines(symbol: str, TIMEZONE, INTERVAL, K_PERIOD, store: Optional[KlineStore] = None) -> Optional["pd.DataFrame"]:
+    data = fetch_klines(symbol, INTERVAL, K_PERIOD, store)
+    if data is None:
+        return None
+    return klines_to_frame(data, TIMEZONE)
@@ -1,20 +1,156 @@
 import gspread
 from oauth2client.service_account import ServiceAccountCredentials
 from datetime import datetime
+import json
+import os
+import threading
+import time
+from config import SHEETS_SPOOL_FILE
 import logging
 
 logger = logging.getLogger(__name__)
 
 class GoogleSheetsLogger:
-    def __init__(self, creds_path: str, sheet_name: str):
-        scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-        creds = ServiceAccountCredentials.from_json_keyfile_name(creds_path, scope)
-        client = gspread.authorize(creds)
-        self.sheet = client.open_by_key(sheet_name).sheet1
-  # первая вкладка
+    def __init__(self, creds_path: str, sheet_name: str, spool_path: str = SHEETS_SPOOL_FILE,
+                 batch_size: int = 100, flush_interval: float = 30, max_backoff: float = 300,
+                 connect: bool = True):
+        """
+        Запись закрытых позиций в Google Sheets через буфер
+
+        log_closed_position() только добавляет строку в буфер и spool-файл;
+        фоновый поток пишет накопленное одним append_rows, когда набралось
+        batch_size строк или прошло flush_interval секунд. При APIError
+        строки остаются в spool, повтор — с экспоненциальной паузой.
+
+        :param spool_path: файл строк, ещё не записанных в таблицу (JSON lines)
+        :param connect: авторизоваться сразу; при False — вызвать connect() позже
+                        (строки до этого копятся в буфере)
+        """
+        self.creds_path = creds_path
+        self.sheet_name = sheet_name
+        self.sheet = None
+        self._connect_lock = threading.Lock()
+
+        self.spool_path = spool_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_backoff = max_backoff
+        self._rows = []
+        self._cond = threading.Condition()
+        self._flushing = False
+        self._flush_requested = False
+
+        self.written = 0
+        self.requests = 0
+        self.errors = 0
+        self._load_spool()
+        if connect:
+            self.connect()
+        self._thread = threading.Thread(target=self._run, name="sheets-writer", daemon=True)
+        self._thread.start()
+
+    def connect(self):
+        """Авторизация OAuth и открытие первой вкладки таблицы; повторный вызов ничего не делает"""
+        with self._connect_lock:
+            if self.sheet is None:
+                scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
+                creds = ServiceAccountCredentials.from_json_keyfile_name(self.creds_path, scope)
+                client = gspread.authorize(creds)
+                self.sheet = client.open_by_key(self.sheet_name).sheet1  # первая вкладка
+        return self.sheet
+
+    def _load_spool(self):
+        try:
+            with open(self.spool_path, encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        try:
+                            self._rows.append(json.loads(line))
+                        except ValueError:
+                            logger.warning(f"[SHEET] Повреждённая строка spool пропущена: {line[:80]}")
+            if self._rows:
+                logger.info(f"[SHEET] Из spool восстановлено {len(self._rows)} незаписанных строк")
+        except FileNotFoundError:
+            pass
+
+    def _append_spool(self, row: list):
+        """Дописывает строку в spool до ответа вызывающему — переживает падение процесса"""
+        with open(self.spool_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(row, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _rewrite_spool(self):
+        """Перезаписывает spool оставшимися строками; вызывается под self._cond"""
+        tmp_path = f"{self.spool_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for row in self._rows:
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, self.spool_path)
+
+    def _run(self):
+        backoff = 5.0
+        while True:
+            with self._cond:
+                deadline = time.monotonic() + self.flush_interval
+                while len(self._rows) < self.batch_size and not self._flush_requested:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                self._flush_requested = False
+                if not self._rows:
+                    self._cond.notify_all()
+                    continue
+                rows = list(self._rows)
+                self._flushing = True
+
+            try:
+                self.connect().append_rows(rows)
+                logger.info(f"[SHEET LOG] Записано позиций одним запросом: {len(rows)}")
+                backoff = 5.0
+                with self._cond:
+                    del self._rows[:len(rows)]
+                    self.written += len(rows)
+                    self.requests += 1
+                    self._flushing = False
+                    self._cond.notify_all()
+                    self._rewrite_spool()
+                continue
+            except gspread.exceptions.APIError as e:
+                # В т.ч. 429 (квота) — строки остаются в spool до следующей попытки
+                logger.error(f"[SHEET API ERROR] Ошибка Google API: {str(e)}, повтор через {backoff:.0f} сек")
+            except Exception as e:
+                logger.error(f"[SHEET CRITICAL ERROR] Ошибка записи пачки: {str(e)}, повтор через {backoff:.0f} сек")
+
+            with self._cond:
+                self.errors += 1
+                self._flushing = False
+                self._cond.notify_all()
+            time.sleep(backoff)
+            backoff = min(backoff * 2, self.max_backoff)
+
+    def flush(self, timeout: float = 30) -> bool:
+        """Просит записать буфер сейчас и ждёт (при остановке бота); незаписанное остаётся в spool"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._rows or self._flushing:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._flush_requested = True
+                self._cond.notify_all()
+                self._cond.wait(remaining)
+        return True
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {"queued": len(self._rows), "written": self.written,
+                    "requests": self.requests, "errors": self.errors}
 
     def log_closed_position(self, data: dict):
-        """Логирование закрытой позиции с улучшенной обработкой ошибок"""
+        """Проверяет данные закрытой позиции и ставит строку в буфер записи (без запроса к API)"""
         required_fields = ["symbol", "entry_price", "close_price", "pnl_usd", "pnl_percent"]
 
         # Проверка наличия всех ключей
@@ -45,13 +181,15 @@ class GoogleSheetsLogger:
 
             logger.debug(f"[DEBUG] Типы данных: { {k: type(v) for k, v in data.items()} }")
 
-            # Запись в таблицу
-            self.sheet.append_row(row_data)
-            logger.info(f"[SHEET LOG] Успешно записана позиция {data['symbol']}")
+            # В spool и буфер; в таблицу уйдёт пачкой из фонового потока
+            with self._cond:
+                self._append_spool(row_data)
+                self._rows.append(row_data)
+                if len(self._rows) >= self.batch_size:
+                    self._cond.notify_all()
+            logger.info(f"[SHEET LOG] Позиция {data['symbol']} поставлена в очередь записи")
             return True
 
-        except gspread.exceptions.APIError as e:
-            logger.error(f"[SHEET API ERROR] Ошибка Google API: {str(e)}")
         except Exception as e:
             logger.error(f"[SHEET CRITICAL ERROR] Неизвестная ошибка: {str(e)}")
 
@@ -1,42 +1,63 @@
 import time
-import sqlite3
+STARTED_AT = time.monotonic()  # отсчёт холодного старта — до остальных импортов
+import threading
 import requests
-import pandas as pd
 from datetime import datetime, timedelta
-from concurrent.futures import ThreadPoolExecutor
-from get_klines import get_klines
-from calculate_k import calculate_k
+from KlineFetcher import AsyncKlineFetcher
+from calculate_k import RollingK, resample_klines, k_grid_history
+from KlineStore import KlineStore
+from get_klines import BINANCE_KLINES_MAX_LIMIT
 from analytiv import analyze_pairs
 from okx_bot import init_db, place_long_order, place_sell_order
+from migrations import migrate_db
+from storage import transaction
 from dotenv import load_dotenv
-from okx.Trade import TradeAPI
-from okx.Account import AccountAPI
-from okx.MarketData import MarketAPI
 from position_monitor import PositionMonitor
+from PositionBook import position_book
+from InstrumentRegistry import instrument_registry
+from PositionSnapshot import position_snapshot
+from PriceCache import price_cache
+from LeverageCache import leverage_cache
+from FillWaiter import fill_waiter
 from decimal import *
+from clients import get_trade_api, get_account_api, get_market_api, get_sheet_logger
+from Startup import StartupSequence
 from config import (API_KEY_DEMO as API_KEY,
                     API_SECRET_DEMO as API_SECRET,
                     PASSPHRASE_DEMO as PASSPHRASE,
                     TIMEZONE,
                     COINS_FILE,
                     DB_NAME,
+                    KLINES_DB,
                     INTERVAL,
                     K_PERIOD,
+                    K_GRID,
+                    K_OVERSOLD,
+                    K_OVERBOUGHT,
                     MAX_WORKERS,
+                    BINANCE_WEIGHT_LIMIT,
+                    EXIT_WORKERS,
+                    ORDER_WORKERS,
                     IS_DEMO,
                     AMOUNT_USDT,
                     LEVERAGE,
                     LEVERAGE_LONG,
                     CLOSE_AFTER_MINUTES,
                     PROFIT_PERCENT,
-                    CREDS_FILE,
-                    SHEET_ID,
                     UPDATE_TIMES,
-                    UPDATE_LIQUID)
+                    UPDATE_LIQUID,
+                    RECONCILE_INTERVAL,
+                    SYMBOLS_CACHE_FILE,
+                    SYMBOLS_CACHE_TTL)
+from SymbolCache import BinanceSymbolCache
+from ExitEngine import ExitEngine
+from OrderPipeline import OrderPipeline, BalanceLedger
 from utils import send_telegram_message
+from TelegramNotifier import telegram_notifier
 from TimerStorage import TimerStorage
-from googlesheets import GoogleSheetsLogger
 from Liquidation import LiquidationChecker
+from Reconciler import PositionReconciler
+from webdocket.PrivateWebSocket import OKXPrivateWebSocket
 from notoficated import send_position_closed_message
 import logging
 import sys
@@ -57,21 +78,16 @@ logger = logging.getLogger(__name__)
 
 
 load_dotenv()
-if SHEET_ID:
-    try:
-        sheet_logger = GoogleSheetsLogger(CREDS_FILE, SHEET_ID)
-        logger.info(f"Google Sheets Logger инициализирован. Рабочий лист: {sheet_logger.sheet.title}")
-    except Exception as e:
-        logger.error(f"Ошибка инициализации Google Sheets: {str(e)}")
-        sheet_logger = None
-else:
-    sheet_logger = None
+symbol_cache = BinanceSymbolCache(SYMBOLS_CACHE_FILE, SYMBOLS_CACHE_TTL)
 
-timer_storage = TimerStorage()
-trade_api = TradeAPI(API_KEY, API_SECRET, PASSPHRASE, flag=IS_DEMO, domain="https://www.okx.com")
-account_api = AccountAPI(API_KEY, API_SECRET, PASSPHRASE, flag=IS_DEMO, domain="https://www.okx.com")
-market_api = MarketAPI(API_KEY, API_SECRET, PASSPHRASE, flag=IS_DEMO, domain="https://www.okx.com")
-position_monitor1 = PositionMonitor(trade_api, account_api, market_api, close_after_minutes=CLOSE_AFTER_MINUTES, profit_threshold=PROFIT_PERCENT, timer_storage=timer_storage, sheet_logger=sheet_logger)
+# Клиенты OKX — ленивые синглтоны из clients (с общими лимитами запросов на аккаунт).
+# Объекты ниже работают с диском и сетью и создаются в startup(), а не при импорте
+sheet_logger = None
+timer_storage = None
+kline_fetcher = None
+position_monitor1 = None
+exit_engine = None
+order_pipeline = None
 
 
 
@@ -79,23 +95,11 @@ def handle_ws_message(data):
     if "data" not in data:
         return
 
-    # Оптимизация: получаем все активные позиции одним запросом
-    active_positions = set()
-    try:
-        with sqlite3.connect("data/positions.db") as conn:
-            conn.row_factory = sqlite3.Row  # Для доступа по имени столбца
-            # SPOT + SHORT позиции одним запросом
-            cursor = conn.execute("""
-                SELECT symbol FROM (
-                    SELECT symbol FROM long_positions WHERE closed=0
-                    UNION ALL
-                    SELECT symbol FROM short_positions WHERE closed=0
-                )
-            """)
-            active_positions = {row['symbol'] for row in cursor}
-    except Exception as e:
-        logger.error(f"Ошибка получения позиций: {e}")
-        return
+    # Поток тикеров держит кеш цен свежим для всех инструментов
+    price_cache.update_many(data["data"])
+
+    # Активные позиции берём из памяти, без обращения к БД
+    active_positions = position_book.snapshot()
 
     # Обрабатываем только тикеры с активными позициями
     for ticker in data["data"]:
@@ -103,14 +107,11 @@ def handle_ws_message(data):
             symbol = ticker["instId"]
             if "-SWAP" not in symbol:  # Пропускаем SPOT-тикеры
                 continue
+            if symbol not in active_positions:
+                continue
 
-            current_price = Decimal(ticker["last"])
-            import threading
-            threading.Thread(
-                target=position_monitor1._check_position,
-                args=(symbol, current_price),
-                daemon=True
-            ).start()
+            # Пул с объединением тикеров по символу вместо потока на каждый тикер
+            exit_engine.submit(symbol, Decimal(ticker["last"]))
         except Exception as e:
             print(f"Ошибка обработки {symbol}: {e}")
 # === Логгер ===
@@ -131,47 +132,31 @@ def get_current_price(symbol: str) -> float:  # ✅ нормализация
 # === Загрузка монет ===
 def is_valid_pair_binance(symbol):
     """Проверяет, существует ли торговая пара на Binance (SPOT)"""
-    try:
-        pair = f"{symbol.upper()}USDT"
-        url = "https://api.binance.com/api/v3/exchangeInfo"
-        response = requests.get(url, timeout=10)
-
-        if response.status_code != 200:
-            logger.error(f"Ошибка запроса к Binance (код {response.status_code})")
-            return False
-
-        data = response.json()
-        symbols = data.get("symbols", [])
-
-        if any(item["symbol"] == pair and item["status"] == "TRADING" for item in symbols):
-            return True
-        else:
-            logger.warning(f"Пара {pair} не найдена или неактивна на Binance")
-            return False
-    except Exception as e:
-        logger.error(f"Ошибка проверки пары {symbol}-USDT на Binance: {str(e)}")
+    if not symbol_cache.refresh():
         return False
+    if symbol_cache.is_valid(symbol):
+        return True
+    logger.warning(f"Пара {symbol.upper()}USDT не найдена или неактивна на Binance")
+    return False
 
 
 def load_symbols():
     """Загружает список символов из файла и проверяет их доступность на бирже"""
     try:
         with open(COINS_FILE) as f:
-            all_symbols = [s.strip() for s in f.readlines()]
-            valid_symbols = []
-            invalid_symbols = []
+            all_symbols = [s.strip() for s in f.readlines() if s.strip()]
 
-            for symbol in all_symbols:
-                if is_valid_pair_binance(symbol):
-                    valid_symbols.append(symbol)
-                else:
-                    invalid_symbols.append(symbol)
+        if not symbol_cache.refresh():
+            logger.error("Не удалось получить список торговых пар Binance")
+            return []
 
-            if invalid_symbols:
-                logger.warning(f"Следующие символы не найдены на бирже: {', '.join(invalid_symbols)}")
+        valid_symbols, invalid_symbols = symbol_cache.filter_valid(all_symbols)
 
-            logger.info(f"Загружено {len(valid_symbols)} валидных символов из {len(all_symbols)}")
-            return valid_symbols
+        if invalid_symbols:
+            logger.warning(f"Следующие символы не найдены на бирже: {', '.join(invalid_symbols)}")
+
+        logger.info(f"Загружено {len(valid_symbols)} валидных символов из {len(all_symbols)}")
+        return valid_symbols
     except Exception as e:
         logger.error(f"Ошибка загрузки символов: {str(e)}")
         return []
@@ -182,28 +167,18 @@ def load_symbols():
 # === Расчёт индикатора %K ===
 
 # === Сохранение %K в БД (без сигнала) ===
-def save_to_db(symbol: str, timestamp: str, k: float):
+def save_to_db(rows: list):
+    """Записывает значения %K всех вариантов одной транзакцией: (symbol, timestamp, k, interval, k_period)"""
+    date = datetime.now(TIMEZONE).strftime('%Y-%m-%d')
     try:
-        with sqlite3.connect(DB_NAME) as conn:
-            # Создаём единую таблицу для всех данных
-            conn.execute("""
-                CREATE TABLE IF NOT EXISTS signals (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    symbol TEXT,
-                    timestamp TEXT,
-                    k_value REAL,
-                    processed INTEGER DEFAULT 0,
-                    date TEXT  -- Добавляем поле для даты, если нужно фильтровать по дням
-                );
-            """)
-            if k is not None:  # Добавляем запись только если есть данные
-                conn.execute("""
-                    INSERT INTO signals (symbol, timestamp, k_value, date)
-                    VALUES (?, ?, ?, ?)
-                """, (symbol, timestamp, k, datetime.now(TIMEZONE).strftime('%Y-%m-%d')))
-        logger.info(f"{symbol}: ✅ Сохранено в signals | %K={k:.2f}")
+        with transaction(DB_NAME) as conn:
+            conn.executemany("""
+                INSERT INTO signals (symbol, timestamp, k_value, date, interval, k_period)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, [(symbol, ts, k, date, interval, k_period) for symbol, ts, k, interval, k_period in rows])
+        logger.info(f"✅ Сохранено в signals: {len(rows)} значений %K")
     except Exception as e:
-        logger.error(f"{symbol}: ❌ Ошибка сохранения в БД: {e}", "error")
+        logger.error(f"❌ Ошибка сохранения %K в БД: {e}")
 
 
 # === Функция определения сигнала по двум значениям %K ===
@@ -211,10 +186,10 @@ def determine_signal(k_prev: float, k_curr: float) -> str:
     arrow = "↑" if k_curr > k_prev else "↓" if k_curr < k_prev else "→"
     message = f"%K: {k_prev:.2f} {arrow} {k_curr:.2f}"
 
-    if k_prev < 20 and k_curr >= 20:
+    if k_prev < K_OVERSOLD and k_curr >= K_OVERSOLD:
         logger.info(f"{message} — BUY сигнал")
         return "BUY"
-    elif k_prev > 80 and k_curr <= 80:
+    elif k_prev > K_OVERBOUGHT and k_curr <= K_OVERBOUGHT:
         logger.info(f"{message} — SELL сигнал")
         return "SELL"
     else:
@@ -238,28 +213,41 @@ def send_signal_message(symbol: str, signal: str, k_prev: float, k_curr: float,
     )
     send_telegram_message(signal_text)
 
+    # Ордер исполняется в пуле параллельно с сигналами по другим монетам
+    order_pipeline.submit(symbol, signal, ts_curr)
+
+
+def execute_signal(symbol: str, signal: str, ledger: BalanceLedger) -> bool:
+    """
+    Открывает позицию по сигналу; маржа резервируется в общем учёте
+
+    Ордера параллельных сигналов объединяются в place_multiple_orders.
+    """
+    success = False
     try:
         if signal == "BUY":
             success = place_long_order(
-                trade_api=trade_api,
-                account_api=account_api,
-                market_api=market_api,
+                trade_api=position_monitor1.order_batcher,
+                account_api=get_account_api(),
+                market_api=get_market_api(),
                 symbol=symbol,
                 amount_usdt=AMOUNT_USDT,
                 position_monitor=position_monitor1,
                 timestamp=datetime.now().isoformat(),
-                leverage=LEVERAGE_LONG
+                leverage=LEVERAGE_LONG,
+                ledger=ledger
             )
         elif signal == "SELL":
             success = place_sell_order(
-                trade_api=trade_api,
-                account_api=account_api,
-                market_api=market_api,
+                trade_api=position_monitor1.order_batcher,
+                account_api=get_account_api(),
+                market_api=get_market_api(),
                 symbol=symbol,
                 amount_usdt=AMOUNT_USDT,
                 position_monitor=position_monitor1,
                 timestamp=datetime.now().isoformat(),
-                leverage=LEVERAGE
+                leverage=LEVERAGE,
+                ledger=ledger
             )
 
         if success:
@@ -275,35 +263,77 @@ def send_signal_message(symbol: str, signal: str, k_prev: float, k_curr: float,
 
     except Exception as e:
         logger.error(f"{symbol}: ❌ Ошибка: {e}")
+    return success
 
 
 
+# === Анализ пар значений %K и запись итогового сигнала ===
 
+def format_close_time(close_time_ms: int) -> str:
+    """close_time Binance (мс, UTC) -> ISO-строка в TIMEZONE"""
+    close_time_ms = int(close_time_ms)
+    ts = datetime.fromtimestamp(close_time_ms // 1000, TIMEZONE)
+    return ts.replace(microsecond=close_time_ms % 1000 * 1000).isoformat()
 
-# === Анализ пар значений %K и запись итогового сигнала ===
 
-# === Обработка одной монеты ===
-def process_symbol(symbol: str):
-    """Обрабатывает один символ и возвращает статус обработки"""
-    try:
-        logger.debug(f"Начинаем обработку символа: {symbol}")
-        time.sleep(0.3)
-        df = get_klines(symbol, TIMEZONE, INTERVAL, K_PERIOD)
-        if df is None:
+# Глубина истории INTERVAL для всех вариантов K_GRID; неподходящая сетка — ошибка при загрузке
+HISTORY_LENGTH = k_grid_history(K_GRID, INTERVAL, BINANCE_KLINES_MAX_LIMIT)
+
+# Потоковый %K по вариантам K_GRID: окна пересчитываются только на новых закрытых свечах
+ROLLING_K = [RollingK(k_period) for _, k_period in K_GRID]
+
+
+# === Обработка всех монет ===
+def process_symbols(symbols: list) -> list:
+    """
+    Загружает свечи и считает %K всех вариантов K_GRID для всех символов
+
+    Свечи INTERVAL загружаются один раз на глубину самого длинного варианта,
+    старшие интервалы строятся из них локально. %K считает RollingK: первый цикл
+    прогревает окна историей из KlineStore, дальше учитываются только новые
+    закрытые свечи. Статусы — по основному варианту.
+    """
+    klines_by_symbol = kline_fetcher.fetch(symbols, limit=HISTORY_LENGTH)
+
+    statuses = {}
+    for symbol, klines in klines_by_symbol.items():
+        if klines is None:
             logger.warning(f"Не удалось получить данные для {symbol}")
-            return "error"
+            statuses[symbol] = "error"
+        else:
+            statuses[symbol] = "warning"
+
+    rows = []
+    for variant, (interval, k_period) in enumerate(K_GRID):
+        try:
+            if interval == INTERVAL:
+                series = klines_by_symbol
+            else:
+                series = {symbol: resample_klines(klines, INTERVAL, interval)
+                          for symbol, klines in klines_by_symbol.items() if klines}
+            results = [(symbol, *ROLLING_K[variant].feed(symbol, klines))
+                       for symbol, klines in series.items() if klines]
+        except Exception as e:
+            logger.error(f"Критическая ошибка расчёта %K ({interval}, {k_period}): {str(e)}")
+            if variant == 0:
+                return ["error"] * len(symbols)
+            continue
+
+        for symbol, k, ts in results:
+            if k is None:
+                continue
+            rows.append((symbol, format_close_time(ts), k, interval, k_period))
+            if variant == 0:
+                logger.info(f"Символ {symbol} успешно обработан (K={k:.2f})")
+                statuses[symbol] = "success"
+
+    save_to_db(rows)
 
-        k, ts = calculate_k(symbol, df, K_PERIOD)
-        if k is None or ts is None:
+    for symbol, status in statuses.items():
+        if status == "warning":
             logger.warning(f"Не удалось рассчитать %K для {symbol}")
-            return "warning"
 
-        save_to_db(symbol, ts.isoformat(), k)
-        logger.info(f"Символ {symbol} успешно обработан (K={k:.2f})")
-        return "success"
-    except Exception as e:
-        logger.error(f"Критическая ошибка обработки {symbol}: {str(e)}")
-        return "error"
+    return list(statuses.values())
 
 
 def wait_until_next_update():
@@ -312,7 +342,7 @@ def wait_until_next_update():
         (TIMEZONE.localize(datetime.combine(now.date(), t))
          for t in UPDATE_TIMES
          if TIMEZONE.localize(datetime.combine(now.date(), t)) > now),
-        default=TIMEZONE.localize(datetime.combine(now.date() + pd.Timedelta(days=1), UPDATE_TIMES[0]))
+        default=TIMEZONE.localize(datetime.combine(now.date() + timedelta(days=1), UPDATE_TIMES[0]))
     )
     wait_seconds = (next_update - now).total_seconds()
     logger.info(f"Ждем {wait_seconds:.0f} секунд до {next_update.time()}")
@@ -334,20 +364,80 @@ def wait_until_next_update():
 
 
 
+# === Запуск ===
+def startup() -> StartupSequence:
+    """
+    Поэтапный запуск: независимые шаги (БД, авторизация Google Sheets,
+    реестр инструментов, таймеры) выполняются параллельно
+    """
+    global sheet_logger, timer_storage, kline_fetcher, position_monitor1, exit_engine, order_pipeline
+    sequence = StartupSequence(STARTED_AT)
+    account_api = get_account_api()
+    sheet_logger = get_sheet_logger()
+
+    def init_databases():
+        init_db()  # позиции в память — до восстановления таймеров
+        migrate_db(DB_NAME, "signals")
+
+    def init_klines():
+        global kline_fetcher
+        kline_fetcher = AsyncKlineFetcher(INTERVAL, K_PERIOD, store=KlineStore(KLINES_DB),
+                                          concurrency=MAX_WORKERS, weight_per_minute=BINANCE_WEIGHT_LIMIT)
+
+    def init_timer_storage():
+        global timer_storage
+        timer_storage = TimerStorage()
+
+    def warm_instruments():
+        if instrument_registry.is_stale():
+            instrument_registry.refresh(account_api)
+
+    def restore_timers():
+        global position_monitor1
+        # Просроченные позиции закрываются сразу; строки для Sheets ждут авторизации в буфере
+        position_monitor1 = PositionMonitor(get_trade_api(), account_api, get_market_api(),
+                                            close_after_minutes=CLOSE_AFTER_MINUTES, profit_threshold=PROFIT_PERCENT,
+                                            timer_storage=timer_storage, sheet_logger=sheet_logger, restore_timers=False)
+        position_monitor1._restore_timers()
+
+    sequence.add("db", init_databases)
+    sequence.add("klines_db", init_klines)
+    sequence.add("timer_storage", init_timer_storage)
+    # Досылаем сообщения, оставшиеся в spool с прошлого запуска
+    sequence.add("telegram", telegram_notifier.start)
+    sequence.add("instruments", warm_instruments)
+    sequence.add("binance_pairs", symbol_cache.refresh)
+    if sheet_logger:
+        sequence.add("sheets_auth", sheet_logger.connect)
+    sequence.add("timers", restore_timers, after=("db", "timer_storage"))
+    sequence.run()
+
+    if position_monitor1 is None or kline_fetcher is None:
+        raise RuntimeError("Запуск не завершён: не восстановлены таймеры или хранилище свечей")
+
+    exit_engine = ExitEngine(position_monitor1._check_position, workers=EXIT_WORKERS)
+    order_pipeline = OrderPipeline(execute_signal, BalanceLedger(account_api), workers=ORDER_WORKERS, timezone=TIMEZONE)
+    instrument_registry.start_background_refresh(account_api)
+    threading.Thread(target=leverage_cache.load_all, args=(account_api,), daemon=True).start()
+    return sequence
+
+
 # === Основной цикл ===
 def main():
+    private_ws = None
     try:
-        print("Инициализация БД...")
-        init_db()  # Должен быть ПЕРВЫМ вызовом
-        print("БД инициализирована.")
-
-        # Проверка создания таблиц
-        with sqlite3.connect(DB_NAME) as conn:
-            tables = conn.execute("SELECT name FROM sqlite_master WHERE type='table'").fetchall()
-            print(f"Таблицы в БД: {tables}")
-        time.sleep(1)
+        sequence = startup()
+        account_api = get_account_api()
+        exit_engine.start()
         position_monitor = position_monitor1
-        #position_monitor.sync_positions_with_exchange()
+        # Сверка БД с биржей пачкой: первый проход сразу, дальше раз в RECONCILE_INTERVAL
+        reconciler = PositionReconciler(
+            account_api=account_api,
+            on_position_closed=send_position_closed_message,
+            sheet_logger=sheet_logger,
+            timer_storage=timer_storage,
+            closing=position_monitor.closing
+        )
         liquidation_checker = LiquidationChecker(
             account_api=account_api,
             on_position_closed=send_position_closed_message,
@@ -355,7 +445,21 @@ def main():
             timer_storage=timer_storage
         )
 
+        # Ликвидации и позиции — push из приватного канала; REST-опрос только при разрыве
+        private_ws = OKXPrivateWebSocket(
+            API_KEY, API_SECRET, PASSPHRASE, is_demo=IS_DEMO,
+            on_liquidation=liquidation_checker.on_liquidation_event,
+            on_reconnect=lambda: liquidation_checker.check(force=True)
+        )
+        liquidation_checker.push_source = private_ws
+        private_ws.add_order_listener(fill_waiter.on_order_event)
+        fill_waiter.push_source = private_ws
+        private_ws.start()
+
         liquidation_checker.start_background_checking(interval=UPDATE_LIQUID)
+        reconciler.start_background(interval=RECONCILE_INTERVAL)
+        sequence.mark_ready()
+        sequence.report()
 
         wait_until_next_update()
         #symbols = load_symbols()
@@ -393,16 +497,13 @@ def main():
             warning_count = 0
             error_count = 0
 
-            with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-                results = list(executor.map(process_symbol, symbols))
-
-                for result in results:
-                    if result == "success":
-                        success_count += 1
-                    elif result == "warning":
-                        warning_count += 1
-                    else:
-                        error_count += 1
+            for result in process_symbols(symbols):
+                if result == "success":
+                    success_count += 1
+                elif result == "warning":
+                    warning_count += 1
+                else:
+                    error_count += 1
 
             # Отправляем сводку по обработке
             summary_msg = (
@@ -413,19 +514,39 @@ def main():
                 f"Всего символов: {len(symbols)}"
             )
             logger.info(summary_msg)
+            logger.info(f"[Timer] Метрики таймеров: {position_monitor.timer_stats()}")
+            logger.info(f"[ExitEngine] Метрики проверки выхода: {exit_engine.stats()}")
+            logger.info(f"[Positions] Снимок позиций: {position_snapshot.stats()}")
+            logger.info(f"[Reconcile] Сверка с биржей: {reconciler.stats()}")
+            logger.info(f"[PriceCache] Кеш цен: {price_cache.stats()}")
+            logger.info(f"[Leverage] Кеш плеча: {leverage_cache.stats()}")
+            logger.info(f"[Fill] Подтверждение ордеров: {fill_waiter.stats()}")
+            logger.info(f"[Telegram] Уведомления: {telegram_notifier.stats()}")
+            if sheet_logger:
+                logger.info(f"[SHEET] Журнал закрытий: {sheet_logger.stats()}")
 
             analyze_pairs(DB_NAME, TIMEZONE, determine_signal, send_signal_message)
+            logger.info(f"[Orders] Исполнение сигналов: {order_pipeline.drain()}")
             wait_until_next_update()
 
     except KeyboardInterrupt:
         logger.warning("Получен сигнал остановки")
-        position_monitor.stop_all_timers()
+        if position_monitor1:
+            position_monitor1.stop_all_timers()
+        if exit_engine:
+            exit_engine.stop()
+        if private_ws:
+            private_ws.stop()
         #liquidation_ws.stop()
         #ws_manager.stop()
     except Exception as e:
         logger.error(f"КРИТИЧЕСКАЯ ОШИБКА: {str(e)}")
     finally:
-        timer_storage.close()
+        if timer_storage:
+            timer_storage.close()
+        telegram_notifier.flush()
+        if sheet_logger:
+            sheet_logger.flush()
         #ws_manager.stop()
         #liquidation_ws.stop()
         logger.info("Мониторинг позиций остановлен")
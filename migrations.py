@@ -0,0 +1,272 @@
+import re
+import sqlite3
+import sys
+from typing import Dict, List, Tuple
+
+from storage import get_connection
+import logging
+logger = logging.getLogger(__name__)
+
+# Версии схем по файлам БД. Версия хранится в PRAGMA user_version,
+# каждая миграция применяется один раз в отдельной транзакции.
+# Новые изменения схемы добавляются только новой версией в конец списка.
+MIGRATIONS: Dict[str, List[Tuple[int, List[str]]]] = {
+    "positions": [
+        (1, [
+            """
+            CREATE TABLE IF NOT EXISTS long_positions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                symbol TEXT ,
+                entry_price REAL,
+                entry_time TEXT,
+                exit_price REAL,
+                exit_time TEXT,
+                pnl_percent REAL,
+                pnl_usdt REAL,
+                order_id TEXT,
+                closed INTEGER DEFAULT 0,
+                leverage INTEGER DEFAULT 1,
+                amount REAL,
+                side TEXT,
+                fee REAL DEFAULT 0,
+                reason TEXT DEFAULT NULL
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS short_positions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                symbol TEXT ,
+                entry_price REAL,
+                entry_time TEXT,
+                exit_price REAL,
+                exit_time TEXT,
+                pnl_percent REAL,
+                pnl_usdt REAL,
+                order_id TEXT,
+                closed INTEGER DEFAULT 0,
+                leverage INTEGER DEFAULT 1,
+                amount REAL,
+                side TEXT,
+                fee REAL DEFAULT 0,
+                reason TEXT DEFAULT NULL,
+                pos_id TEXT
+            )
+            """,
+        ]),
+        (2, [
+            "CREATE INDEX IF NOT EXISTS idx_long_open_symbol ON long_positions (symbol) WHERE closed = 0",
+            "CREATE INDEX IF NOT EXISTS idx_long_order_id ON long_positions (order_id)",
+            "CREATE INDEX IF NOT EXISTS idx_short_open_symbol ON short_positions (symbol) WHERE closed = 0",
+            "CREATE INDEX IF NOT EXISTS idx_short_order_id ON short_positions (order_id)",
+            "CREATE INDEX IF NOT EXISTS idx_short_open_pos_id ON short_positions (pos_id) WHERE closed = 0",
+        ]),
+        (3, [
+            # Обработанные события биржи (ликвидации, исполнения) — дедупликация между перезапусками
+            """
+            CREATE TABLE IF NOT EXISTS processed_events (
+                event_id TEXT PRIMARY KEY,
+                created_at REAL NOT NULL
+            ) WITHOUT ROWID
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_processed_events_created ON processed_events (created_at)",
+        ]),
+    ],
+    "signals": [
+        (1, [
+            """
+            CREATE TABLE IF NOT EXISTS signals (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                symbol TEXT,
+                timestamp TEXT,
+                k_value REAL,
+                processed INTEGER DEFAULT 0,
+                date TEXT  -- Добавляем поле для даты, если нужно фильтровать по дням
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS trades_log (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                symbol TEXT,
+                signal TEXT,
+                k_prev REAL,
+                k_curr REAL,
+                timestamp_prev TEXT,
+                timestamp_curr TEXT,
+                created_at TEXT
+            )
+            """,
+        ]),
+        (2, [
+            "CREATE INDEX IF NOT EXISTS idx_signals_symbol_ts ON signals (symbol, timestamp DESC)",
+            "CREATE INDEX IF NOT EXISTS idx_signals_ts ON signals (timestamp)",
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_trades_log_signal ON trades_log (symbol, signal, timestamp_curr)",
+        ]),
+        (3, [
+            # Варианты %K из K_GRID; NULL — основной вариант (записи до v3)
+            "ALTER TABLE signals ADD COLUMN interval TEXT",
+            "ALTER TABLE signals ADD COLUMN k_period INTEGER",
+        ]),
+    ],
+    "timers": [
+        (1, [
+            """
+            CREATE TABLE IF NOT EXISTS active_timers (
+                symbol TEXT PRIMARY KEY,
+                entry_time REAL NOT NULL,
+                elapsed_time REAL DEFAULT 0
+            )
+            """,
+        ]),
+    ],
+    "klines": [
+        (1, [
+            """
+            CREATE TABLE IF NOT EXISTS klines (
+                symbol TEXT NOT NULL,
+                interval TEXT NOT NULL,
+                open_time INTEGER NOT NULL,
+                open REAL,
+                high REAL,
+                low REAL,
+                close REAL,
+                volume REAL,
+                close_time INTEGER NOT NULL,
+                PRIMARY KEY (symbol, interval, open_time)
+            ) WITHOUT ROWID
+            """,
+        ]),
+        (2, [
+            # Глубина последней полной загрузки истории (рост окна из-за K_GRID)
+            """
+            CREATE TABLE IF NOT EXISTS kline_backfill (
+                symbol TEXT NOT NULL,
+                interval TEXT NOT NULL,
+                depth INTEGER NOT NULL,
+                PRIMARY KEY (symbol, interval)
+            ) WITHOUT ROWID
+            """,
+        ]),
+    ],
+}
+
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn: sqlite3.Connection, schema: str) -> int:
+    """
+    Применяет недостающие миграции схемы к соединению
+
+    :return: итоговая версия схемы
+    """
+    current = schema_version(conn)
+    isolation_level = conn.isolation_level
+    conn.isolation_level = None
+    try:
+        for version, statements in MIGRATIONS[schema]:
+            if version <= current:
+                continue
+            try:
+                conn.execute("BEGIN")
+                for statement in statements:
+                    conn.execute(statement)
+                conn.execute(f"PRAGMA user_version = {int(version)}")
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            logger.info(f"[Migrations] {schema}: применена версия {version}")
+            current = version
+    finally:
+        conn.isolation_level = isolation_level
+    return current
+
+
+def migrate_db(db_path: str, schema: str) -> int:
+    """Приводит схему БД к последней версии через соединение текущего потока"""
+    return migrate(get_connection(db_path), schema)
+
+
+POSITION_TABLES = ("long_positions", "short_positions")
+
+
+def hot_queries() -> Dict[str, List[str]]:
+    """
+    Запросы горячего пути по схемам. Каждый должен использовать индекс (проверяется check_query_plans)
+
+    Берутся константы модулей, которые эти запросы выполняют, поэтому проверка
+    не расходится с кодом. Импорт ленивый: сами модули импортируют migrations.
+    """
+    from analytiv import LAST_PAIRS_QUERY, INSERT_TRADE_QUERY
+    from position_monitor import ENTRY_BY_ORDER_QUERY, CLOSE_POSITION_QUERY
+    from Liquidation import CLOSE_LIQUIDATED_QUERY
+    from Reconciler import CLOSE_RECONCILED_QUERY, UPDATE_RECONCILED_QUERY
+    from PositionBook import LOAD_OPEN_QUERY
+    from EventDedup import CLAIM_QUERY, PROCESSED_QUERY, PRUNE_QUERY
+    from TimerStorage import HAS_TIMER_QUERY, UPDATE_ELAPSED_QUERY, DELETE_TIMER_QUERY
+    from KlineStore import LAST_CLOSE_QUERY, LOAD_QUERY
+
+    return {
+        "positions": [
+            *(ENTRY_BY_ORDER_QUERY.format(table=table) for table in POSITION_TABLES),
+            *(CLOSE_POSITION_QUERY.format(table=table) for table in POSITION_TABLES),
+            CLOSE_LIQUIDATED_QUERY,
+            # Сверка с биржей (Reconciler)
+            *(CLOSE_RECONCILED_QUERY.format(table=table) for table in POSITION_TABLES),
+            UPDATE_RECONCILED_QUERY.format(table="long_positions", assignments="amount=?"),
+            UPDATE_RECONCILED_QUERY.format(table="short_positions", assignments="amount=?, pos_id=?"),
+            LOAD_OPEN_QUERY,
+            CLAIM_QUERY,
+            PROCESSED_QUERY,
+            PRUNE_QUERY,
+        ],
+        "signals": [
+            LAST_PAIRS_QUERY,
+            INSERT_TRADE_QUERY,
+        ],
+        "timers": [
+            HAS_TIMER_QUERY,
+            UPDATE_ELAPSED_QUERY,
+            DELETE_TIMER_QUERY,
+        ],
+        "klines": [
+            LAST_CLOSE_QUERY,
+            LOAD_QUERY,
+        ],
+    }
+
+
+def check_query_plans(conn: sqlite3.Connection, schema: str) -> List[str]:
+    """
+    Проверяет, что все запросы горячего пути схемы идут по индексам
+
+    :return: список запросов с полным сканированием таблицы и их планы
+    """
+    problems = []
+    for query in hot_queries()[schema]:
+        names = re.findall(r":(\w+)", query)
+        params = dict.fromkeys(names) if names else (None,) * query.count("?")
+        plan = [row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {query}", params)]
+        # Обход подзапроса (окна, UNION) — не обход таблицы
+        full_scans = [step for step in plan
+                      if step.startswith("SCAN") and "INDEX" not in step and "subquery" not in step.lower()]
+        if full_scans:
+            problems.append(f"{' '.join(query.split())}\n    -> {'; '.join(plan)}")
+    return problems
+
+
+if __name__ == "__main__":
+    # Регрессионная проверка планов запросов: python migrations.py
+    failed = False
+    queries = hot_queries()
+    for schema in MIGRATIONS:
+        with sqlite3.connect(":memory:") as conn:
+            migrate(conn, schema)
+            problems = check_query_plans(conn, schema)
+        status = "OK" if not problems else "FAIL"
+        print(f"[{status}] {schema}: {len(queries[schema]) - len(problems)}/{len(queries[schema])} запросов по индексам")
+        for problem in problems:
+            print(f"  {problem}")
+        failed = failed or bool(problems)
+    sys.exit(1 if failed else 0)
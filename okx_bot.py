@@ -1,68 +1,30 @@
 import sqlite3
-import time
+from config import POSITIONS_DB
+from storage import transaction
 from datetime import datetime
 from decimal import ROUND_DOWN
 from decimal import Decimal
 from typing import Tuple, Optional
-import os
+from migrations import migrate_db
+from PositionBook import position_book
+from InstrumentRegistry import instrument_registry
+from PositionSnapshot import position_snapshot
+from PriceCache import price_cache
+from LeverageCache import leverage_cache
+from FillWaiter import fill_waiter
 
 import logging
 logger = logging.getLogger(__name__)
 
-DB_NAME = os.path.abspath("data/positions.db")  # Путь будет одинаковым везде
+DB_NAME = POSITIONS_DB  # Путь будет одинаковым везде
 
 def init_db():
     """Инициализация базы данных с отдельными таблицами для SPOT и SHORT позиций"""
     try:
         logger.info(f"[INFO] 🔧 Начинаем инициализацию БД: {DB_NAME}")
-        with sqlite3.connect(DB_NAME) as conn:
-            # Таблица для SPOT-позиций
-            logger.info("[INFO] Проверяем таблицу long_positions...")
-            conn.execute("""
-            CREATE TABLE IF NOT EXISTS long_positions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                symbol TEXT ,
-                entry_price REAL,
-                entry_time TEXT,
-                exit_price REAL,
-                exit_time TEXT,
-                pnl_percent REAL,
-                pnl_usdt REAL,
-                order_id TEXT,
-                closed INTEGER DEFAULT 0,
-                leverage INTEGER DEFAULT 1,
-                amount REAL,
-                side TEXT,
-                fee REAL DEFAULT 0,
-                reason TEXT DEFAULT NULL
-            )
-            """)
-            logger.info("[INFO] ✅ Таблица long_positions готова")
-
-            # Таблица для SHORT (маржинальных) позиций
-            logger.info("[INFO] Проверяем таблицу short_positions...")
-            conn.execute("""
-            CREATE TABLE IF NOT EXISTS short_positions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                symbol TEXT ,
-                entry_price REAL,
-                entry_time TEXT,
-                exit_price REAL,
-                exit_time TEXT,
-                pnl_percent REAL,
-                pnl_usdt REAL,
-                order_id TEXT,
-                closed INTEGER DEFAULT 0,
-                leverage INTEGER DEFAULT 1,
-                amount REAL,
-                side TEXT,
-                fee REAL DEFAULT 0,
-                reason TEXT DEFAULT NULL,
-                pos_id TEXT
-            )
-            """)
-            logger.info("[INFO] ✅ Таблица short_positions готова")
-
+        version = migrate_db(DB_NAME, "positions")
+        logger.info(f"[INFO] ✅ Таблицы long_positions и short_positions готовы (схема v{version})")
+        position_book.load()
 
         logger.info(f"[INFO] База данных {DB_NAME} полностью готова к работе")
 
@@ -74,39 +36,14 @@ def has_open_position(symbol):
     """Проверка наличия открытой позиции в обеих таблицах: spot и short"""
     logger.debug(f"[DEBUG] 🔍 Проверяем открытые позиции для {symbol}")
     try:
-        with sqlite3.connect(DB_NAME) as conn:
-            # Проверка в SPOT
-            long_result = conn.execute("""
-                SELECT COUNT(*) FROM long_positions 
-                WHERE symbol=? AND closed=0
-            """, (symbol,)).fetchone()[0]
-
-            # Проверка в SHORT
-            short_result = conn.execute("""
-                SELECT COUNT(*) FROM short_positions 
-                WHERE symbol=? AND closed=0
-            """, (symbol,)).fetchone()[0]
-
-            if long_result > 0:
-                details = conn.execute("""
-                    SELECT entry_price, entry_time FROM long_positions 
-                    WHERE symbol=? AND closed=0 LIMIT 1
-                """, (symbol,)).fetchone()
-                logger.info(f"[INFO] ⛔ Открыта LONG-позиция по {symbol}")
-                logger.debug(f"[DEBUG] LONG: Цена входа={details[0]}, Время={details[1]}")
-
-            if short_result > 0:
-                details = conn.execute("""
-                    SELECT entry_price, entry_time FROM short_positions 
-                    WHERE symbol=? AND closed=0 LIMIT 1
-                """, (symbol,)).fetchone()
-                logger.info(f"[INFO] ⛔ Открыта SHORT-позиция по {symbol}")
-                logger.debug(f"[DEBUG] SHORT: Цена входа={details[0]}, Время={details[1]}")
-
-            if long_result == 0 and short_result == 0:
-                logger.debug(f"[DEBUG] ✅ Нет открытых позиций по {symbol}")
-
-            return (long_result + short_result) > 0
+        position = position_book.get(symbol)
+        if position is None:
+            logger.debug(f"[DEBUG] ✅ Нет открытых позиций по {symbol}")
+            return False
+
+        logger.info(f"[INFO] ⛔ Открыта {position['type'].upper()}-позиция по {symbol}")
+        logger.debug(f"[DEBUG] {position['type'].upper()}: Цена входа={position['entry_price']}, Время={position['entry_time']}")
+        return True
 
     except Exception as e:
         logger.error(f"[ERROR] ❌ Ошибка проверки позиции {symbol}: {str(e)}")
@@ -143,7 +80,7 @@ def log_position(symbol, position_type, price, timestamp, order_id,
     safe_amount = amount if amount is not None else 0.0
 
     try:
-        with sqlite3.connect(DB_NAME) as conn:
+        with transaction(DB_NAME) as conn:
             if position_type.upper() == "LONG":
                 table = "long_positions"
             elif position_type.upper() == "SHORT":
@@ -152,12 +89,7 @@ def log_position(symbol, position_type, price, timestamp, order_id,
                 logger.warning(f"[WARNING] ❓ Неизвестный тип позиции: {position_type}. Пропускаем запись.")
                 return
 
-            existing = conn.execute(
-                f"SELECT id FROM {table} WHERE symbol=? AND closed=0",
-                (symbol,)
-            ).fetchone()
-
-            if existing:
+            if position_book.get_type(symbol) == position_type.lower():
                 logger.info(f"[INFO] 🚫 Позиция {symbol} ({position_type}) уже существует и активна. Пропускаем дублирование.")
                 return
 
@@ -170,6 +102,7 @@ def log_position(symbol, position_type, price, timestamp, order_id,
                     symbol, price, timestamp, order_id, leverage,
                     safe_amount, side
                 ))
+                position_book.add(symbol, "long", price, order_id, amount=safe_amount, entry_time=timestamp)
                 logger.info(f"[INFO] ✅ LONG позиция {symbol} успешно записана")
 
             elif position_type.upper() == "SHORT":
@@ -181,6 +114,7 @@ def log_position(symbol, position_type, price, timestamp, order_id,
                     symbol, price, timestamp, order_id, leverage,
                     safe_amount, side, pos_id
                 ))
+                position_book.add(symbol, "short", price, order_id, pos_id=pos_id, amount=safe_amount, entry_time=timestamp)
                 logger.info(f"[INFO] ✅ SHORT позиция {symbol} успешно записана")
 
     except sqlite3.Error as e:
@@ -203,7 +137,8 @@ def place_long_order(
         amount_usdt: float,
         position_monitor,
         timestamp: str,
-        leverage: int
+        leverage: int,
+        ledger=None
 ) -> bool:
     """
     Размещает BUY ордер с расчётом количества контрактов (LONG позиция)
@@ -217,10 +152,12 @@ def place_long_order(
         position_monitor: Объект мониторинга позиций
         timestamp: Временная метка открытия позиции
         leverage: Плечо (по умолчанию 1)
+        ledger: Общий учёт маржи (BalanceLedger) при параллельном исполнении
 
     Returns:
         bool: True если ордер успешно размещен, False в случае ошибки
     """
+    reserved_margin = None
     try:
         formatted_symbol = f"{symbol}-USDT-SWAP"
         logger.info(f"[INFO] Начало размещения LONG позиции для {formatted_symbol}")
@@ -236,22 +173,14 @@ def place_long_order(
             logger.error(f"[ERROR] ❌ Контракт для {formatted_symbol} не найден")
             return False
 
-        # Устанавливаем плечо
-        leverage_res = account_api.set_leverage(
-            instId=formatted_symbol,
-            lever=str(leverage),
-            mgnMode="isolated",
-            posSide="long",
-        )
-        if leverage_res.get('code') != '0':
-            raise ValueError(f"Ошибка установки плеча: {leverage_res.get('msg')}")
-        logger.info(f"[INFO] ✅ Плечо {leverage}x установлено")
+        # Устанавливаем плечо (запрос к бирже только при изменении)
+        if not leverage_cache.ensure(account_api, formatted_symbol, leverage, pos_side="long"):
+            logger.info(f"[INFO] ✅ Плечо {leverage}x уже установлено")
 
         # Получаем текущую цену
-        ticker = market_api.get_ticker(formatted_symbol)
-        if ticker.get('code') != '0':
-            raise ValueError(f"Ошибка получения цены: {ticker.get('msg')}")
-        current_price = Decimal(ticker['data'][0]['last'])
+        current_price = price_cache.get(formatted_symbol, market_api)
+        if current_price is None:
+            raise ValueError(f"Ошибка получения цены для {formatted_symbol}")
         logger.info(f"[INFO] 💵 Текущая цена: {current_price}")
 
         # Расчёт количества контрактов
@@ -266,17 +195,21 @@ def place_long_order(
 
         size = calculate_size()
 
-        # Проверка свободного баланса
-        balance_data = account_api.get_account_balance(ccy="USDT")
-        if balance_data.get("code") != "0":
-            return False
-
-        available_balance = Decimal(balance_data['data'][0]['details'][0]['availBal'])
+        # Проверка свободного баланса: через общий учёт маржи или прямым запросом
         required_margin = (size * current_price) / Decimal(leverage)
-
-        if available_balance < required_margin:
-            logger.error(f"[ERROR] 💸 Недостаточно средств: нужно {required_margin}, доступно {available_balance}")
-            return False
+        if ledger is not None:
+            if not ledger.reserve(required_margin):
+                return False
+            reserved_margin = required_margin
+        else:
+            balance_data = account_api.get_account_balance(ccy="USDT")
+            if balance_data.get("code") != "0":
+                return False
+
+            available_balance = Decimal(balance_data['data'][0]['details'][0]['availBal'])
+            if available_balance < required_margin:
+                logger.error(f"[ERROR] 💸 Недостаточно средств: нужно {required_margin}, доступно {available_balance}")
+                return False
 
         logger.info(f"[INFO] 📤 Отправка ордера на покупку...")
         order = trade_api.place_order(
@@ -300,6 +233,13 @@ def place_long_order(
 
         order_id = order['data'][0].get('ordId')
         logger.info(f"[INFO] 🎉 Ордер успешно размещен. ID: {order_id}")
+        if reserved_margin is not None:
+            ledger.commit(reserved_margin)
+            reserved_margin = None
+
+        # Как и для SHORT, возвращаемся после подтверждения исполнения — OrderPipeline
+        # считает задержку сигнал→исполнение одинаково для обеих сторон
+        fill_waiter.wait(trade_api, formatted_symbol, order_id)
 
         log_position(
             symbol=formatted_symbol,
@@ -323,6 +263,10 @@ def place_long_order(
     except Exception as e:
         logger.error(f"[ERROR] 🔥 Критическая ошибка: {str(e)}")
         return False
+    finally:
+        # Ордер не отправлен — возвращаем зарезервированную маржу
+        if reserved_margin is not None:
+            ledger.release(reserved_margin)
 
 
 
@@ -331,11 +275,10 @@ def get_swap_contract(symbol: str, market_api, account_api) -> dict:
     Возвращает данные контракта (включая ctVal) для symbol, например 'BTC'
     """
     try:
-        contracts = account_api.get_instruments(instType="SWAP")
-        for contract in contracts.get("data", []):
-            if contract["instId"].startswith(f"{symbol.upper()}-USDT"):
-                logger.info(contract)
-                return contract
+        contract = instrument_registry.get(f"{symbol.upper()}-USDT-SWAP", account_api)
+        if contract:
+            logger.info(contract)
+            return contract
         raise ValueError(f"Контракт для {symbol} не найден")
     except Exception as e:
         raise RuntimeError(f"Ошибка при получении контракта: {e}")
@@ -348,14 +291,15 @@ def fetch_pos_id(account_api, inst_id: str, pos_side: str = "short") -> Optional
     :param pos_side: "short" или "long"
     :return: posId или None если не найдено
     """
-    res = account_api.get_positions(instType="SWAP", instId=inst_id)
-    if res.get("code") != "0":
-        logger.error(f"[ERROR] Ошибка получения позиций: {res.get('msg')}")
+    try:
+        # Канал positions мог уже прислать позицию; иначе — свежий снимок с биржи
+        pos = (position_snapshot.get(inst_id, pos_side)
+               or position_snapshot.get(inst_id, pos_side, account_api=account_api, force=True))
+    except RuntimeError as e:
+        logger.error(f"[ERROR] {e}")
         return None
-    positions = res.get("data", [])
-    for pos in positions:
-        if pos.get("instId") == inst_id and pos.get("posSide") == pos_side and float(pos.get("pos", "0")) > 0:
-            return pos.get("posId")
+    if pos is not None and float(pos.get("pos", "0")) > 0:
+        return pos.get("posId")
     return None
 
 def place_sell_order(
@@ -366,7 +310,8 @@ def place_sell_order(
         amount_usdt: float,
         position_monitor,
         timestamp: str,
-        leverage: int
+        leverage: int,
+        ledger=None
 ) -> bool:
     """
     Размещает SELL ордер с расчётом количества контрактов (SHORT позиция)
@@ -380,10 +325,12 @@ def place_sell_order(
         position_monitor: Объект мониторинга позиций
         timestamp: Временная метка открытия позиции
         leverage: Плечо (по умолчанию 4)
+        ledger: Общий учёт маржи (BalanceLedger) при параллельном исполнении
 
     Returns:
         bool: True если ордер успешно размещен, False в случае ошибки
     """
+    reserved_margin = None
     try:
         # 0. Форматируем символ для OKX
         formatted_symbol = f"{symbol}-USDT-SWAP"
@@ -401,22 +348,14 @@ def place_sell_order(
             logger.error(f"[ERROR] ❌ Контракт для {formatted_symbol} не найден")
             return False
 
-        # 3. Устанавливаем плечо
-        leverage_res = account_api.set_leverage(
-            instId=formatted_symbol,
-            lever=str(leverage),
-            mgnMode="isolated",
-            posSide="short",
-        )
-        if leverage_res.get('code') != '0':
-            raise ValueError(f"Ошибка установки плеча: {leverage_res.get('msg')}")
-        logger.info(f"[INFO] ✅ Плечо {leverage}x установлено")
+        # 3. Устанавливаем плечо (запрос к бирже только при изменении)
+        if not leverage_cache.ensure(account_api, formatted_symbol, leverage, pos_side="short"):
+            logger.info(f"[INFO] ✅ Плечо {leverage}x уже установлено")
 
         # 4. Получаем текущую цену
-        ticker = market_api.get_ticker(formatted_symbol)
-        if ticker.get('code') != '0':
-            raise ValueError(f"Ошибка получения цены: {ticker.get('msg')}")
-        current_price = Decimal(ticker['data'][0]['last'])
+        current_price = price_cache.get(formatted_symbol, market_api)
+        if current_price is None:
+            raise ValueError(f"Ошибка получения цены для {formatted_symbol}")
         logger.info(f"[INFO] 💵 Текущая цена: {current_price}")
 
         # 5. Расчёт количества контрактов: USDT / (цена * размер_контракта)
@@ -432,16 +371,20 @@ def place_sell_order(
 
         size = calculate_size()
 
-        # 6. Размещение ордера
-        balance_data = account_api.get_account_balance(ccy="USDT")
-        if balance_data.get("code") != "0":
-            return False
-
-        available_balance = Decimal(balance_data['data'][0]['details'][0]['availBal'])
+        # 6. Проверка маржи: через общий учёт при параллельном исполнении или прямым запросом
         required_margin = (size * current_price) / Decimal(leverage)
-
-        if available_balance < required_margin:
-            return False
+        if ledger is not None:
+            if not ledger.reserve(required_margin):
+                return False
+            reserved_margin = required_margin
+        else:
+            balance_data = account_api.get_account_balance(ccy="USDT")
+            if balance_data.get("code") != "0":
+                return False
+
+            available_balance = Decimal(balance_data['data'][0]['details'][0]['availBal'])
+            if available_balance < required_margin:
+                return False
 
         logger.info(f"[INFO] 📤 Отправка ордера на продажу...")
         order = trade_api.place_order(
@@ -465,8 +408,12 @@ def place_sell_order(
 
         order_id = order['data'][0].get('ordId')
         logger.info(f"[INFO] 🎉 Ордер успешно размещен. ID: {order_id}")
+        if reserved_margin is not None:
+            ledger.commit(reserved_margin)
+            reserved_margin = None
 
-        time.sleep(2)
+        # posId появляется после исполнения — ждём подтверждения вместо фиксированной паузы
+        fill_waiter.wait(trade_api, formatted_symbol, order_id)
 
         pos_id = fetch_pos_id(account_api, formatted_symbol, pos_side="short")
         if not pos_id:
@@ -496,4 +443,8 @@ def place_sell_order(
     except Exception as e:
         logger.error(f"[ERROR] 🔥 Критическая ошибка: {str(e)}")
         return False
+    finally:
+        # Ордер не отправлен — возвращаем зарезервированную маржу
+        if reserved_margin is not None:
+            ledger.release(reserved_margin)
 
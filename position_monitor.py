@@ -1,23 +1,44 @@
 import threading
 import time
-from typing import Dict, Tuple
+from typing import Dict, List, Tuple
 from datetime import datetime, timedelta
 from notoficated import send_position_closed_message
 import traceback
 from typing import Optional
 from decimal import Decimal, InvalidOperation
-import sqlite3
-from TimerStorage import TimerStorage
-from DatabaseManger import DatabaseManager
-from config import LEVERAGE
+from TimerStorage import TimerStorage, DELETE_TIMER_QUERY
+from config import LEVERAGE, POSITIONS_DB, TIMERS_DB
+from storage import transaction
+from PositionBook import position_book
+from InstrumentRegistry import instrument_registry
+from TimerScheduler import TimerHandle, timer_scheduler
+from PositionSnapshot import position_snapshot
+from PriceCache import price_cache
+from OrderBatcher import OrderBatcher
+from FillWaiter import fill_waiter
+from concurrent.futures import ThreadPoolExecutor
+from Reconciler import fetch_positions_history
 
 
 import logging
 logger = logging.getLogger(__name__)
 
+# Страниц истории позиций на один опрос закрытий (по 100 записей)
+CLOSE_HISTORY_PAGES = 5
+
+# {table} — long_positions или short_positions
+ENTRY_BY_ORDER_QUERY = "SELECT entry_price, entry_time FROM {table} WHERE order_id = ?"
+CLOSE_POSITION_QUERY = """
+    UPDATE {table}
+    SET pnl_usdt = ?, pnl_percent = ?, exit_price = ?, closed = 1, exit_time = ?, reason = ?, fee = ?
+    WHERE order_id = ? AND closed = 0
+"""
+
 class PositionMonitor:
     def __init__(self, trade_api, account_api, market_api, close_after_minutes, profit_threshold,
-                 on_position_closed=None, timer_storage=None, sheet_logger=None, db_path="data/positions.db"):
+                 on_position_closed=None, timer_storage=None, sheet_logger=None, db_path=POSITIONS_DB,
+                 scheduler=None, close_batch_window: float = 0.5, restore_timers: bool = True,
+                 history_deadline: float = 10, close_workers: int = 4):
         """
         Инициализация монитора позиций
 
@@ -26,12 +47,19 @@ class PositionMonitor:
         :param market_api: API для получения рыночных данных
         :param close_after_minutes: Через сколько минут закрывать позицию (по умолчанию 3)
         :param profit_threshold: При каком проценте прибыли закрывать досрочно (по умолчанию 50%)
+        :param restore_timers: восстановить таймеры сразу; при False — вызвать
+                               _restore_timers() после загрузки позиций (init_db)
+        :param history_deadline: сколько ждать появления закрытия в истории позиций OKX, сек
+        :param close_workers: потоки записи закрытий — ожидание истории OKX идёт в них,
+                              а не в потоках планировщика таймеров
         """
         self.trade_api = trade_api
+        self.order_batcher = OrderBatcher(trade_api)
         self.account_api = account_api
         self.market_api = market_api
-        self.price_cache = {}
-        self.timers: Dict[str, threading.Timer] = {}
+        self.price_cache = price_cache
+        self.scheduler = scheduler or timer_scheduler
+        self.timers: Dict[str, TimerHandle] = {}
         self.close_after_seconds = close_after_minutes * 60
         self.profit_threshold = profit_threshold
         self.lock = threading.Lock()
@@ -40,13 +68,25 @@ class PositionMonitor:
         self.on_position_closed = on_position_closed or send_position_closed_message
         self.sheet_logger = sheet_logger
         self.timer_storage = timer_storage or TimerStorage()
-        self._restore_timers()
-        self.db = DatabaseManager(db_path)
+        self.db_path = db_path
+        self.close_batch_window = close_batch_window
+        self.history_deadline = history_deadline
+        self._close_executor = ThreadPoolExecutor(max_workers=close_workers, thread_name_prefix="close")
+        self._expired = set()
+        self._flush_handle = None
+        self._closing = set()
+        if restore_timers:
+            self._restore_timers()
         logger.info(
             f"Инициализирован монитор позиций: авто-закрытие через {close_after_minutes} мин, цель прибыли {profit_threshold}%")
 
     def _restore_timers(self):
-        """Восстановление таймеров из хранилища при запуске бота"""
+        """
+        Восстановление таймеров из хранилища при запуске бота
+
+        Все записи читаются одним запросом и ставятся в общий планировщик;
+        просроченные закрываются им же сразу, не задерживая старт.
+        """
         active_positions = self.timer_storage.get_active_positions()  # должен возвращать dict symbol -> {'entry_time': float, 'elapsed_time': float}
         current_time = time.time()
 
@@ -65,16 +105,19 @@ class PositionMonitor:
 
             if remaining <= 0:
                 logger.info(f"[Timer] Время таймера по {symbol} истекло при восстановлении, закрываем позицию...")
-                pos_type = self._get_position_type(symbol)
-                self._close_position(symbol, pos_type)
-                self.timer_storage.close_position(symbol)
+                self._start_timer(symbol, 0, persist=False)
             else:
                 # Запускаем таймер с оставшимся временем
-                self._start_timer(symbol, remaining)
+                self._start_timer(symbol, remaining, persist=False)
                 logger.info(f"[Timer] Восстановлен таймер {symbol}, осталось: {remaining:.1f} сек")
 
-    def _start_timer(self, symbol: str, interval: Optional[float] = None):
-        """Запускает таймер, если он ещё не запущен и позиция активна"""
+    def _start_timer(self, symbol: str, interval: Optional[float] = None, persist: bool = True):
+        """
+        Запускает таймер, если он ещё не запущен и позиция активна
+
+        :param persist: записать таймер в хранилище (False при восстановлении —
+                        запись там уже есть)
+        """
         if interval is None:
             interval = self.close_after_seconds
 
@@ -88,21 +131,14 @@ class PositionMonitor:
                 logger.info(f"[Timer] Нет активной позиции для {symbol}, таймер не запускаем.")
                 return
 
-            # Проверяем, есть ли позиция в хранилище таймеров
-            if self.timer_storage and self.timer_storage.has_position(symbol):
-                logger.info(f"[Timer] Позиция {symbol} уже есть в хранилище таймеров, таймер не перезаписываем.")
-            else:
-                # Добавляем запись в хранилище с текущим временем
-                if self.timer_storage:
-                    self.timer_storage.safe_add_position(symbol, time.time(), 0)
+            # Добавляем запись в хранилище с текущим временем (дубль игнорируется)
+            if persist and self.timer_storage:
+                if self.timer_storage.safe_add_position(symbol, time.time(), 0):
                     logger.info(f"[Timer] Записали позицию {symbol} в хранилище таймеров.")
+                else:
+                    logger.info(f"[Timer] Позиция {symbol} уже есть в хранилище таймеров, таймер не перезаписываем.")
 
-            pos_type = self._get_position_type(symbol)
-
-            timer = threading.Timer(interval, self._close_position, args=(symbol, pos_type, None, None, None, None, "timeout"))
-            timer.daemon = True
-            timer.start()
-            self.timers[symbol] = timer
+            self.timers[symbol] = self.scheduler.schedule(interval, self._on_timer_expired, symbol)
 
             logger.info(f"[Timer] Запущен таймер для {symbol} на {interval:.1f} сек")
 
@@ -118,31 +154,43 @@ class PositionMonitor:
 
     def has_active_position(self, symbol: str) -> bool:
         """Проверка активности позиции"""
-        with sqlite3.connect("data/positions.db") as conn:
-            result = conn.execute("""
-                SELECT 1 FROM (
-                    SELECT symbol FROM long_positions WHERE symbol=? AND closed=0
-                    UNION ALL
-                    SELECT symbol FROM short_positions WHERE symbol=? AND closed=0
-                ) LIMIT 1
-            """, (symbol, symbol)).fetchone()
-            return result is not None
+        return position_book.has(symbol)
 
     def stop_all_timers(self):
         """Останавливает все таймеры, но НЕ удаляет их из хранилища"""
         for symbol, timer in list(self.timers.items()):
             timer.cancel()
         self.timers.clear()
-        logger.info("Все таймеры остановлены (но сохранены в хранилище)")
+        logger.info(f"Все таймеры остановлены (но сохранены в хранилище), метрики: {self.scheduler.stats()}")
+
+    def closing(self) -> frozenset:
+        """Символы, закрытие которых начато, но ещё не записано в БД"""
+        with self.lock:
+            return frozenset(self._closing)
+
+    def _begin_close(self, symbol: str) -> bool:
+        """Отмечает начало закрытия; False, если позиция уже закрывается"""
+        with self.lock:
+            if symbol in self._closing:
+                return False
+            self._closing.add(symbol)
+            return True
+
+    def _end_close(self, symbol: str):
+        with self.lock:
+            self._closing.discard(symbol)
+
+    def timer_stats(self) -> dict:
+        """Метрики планировщика таймеров: ожидающие и задержка срабатывания"""
+        return self.scheduler.stats()
 
     def _round_contract_size(self, symbol: str, amount: Decimal) -> str:
         try:
-            instruments = self.account_api.get_instruments(instType="SWAP")
-            for inst in instruments.get("data", []):
-                if inst["instId"] == symbol:
-                    lot_size = Decimal(inst["lotSz"])
-                    rounded = (amount // lot_size) * lot_size
-                    return str(rounded.normalize())
+            inst = instrument_registry.get(symbol, self.account_api)
+            if inst:
+                lot_size = Decimal(inst["lotSz"])
+                rounded = (amount // lot_size) * lot_size
+                return str(rounded.normalize())
         except Exception as e:
             logger.error(f"Ошибка при округлении размера контракта {symbol}: {e}")
         return "0"
@@ -150,24 +198,12 @@ class PositionMonitor:
     def _check_position(self, symbol: str, current_price: Optional[Decimal] = None) -> None:
         """Проверяет условия для закрытия LONG или SHORT позиции по WebSocket"""
         try:
-            with sqlite3.connect("data/positions.db") as conn:
-                    row = conn.execute("""
-                        SELECT entry_price, 'short' AS type
-                        FROM short_positions
-                        WHERE symbol = ? AND closed = 0
-                        LIMIT 1
-                    """, (symbol,)).fetchone()
-
-            if not row:
-                row = conn.execute("""
-                    SELECT entry_price, 'long' AS type
-                    FROM long_positions
-                    WHERE symbol = ? AND closed = 0
-                    LIMIT 1
-                """, (symbol,)).fetchone()
-
-            entry_price = Decimal(str(row[0]))
-            pos_type = row[1]
+            position = position_book.get(symbol)
+            if position is None:
+                return
+
+            entry_price = Decimal(str(position["entry_price"]))
+            pos_type = position["type"]
 
             # Получение текущей цены, если не передана
             if current_price is None:
@@ -217,148 +253,266 @@ class PositionMonitor:
             logger.error(f"[ERROR] Проверка позиции {symbol} завершилась с ошибкой: {e}")
 
     def _get_current_price(self, symbol: str) -> Optional[Decimal]:
-        """Получает текущую цену с использованием кеша"""
-        try:
-            if symbol in self.price_cache:
-                return self.price_cache[symbol]
+        """Получает текущую цену из кеша (не старше PRICE_MAX_AGE, иначе пакетное обновление)"""
+        return self.price_cache.get(symbol, self.market_api)
 
-            data = self.market_api.get_ticker(symbol)
-            logger.info(f"Ответ от OKX для {symbol}: {data}")
+    def _get_order_id_from_db(self, symbol: str, pos_type: str) -> Optional[str]:
+        position = position_book.get(symbol)
+        if position is None or position["type"] != pos_type:
+            return None
+        return position["order_id"]
 
-            if data.get("code") == "0" and data.get("data"):
-                price = Decimal(data["data"][0]["last"])
-                self.price_cache[symbol] = price
-                return price
+    def _on_timer_expired(self, symbol: str):
+        """
+        Таймер позиции истёк
 
-        except Exception as e:
-            logger.error(f"Ошибка при получении цены для {symbol}: {e}")
-        return None
+        Истёкшие за close_batch_window секунд позиции закрываются вместе
+        (массовое истечение после перезапуска — несколько пакетных запросов).
+        """
+        with self.lock:
+            self._expired.add(symbol)
+            if self._flush_handle is None:
+                self._flush_handle = self.scheduler.schedule(self.close_batch_window, self._flush_expired)
 
-    def _get_order_id_from_db(self, symbol: str, pos_type: str) -> Optional[str]:
-        table = "long_positions" if pos_type == "long" else "short_positions"
+    def _flush_expired(self):
+        with self.lock:
+            symbols, self._expired = list(self._expired), set()
+            self._flush_handle = None
+        if len(symbols) == 1:
+            self._close_position(symbols[0], self._get_position_type(symbols[0]), reason="timeout")
+        elif symbols:
+            self.close_positions(symbols, reason="timeout")
+
+    def _release_timer(self, symbol: str):
+        """Снимает таймер позиции и удаляет его из хранилища"""
+        with self.lock:
+            timer = self.timers.pop(symbol, None)
+            if timer is not None:
+                timer.cancel()
+
+            if self.timer_storage:
+                self.timer_storage.close_position(symbol)
+
+    def _delete_timer_record(self, symbol: str):
         try:
-            with sqlite3.connect("data/positions.db") as conn:
-                row = conn.execute(f"""
-                    SELECT order_id FROM {table} WHERE symbol = ? AND closed = 0 LIMIT 1
-                """, (symbol,)).fetchone()
-                return row[0] if row else None
+            with transaction(TIMERS_DB) as conn:
+                conn.execute(DELETE_TIMER_QUERY, (symbol,))
         except Exception as e:
-            logger.error(f"Ошибка при получении order_id из БД для {symbol}: {e}")
-            return None
+            logger.error(f"[ERROR] ❌ Ошибка при удалении таймера из timers.db: {e}")
 
-    def _close_position(self, symbol: str, pos_type: str,
-                        entry_price: Optional[float] = None,
-                        current_price: Optional[float] = None,
-                        pnl: Optional[float] = None,
-                        profit_pct: Optional[float] = None,
-                        reason: str = None):
-        try:
-            with self.lock:
+    def _prepare_close(self, symbol: str, pos_type: str, profit_pct: Optional[float] = None,
+                       reason: str = None, refresh_balance: bool = True) -> Tuple[Optional[dict], str]:
+        """
+        Снимает таймер и готовит ордер на закрытие
 
-                if symbol in self.timers:
-                    self.timers[symbol].cancel()
-                    del self.timers[symbol]
+        :param refresh_balance: принудительно обновить снимок позиций перед чтением объёма
+        :return: (параметры place_order или None, если отправлять нечего; причина закрытия)
+        """
+        self._release_timer(symbol)
 
-                if self.timer_storage:
-                    self.timer_storage.close_position(symbol)
+        if reason is None:
+            if pos_type == "long":
+                reason = "timeout"  # Для SPOT только timeout
+            elif pos_type == "short":
+                if profit_pct and profit_pct >= self.profit_threshold:
+                    reason = "target"
+                else:
+                    reason = "timeout"
+
+        logger.debug(f"[DEBUG] Закрытие {symbol} ({pos_type}), reason: {reason}")
+
+        if not self.has_active_position(symbol):
+            logger.info(f"[Close] Позиция {symbol} уже закрыта, ничего делать не нужно.")
+            return None, reason
+
+        # Проверка — закрыта ли позиция на бирже
+        amount, pos_side = self._get_contract_balance(symbol, force=refresh_balance)
+        if amount == 0:
+            logger.info(f"[INFO] {pos_type.upper()} позиция {symbol} уже закрыта на бирже. Обновляем БД.")
+            if self._begin_close(symbol):  # отметку снимает _update_position_in_db
+                self._submit_close_records([(symbol, pos_type, self._get_order_id_from_db(symbol, pos_type), reason, None)])
+            return None, reason
+
+        # Получаем order_id открытой позиции
+        position = position_book.get(symbol)
+        if position is None or position["type"] != pos_type:
+            logger.error(f"[ERROR] Позиция {symbol} ({pos_type}) не найдена среди открытых или уже закрыта.")
+            return None, reason
+
+        logger.debug(f"[DEBUG] Параметры закрытия позиции {symbol}: Тип={pos_type}, OrderID={position['order_id']}")
+
+        if pos_type not in ("long", "short"):
+            logger.error(f"[ERROR] Неизвестный тип позиции при закрытии: {pos_type}")
+            return None, reason
+
+        if amount <= 0:
+            logger.warning(f"[ABORT] Пустой контрактный баланс {pos_type.upper()} для {symbol}.")
+            return None, reason
+
+        # С этого момента Reconciler не трогает позицию; отметку снимает _update_position_in_db
+        # (или _finish_close, если ордер не прошёл)
+        if not self._begin_close(symbol):
+            logger.info(f"[Close] Позиция {symbol} уже закрывается, пропускаем.")
+            return None, reason
+
+        return {
+            "instId": symbol,
+            "tdMode": "isolated",
+            "side": "sell" if pos_type == "long" else "buy",  # Закрываем long — sell, short — buy
+            "posSide": pos_side,
+            "ordType": "market",
+            "sz": self._round_contract_size(symbol, amount),
+            "reduceOnly": True,
+        }, reason
+
+    def _finish_close(self, symbol: str, pos_type: str, order: dict,
+                      entry_price: Optional[float] = None,
+                      current_price: Optional[float] = None,
+                      pnl: Optional[float] = None,
+                      profit_pct: Optional[float] = None,
+                      reason: str = None,
+                      wait: bool = True) -> Optional[tuple]:
+        """
+        Обрабатывает ответ биржи на ордер закрытия
 
+        :return: закрытие для _submit_close_records (symbol, pos_type, order_id, reason, data_to_log)
+                 или None, если ордер отклонён
+        """
+        order_id = self._get_order_id_from_db(symbol, pos_type)
 
-            if reason is None:
-                if pos_type == "long":
-                    reason = "timeout"  # Для SPOT только timeout
-                elif pos_type == "short":
-                    if profit_pct and profit_pct >= self.profit_threshold:
-                        reason = "target"
-                    else:
-                        reason = "timeout"
+        if order.get("code") != "0":
+            logger.error(f"[ERROR] Ордер на закрытие {symbol} отклонён: {order.get('code')} {order.get('msg')}")
+            self._end_close(symbol)
+            return None
 
-            logger.debug(f"[DEBUG] Закрытие {symbol} ({pos_type}), reason: {reason}")
+        if not order.get("data"):
+            logger.warning(f"[WARNING] Ордер закрыт успешно, но нет данных в ответе: {order}")
+        else:
+            real_order_id = order["data"][0].get("ordId", order_id)
+            logger.info(f"[SUCCESS] Ордер на закрытие отправлен: {real_order_id}")
+            # Ждём подтверждения исполнения, а не фиксированные 2 сек
+            if wait:
+                fill_waiter.wait(self.trade_api, symbol, order["data"][0].get("ordId"))
+
+        data_to_log = {
+            "symbol": symbol,
+            "pos_type": pos_type,
+            "entry_price": entry_price,
+            "close_price": current_price,
+            "pnl_usd": pnl,
+            "pnl_percent": profit_pct,
+            "reason": reason
+        }
+        return symbol, pos_type, order_id, reason, data_to_log
+
+    def _submit_close_records(self, closes: List[tuple]):
+        """
+        Запись закрытий в фоне: история OKX отстаёт от исполнения на секунды,
+        и ждать её в потоке таймера или сигнала нельзя
 
-            if not self.has_active_position(symbol):
-                logger.info(f"[Close] Позиция {symbol} уже закрыта, ничего делать не нужно.")
-                return
+        :param closes: (symbol, pos_type, order_id, reason, data_to_log) — один опрос истории на все
+        """
+        if closes:
+            self._close_executor.submit(self._record_closes, closes)
 
-            # Проверка — закрыта ли позиция на бирже
-            amount, pos_side = self._get_contract_balance(symbol)
-            if amount == 0:
-                logger.info(f"[INFO] {pos_type.upper()} позиция {symbol} уже закрыта на бирже. Обновляем БД.")
-                self._update_position_in_db(symbol, pos_type, self._get_order_id_from_db(symbol, pos_type), reason)
-                return
+    def _record_closes(self, closes: List[tuple]):
+        closed = self._update_positions_in_db([close[:4] for close in closes])
+        for symbol, _, _, _, data_to_log in closes:
+            if not closed.get(symbol) or data_to_log is None:
+                continue
 
-            # Получаем order_id из БД
-            with sqlite3.connect("data/positions.db") as conn:
-                table = "long_positions" if pos_type == "long" else "short_positions"
-                row = conn.execute(f"""
-                    SELECT order_id FROM {table}
-                    WHERE symbol = ? AND closed = 0
-                    LIMIT 1
-                """, (symbol,)).fetchone()
-
-                if row is None:
-                    logger.error(f"[ERROR] Позиция {symbol} не найдена в таблице {table} или уже закрыта.")
-                    return
+            logger.debug(f"[DEBUG] Данные для Google Sheets: {data_to_log}")
+
+            if self.sheet_logger:
+                success = self.sheet_logger.log_closed_position(data_to_log)
+                if not success:
+                    logger.warning(f"[WARNING] Не удалось записать позицию {symbol} в Google Sheets")
+            else:
+                logger.warning("[WARNING] Логгер Google Sheets не инициализирован")
 
-                order_id = row[0]
+    def _close_position(self, symbol: str, pos_type: str,
+                        entry_price: Optional[float] = None,
+                        current_price: Optional[float] = None,
+                        pnl: Optional[float] = None,
+                        profit_pct: Optional[float] = None,
+                        reason: str = None):
+        try:
+            request, reason = self._prepare_close(symbol, pos_type, profit_pct, reason)
+            if request is None:
+                return
 
-            logger.debug(f"[DEBUG] Параметры закрытия позиции {symbol}: Тип={pos_type}, OrderID={order_id}")
+            # Параллельные закрытия из других потоков уходят одним пакетным запросом
+            try:
+                order = self.order_batcher.place_order(**request)
+                close = self._finish_close(symbol, pos_type, order, entry_price, current_price, pnl, profit_pct, reason)
+                if close is not None:
+                    self._submit_close_records([close])
+            except Exception:
+                self._end_close(symbol)
+                raise
 
-            # Закрытие позиции
-            if pos_type in ("long", "short"):
-                if amount <= 0:
-                    logger.warning(f"[ABORT] Пустой контрактный баланс {pos_type.upper()} для {symbol}.")
-                    return
+        finally:
+            self._delete_timer_record(symbol)
 
-                sz = self._round_contract_size(symbol, amount)
-                order = self.trade_api.place_order(
-                    instId=symbol,
-                    tdMode="isolated",
-                    side="sell" if pos_type == "long" else "buy",  # Закрываем long — sell, short — buy
-                    posSide=pos_side,
-                    ordType="market",
-                    sz=sz,
-                    reduceOnly=True
-                )
+    def close_positions(self, symbols: List[str], reason: str = "timeout"):
+        """
+        Закрывает несколько позиций пакетами place_multiple_orders (до 20 в запросе)
 
-            else:
-                logger.error(f"[ERROR] Неизвестный тип позиции при закрытии: {pos_type}")
-                return
+        Объёмы берутся из одного обновления снимка позиций, результаты
+        сопоставляются с позициями по clOrdId, записи истории закрытий —
+        из одного постраничного запроса на весь пакет.
+        """
+        logger.info(f"[Close] Пакетное закрытие {len(symbols)} позиций ({reason})")
+        try:
+            position_snapshot.refresh(self.account_api)
+        except Exception as e:
+            logger.error(f"[ERROR] Не удалось обновить снимок позиций: {e}")
 
-            # Проверка результата
-            if order.get("code") == "0":
-                if not order.get("data"):
-                    logger.warning(f"[WARNING] Ордер закрыт успешно, но нет данных в ответе: {order}")
-                else:
-                    real_order_id = order["data"][0].get("ordId", order_id)
-                    logger.info(f"[SUCCESS] Ордер на закрытие отправлен: {real_order_id}")
-                time.sleep(2)
-
-                self._update_position_in_db(symbol, pos_type, order_id, reason)
-
-                data_to_log = {
-                    "symbol": symbol,
-                    "pos_type": pos_type,
-                    "entry_price": entry_price,
-                    "close_price": current_price,
-                    "pnl_usd": pnl,
-                    "pnl_percent": profit_pct,
-                    "reason": reason
-                }
-
-                logger.debug(f"[DEBUG] Данные для Google Sheets: {data_to_log}")
-
-                if self.sheet_logger:
-                    success = self.sheet_logger.log_closed_position(data_to_log)
-                    if not success:
-                        logger.warning(f"[WARNING] Не удалось записать позицию {symbol} в Google Sheets")
+        prepared = []
+        for symbol in symbols:
+            try:
+                pos_type = self._get_position_type(symbol)
+                request, close_reason = self._prepare_close(symbol, pos_type, reason=reason, refresh_balance=False)
+                if request is not None:
+                    prepared.append((symbol, pos_type, request, close_reason))
                 else:
-                    logger.warning("[WARNING] Логгер Google Sheets не инициализирован")
+                    self._delete_timer_record(symbol)
+            except Exception as e:
+                logger.error(f"[ERROR] Подготовка закрытия {symbol} завершилась с ошибкой: {e}")
+                self._delete_timer_record(symbol)
 
-        finally:
+        if not prepared:
+            return
+
+        try:
+            results = self.order_batcher.place_batch([request for _, _, request, _ in prepared])
+        except Exception:
+            for symbol, *_ in prepared:
+                self._end_close(symbol)
+                self._delete_timer_record(symbol)
+            raise
+
+        # Исполнение всех ордеров пакета подтверждаем параллельно
+        placed = [(symbol, order["data"][0].get("ordId"))
+                  for (symbol, *_), order in zip(prepared, results)
+                  if order.get("code") == "0" and order.get("data")]
+        if placed:
+            with ThreadPoolExecutor(max_workers=min(len(placed), 8)) as pool:
+                list(pool.map(lambda item: fill_waiter.wait(self.trade_api, *item), placed))
+
+        # История закрытий всего пакета — одним опросом в фоне
+        closes = []
+        for (symbol, pos_type, _, close_reason), order in zip(prepared, results):
             try:
-                with sqlite3.connect("data/timers.db") as conn:
-                    conn.execute("DELETE FROM active_timers WHERE symbol=?", (symbol,))
+                close = self._finish_close(symbol, pos_type, order, reason=close_reason, wait=False)
+                if close is not None:
+                    closes.append(close)
             except Exception as e:
-                logger.error(f"[ERROR] ❌ Ошибка при удалении таймера из timers.db: {e}")
+                logger.error(f"[ERROR] Обработка закрытия {symbol} завершилась с ошибкой: {e}")
+                self._end_close(symbol)
+            finally:
+                self._delete_timer_record(symbol)
+        self._submit_close_records(closes)
 
     def _get_balance(self, currency: str) -> Decimal:
         """Получает доступный баланс валюты для spot"""
@@ -388,7 +542,58 @@ class PositionMonitor:
             logger.error(f"Ошибка при получении баланса для {currency}: {e}")
             return Decimal("0")
 
-    def _update_position_in_db(self, symbol: str, pos_type: str, order_id: Optional[str], reason: str = None):
+    def _update_position_in_db(self, symbol: str, pos_type: str, order_id: Optional[str], reason: str = None) -> bool:
+        """
+        Записывает закрытие в БД и уведомляет о нём
+
+        :return: True, если запись закрыта этим вызовом (не сверкой или ликвидацией раньше)
+        """
+        return self._update_positions_in_db([(symbol, pos_type, order_id, reason)]).get(symbol, False)
+
+    def _close_entry(self, symbol: str, pos_type: str, order_id: Optional[str]) -> Tuple[float, Optional[str]]:
+        """(entry_price, entry_time) открытой позиции, для уже закрытой — из БД по order_id"""
+        position = position_book.get(symbol)
+        if position is not None and position["type"] == pos_type:
+            return float(position["entry_price"] or 0.0), position["entry_time"]
+        table = "long_positions" if pos_type == "long" else "short_positions"
+        with transaction(self.db_path) as conn:
+            row = conn.execute(ENTRY_BY_ORDER_QUERY.format(table=table), (order_id,)).fetchone()
+        return (float(row[0]), row[1]) if row else (0.0, None)
+
+    def _update_positions_in_db(self, closes: List[tuple]) -> Dict[str, bool]:
+        """
+        Записывает закрытия (symbol, pos_type, order_id, reason) в БД и уведомляет о них
+
+        Записи истории OKX для всех закрытий берутся одним опросом.
+        :return: symbol -> запись закрыта этим вызовом
+        """
+        try:
+            entries = {}
+            for symbol, pos_type, order_id, _ in closes:
+                try:
+                    entries[symbol] = self._close_entry(symbol, pos_type, order_id)
+                except Exception as e:
+                    logger.error(f"[ERROR] Не удалось получить вход позиции {symbol}: {e}")
+                    entries[symbol] = (0.0, None)
+
+            # Записи истории именно этих закрытий: история OKX отстаёт от исполнения
+            records = self._get_close_records(
+                [(symbol, pos_type, entries[symbol][1]) for symbol, pos_type, _, _ in closes])
+            return {
+                symbol: self._write_close(symbol, pos_type, order_id, reason, entries[symbol][0], records.get(symbol))
+                for symbol, pos_type, order_id, reason in closes
+            }
+        finally:
+            for symbol, *_ in closes:
+                self._end_close(symbol)
+
+    def _write_close(self, symbol: str, pos_type: str, order_id: Optional[str], reason: str,
+                     entry_price: float, record: Optional[dict]) -> bool:
+        """
+        Записывает одно закрытие по записи истории record и уведомляет о нём
+
+        :return: True, если запись закрыта этим вызовом (не сверкой или ликвидацией раньше)
+        """
         try:
             logger.info(f"Обновляем позицию в БД для {symbol} ({pos_type}), order_id={order_id}")
 
@@ -398,27 +603,9 @@ class PositionMonitor:
                 logger.error(f"[ERROR] Не удалось получить цену для {symbol}")
                 current_price = Decimal("0")
 
-            pnl_data = self._get_realized_pnl(symbol, pos_type)
-
-            pnl_usdt, pnl_percent = pnl_data
-
-            fee = self._get_fee_for_position(symbol, pos_type, order_id)
-
-            # Получаем entry_price из БД
-            with sqlite3.connect("data/positions.db") as conn:
-                table = "long_positions" if pos_type == "long" else "short_positions"
-                row = conn.execute(
-                    f"SELECT entry_price FROM {table} WHERE order_id = ?",
-                    (order_id,)
-                ).fetchone()
-
-                if not row:
-                    row = conn.execute(
-                        f"SELECT entry_price FROM {table} WHERE symbol = ? AND closed = 0",
-                        (symbol,)
-                    ).fetchone()
-
-                entry_price = float(row[0]) if row else 0.0
+            table = "long_positions" if pos_type == "long" else "short_positions"
+            pnl_usdt, pnl_percent = self._get_realized_pnl(record)
+            fee = self._get_fee_for_position(record)
 
             # Формируем гарантированно валидные данные для Google Таблиц
             data_to_log = {
@@ -440,13 +627,9 @@ class PositionMonitor:
                     data_to_log[key] = 0.0
 
 
-            # Обновляем БД
-            with sqlite3.connect("data/positions.db") as conn:
-                conn.execute(f"""
-                    UPDATE {table}
-                    SET pnl_usdt = ?, pnl_percent = ?, exit_price = ?, closed = 1, exit_time = ?, reason = ?, fee = ?
-                    WHERE order_id = ?
-                """, (
+            # Обновляем БД; запись, уже закрытую сверкой или ликвидацией, не перезаписываем
+            with transaction(self.db_path) as conn:
+                updated = conn.execute(CLOSE_POSITION_QUERY.format(table=table), (
                     float(pnl_usdt),
                     float(pnl_percent),
                     float(current_price),
@@ -454,7 +637,11 @@ class PositionMonitor:
                     reason,
                     float(fee),
                     order_id,
-                ))
+                )).rowcount
+            position_book.remove(symbol)
+            if updated != 1:
+                logger.info(f"[Close] {symbol}: позиция уже закрыта в БД, уведомление не отправляем")
+                return False
 
             # Отправляем в Google Таблицы
             if self.sheet_logger:
@@ -470,10 +657,12 @@ class PositionMonitor:
                     float(pnl_usdt),
                     reason,
                     float(fee))
+            return True
 
         except Exception as e:
             logger.error(f"Ошибка при обновлении PNL для {symbol}: {str(e)}")
             traceback.print_exc()
+            return False
 
 
     def _get_swap_pnl_live(self, symbol: str, max_retries: int = 3) -> Optional[Tuple[Decimal, Decimal]]:
@@ -482,16 +671,13 @@ class PositionMonitor:
 
         while retry_count < max_retries:
             try:
-                res = self.account_api.get_positions(instType="SWAP")
-                if res.get("code") != "0":
-                    raise ValueError(f"API error: {res.get('msg', 'Unknown error')}")
-
-                for pos in res.get("data", []):
-                    normalized_api_symbol = pos["instId"].replace("-USD-", "-USDT-")
-                    if normalized_api_symbol == symbol:
-                        upl = Decimal(str(pos.get("upl", "0")))
-                        upl_ratio = Decimal(str(pos.get("uplRatio", "0"))) * 100
-                        return upl, upl_ratio
+                # Снимок позиций обновляется не чаще POSITIONS_REFRESH_SECONDS
+                pos = (position_snapshot.get(symbol, account_api=self.account_api)
+                       or position_snapshot.get(symbol.replace("-USDT-", "-USD-"), account_api=self.account_api))
+                if pos is not None:
+                    upl = Decimal(str(pos.get("upl", "0")))
+                    upl_ratio = Decimal(str(pos.get("uplRatio", "0"))) * 100
+                    return upl, upl_ratio
 
                 # Позиция не найдена — бросаем исключение, чтобы задать ошибку
                 logger.info(f"[INFO] Позиция {symbol} не найдена в API (возможно закрыта или ликвидирована).")
@@ -508,64 +694,95 @@ class PositionMonitor:
         logger.error(f"[ERROR] Не удалось получить PnL после {max_retries} попыток. Последняя ошибка: {str(last_exception)}")
         return None
 
-    def _get_contract_balance(self, symbol: str) -> Tuple[Decimal, str]:
+    def _get_contract_balance(self, symbol: str, force: bool = True) -> Tuple[Decimal, str]:
         try:
-            logger.info(f"Запрос позиций для {symbol}...")
-            res = self.account_api.get_positions(instType="SWAP")
-
-            if res.get("code") == "0":
-                for position in res.get("data", []):
-                    if position["instId"] == symbol:
-                        pos_amount_str = position.get("pos") or position.get("availPos") or "0"
-                        pos_side = position.get("posSide", "net")
-                        return Decimal(pos_amount_str), pos_side
+            # Перед закрытием нужен актуальный объём — снимок обновляется принудительно
+            position = position_snapshot.get(symbol, account_api=self.account_api, force=force)
+            if position is not None:
+                pos_amount_str = position.get("pos") or position.get("availPos") or "0"
+                pos_side = position.get("posSide", "net")
+                return Decimal(pos_amount_str), pos_side
         except Exception as e:
             logger.error(f"Ошибка при получении позиций: {e}")
         return Decimal("0"), "net"
 
-    def _get_realized_pnl(self, symbol: str, pos_type: str) -> Tuple[Decimal, Decimal]:
+    @staticmethod
+    def _entry_ms(entry_time) -> Optional[int]:
+        """Время входа (ISO, локальное время, как пишет log_position) в мс"""
         try:
-            if pos_type in ("short", "long"):
-                res = self.account_api.get_positions_history(instType="SWAP", instId=symbol)
-                if res.get("code") == "0" and res.get("data"):
-                    last_closed = res["data"][0]
-                    pnl_usdt = Decimal(last_closed.get("pnl", "0"))
-                    pnl_percent = Decimal(last_closed.get("pnlRatio", "0")) * 100
-                    return pnl_usdt, pnl_percent
-            # Если позиция не short или long — возвращаем 0
-            return Decimal("0"), Decimal("0")
-        except Exception as e:
-            logger.error(f"Ошибка при расчёте PNL для {symbol} ({pos_type}): {e}")
+            return int(datetime.fromisoformat(str(entry_time)).timestamp() * 1000)
+        except (TypeError, ValueError):
+            return None
+
+    def _get_close_records(self, closes: List[tuple]) -> Dict[str, dict]:
+        """
+        Записи истории позиций о закрытии этих позиций: (symbol, pos_type, entry_time)
+
+        Для каждой позиции подходит только запись той же стороны с uTime позже
+        времени входа — предыдущие закрытия по instId не берутся. История
+        запрашивается постранично сразу для всех позиций (для одной — по instId);
+        пока записи появились не у всех, опрос повторяется с паузой 0.25 → 2 сек
+        до history_deadline.
+        :return: symbol -> запись истории (без позиций, которых не дождались)
+        """
+        pending = {}
+        for symbol, pos_type, entry_time in closes:
+            entry_ms = self._entry_ms(entry_time)
+            if entry_ms is None:
+                logger.warning(f"[PNL] {symbol}: неизвестно время входа, закрытие в истории не определить")
+            else:
+                pending[symbol] = (pos_type, entry_ms)
+
+        found = {}
+        deadline = time.monotonic() + self.history_deadline
+        delay = 0.25
+        while pending:
+            try:
+                inst_id = next(iter(pending)) if len(pending) == 1 else None
+                since_ms = min(entry_ms for _, entry_ms in pending.values())
+                history, _ = fetch_positions_history(self.account_api, since_ms, CLOSE_HISTORY_PAGES, inst_id)
+                for record in history:
+                    symbol = record.get("instId")
+                    if symbol not in pending:
+                        continue
+                    pos_type, entry_ms = pending[symbol]
+                    if record.get("posSide") in (pos_type, "net") and int(record.get("uTime") or 0) > entry_ms:
+                        found[symbol] = record
+                        del pending[symbol]
+            except Exception as e:
+                logger.warning(f"[PNL] Ошибка запроса истории позиций: {e}")
+
+            if not pending:
+                break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                logger.warning(f"[PNL] {', '.join(pending)}: закрытие не появилось в истории за "
+                               f"{self.history_deadline} сек, PNL и комиссия записаны как 0")
+                break
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, 2.0)
+        return found
+
+    @staticmethod
+    def _get_realized_pnl(record: Optional[dict]) -> Tuple[Decimal, Decimal]:
+        """PNL (USDT, %) из записи истории закрытия"""
+        if record is None:
             return Decimal("0"), Decimal("0")
+        pnl_usdt = Decimal(record.get("pnl") or "0")
+        pnl_percent = Decimal(record.get("pnlRatio") or "0") * 100
+        return pnl_usdt, pnl_percent
 
     def _get_position_type(self, symbol: str) -> str:
         """Определение типа позиции"""
-        with sqlite3.connect("data/positions.db") as conn:
-            spot = conn.execute(
-                "SELECT 1 FROM long_positions WHERE symbol=? AND closed=0",
-                (symbol,)
-            ).fetchone()
-            return "long" if spot else "short"
-
-    def _get_fee_for_position(self, symbol: str, pos_type: str, order_id: str) -> Decimal:
-        """Получает сумму комиссии для закрытой позиции (только SWAP)"""
-        try:
-            # Для SWAP берём последнюю запись из истории позиций
-            res = self.account_api.get_positions_history(instType="SWAP", instId=symbol, limit=5)
-            if res.get("code") == "0" and res.get("data"):
-                # Ищем позицию по order_id
-                for position in res["data"]:
-                    if position.get("ordId") == order_id:
-                        fee_str = position.get("fee", "0")
-                        print(fee_str)
-                        return Decimal(fee_str) if fee_str else Decimal("0")
-                # fallback: берём последнюю запись, если конкретный order_id не найден
-                fee_str = res["data"][0].get("fee", "0")
-                return Decimal(fee_str) if fee_str else Decimal("0")
-            return Decimal("0")
-        except Exception as e:
-            logger.error(f"Ошибка при получении комиссии для {symbol}: {e}")
+        return "long" if position_book.get_type(symbol) == "long" else "short"
+
+    @staticmethod
+    def _get_fee_for_position(record: Optional[dict]) -> Decimal:
+        """Комиссия из записи истории закрытия (только SWAP)"""
+        if record is None:
             return Decimal("0")
+        fee_str = record.get("fee")
+        return Decimal(fee_str) if fee_str else Decimal("0")
 
 
 
@@ -0,0 +1,62 @@
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import logging
+logger = logging.getLogger(__name__)
+
+# WAL позволяет читателям (WebSocket, ликвидации) не блокировать писателя.
+# synchronous=NORMAL в режиме WAL не теряет согласованность при сбое процесса.
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-16000",
+    "PRAGMA mmap_size=134217728",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA busy_timeout=5000",
+)
+
+# Размер кеша подготовленных выражений на соединение
+CACHED_STATEMENTS = 256
+
+_local = threading.local()
+
+
+def get_connection(db_path: str) -> sqlite3.Connection:
+    """
+    Долгоживущее соединение с БД для текущего потока
+
+    Соединение открывается один раз на поток и файл, поэтому скомпилированные
+    выражения sqlite3 переиспользуются между вызовами.
+    """
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+
+    conn = connections.get(db_path)
+    if conn is None:
+        conn = sqlite3.connect(db_path, timeout=5, cached_statements=CACHED_STATEMENTS)
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        connections[db_path] = conn
+        logger.debug(f"[Storage] Открыто соединение {db_path} в потоке {threading.current_thread().name}")
+    return conn
+
+
+@contextmanager
+def transaction(db_path: str):
+    """Соединение потока с COMMIT при успехе и ROLLBACK при ошибке"""
+    conn = get_connection(db_path)
+    with conn:
+        yield conn
+
+
+def close_thread_connections():
+    """Закрывает соединения текущего потока"""
+    connections = getattr(_local, "connections", None) or {}
+    for conn in connections.values():
+        try:
+            conn.close()
+        except Exception as e:
+            logger.warning(f"[Storage] Ошибка закрытия соединения: {e}")
+    connections.clear()
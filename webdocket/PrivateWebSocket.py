@@ -0,0 +1,219 @@
+import base64
+import hashlib
+import hmac
+import json
+import time
+import threading
+from typing import Callable, List, Optional
+from websocket import create_connection, WebSocketConnectionClosedException, WebSocketTimeoutException
+from PositionSnapshot import position_snapshot
+import logging
+
+logger = logging.getLogger(__name__)
+
+PRIVATE_WS_URL = "wss://ws.okx.com:8443/ws/v5/private"
+PRIVATE_WS_URL_DEMO = "wss://wspap.okx.com:8443/ws/v5/private"
+
+# Категории ордеров и события balance_and_position, означающие принудительное закрытие
+LIQUIDATION_CATEGORIES = {"full_liquidation", "partial_liquidation", "adl"}
+LIQUIDATION_EVENTS = {"liquidation", "adl"}
+
+
+class OKXPrivateWebSocket:
+    def __init__(self, api_key: str, api_secret: str, passphrase: str, is_demo: str = "0",
+                 on_liquidation: Optional[Callable[[str], None]] = None,
+                 on_reconnect: Optional[Callable[[], None]] = None,
+                 ping_interval: int = 25):
+        """
+        Приватный WebSocket OKX: каналы orders, positions и balance_and_position
+
+        positions обновляет общий снимок позиций, ликвидации из orders и
+        balance_and_position передаются в on_liquidation(instId) сразу.
+        Исполнения ордеров получают подписчики add_order_listener.
+
+        :param on_liquidation: вызывается с instId при ликвидации/ADL
+        :param on_reconnect: вызывается после каждого успешного входа,
+                             чтобы досверить пропущенное за время разрыва
+        :param ping_interval: интервал ping при отсутствии сообщений, сек
+        """
+        self.api_key = api_key
+        self.api_secret = api_secret
+        self.passphrase = passphrase
+        self.url = PRIVATE_WS_URL_DEMO if str(is_demo) == "1" else PRIVATE_WS_URL
+        self.on_liquidation = on_liquidation
+        self.on_reconnect = on_reconnect
+        self.ping_interval = ping_interval
+
+        self._running = False
+        self._connected = False
+        self._ws = None
+        self._thread = None
+        self._order_listeners: List[Callable[[dict], None]] = []
+        # Страницы полного снимка канала positions (первое сообщение после подписки)
+        self._positions_snapshot = None
+        self._reconnect_attempts = 0
+
+    def add_order_listener(self, callback: Callable[[dict], None]):
+        """Подписка на обновления ордеров (каждый элемент data канала orders)"""
+        self._order_listeners.append(callback)
+
+    def _sign(self, timestamp: str) -> str:
+        message = f"{timestamp}GET/users/self/verify"
+        digest = hmac.new(self.api_secret.encode(), message.encode(), hashlib.sha256).digest()
+        return base64.b64encode(digest).decode()
+
+    def _login(self):
+        timestamp = str(int(time.time()))
+        self._send({"op": "login", "args": [{
+            "apiKey": self.api_key,
+            "passphrase": self.passphrase,
+            "timestamp": timestamp,
+            "sign": self._sign(timestamp),
+        }]})
+
+    def _subscribe(self):
+        self._positions_snapshot = []
+        self._send({"op": "subscribe", "args": [
+            {"channel": "orders", "instType": "SWAP"},
+            {"channel": "positions", "instType": "SWAP"},
+            {"channel": "balance_and_position"},
+        ]})
+
+    def _send(self, message):
+        try:
+            if self._ws:
+                self._ws.send(message if isinstance(message, str) else json.dumps(message))
+        except Exception as e:
+            logger.error(f"[PrivateWS] Ошибка отправки сообщения: {e}")
+
+    def _handle_event(self, data: dict):
+        event = data.get("event")
+        if event == "login":
+            if data.get("code") == "0":
+                logger.info("[PrivateWS] ✅ Авторизация выполнена, подписываемся на каналы")
+                self._subscribe()
+            else:
+                logger.error(f"[PrivateWS] Ошибка авторизации: {data.get('msg')}")
+        elif event == "subscribe":
+            channel = data.get("arg", {}).get("channel")
+            logger.info(f"[PrivateWS] Подписка на {channel} активна")
+            if channel == "balance_and_position" and not self._connected:
+                self._connected = True
+                self._reconnect_attempts = 0
+                if self.on_reconnect:
+                    threading.Thread(target=self.on_reconnect, daemon=True).start()
+        elif event == "error":
+            logger.error(f"[PrivateWS] Ошибка: {data.get('code')} {data.get('msg')}")
+
+    def _handle_message(self, data: dict):
+        if "event" in data:
+            self._handle_event(data)
+            return
+
+        channel = data.get("arg", {}).get("channel")
+        items = data.get("data", [])
+
+        if channel == "positions":
+            self._handle_positions(data, items)
+
+        elif channel == "orders":
+            for order in items:
+                if order.get("category") in LIQUIDATION_CATEGORIES:
+                    self._notify_liquidation(order.get("instId"))
+                for listener in self._order_listeners:
+                    try:
+                        listener(order)
+                    except Exception as e:
+                        logger.error(f"[PrivateWS] Ошибка обработчика ордеров: {e}")
+
+        elif channel == "balance_and_position":
+            for item in items:
+                if item.get("eventType") in LIQUIDATION_EVENTS:
+                    for pos in item.get("posData", []):
+                        self._notify_liquidation(pos.get("instId"))
+
+    def _handle_positions(self, data: dict, items: list):
+        """
+        Первое сообщение после подписки — полный снимок (возможно, в несколько
+        страниц): заменяет PositionSnapshot целиком, чтобы ушли позиции,
+        закрытые, пока соединения не было. Остальные — точечные обновления.
+        """
+        is_snapshot = data.get("eventType") == "snapshot" or (
+            "eventType" not in data and self._positions_snapshot is not None)
+        if not is_snapshot or self._positions_snapshot is None:
+            position_snapshot.apply_update(items)
+            return
+
+        self._positions_snapshot.extend(items)
+        if data.get("lastPage", True) in (True, "true"):
+            position_snapshot.replace_all(self._positions_snapshot)
+            logger.info(f"[PrivateWS] Снимок позиций заменён: {len(self._positions_snapshot)} позиций")
+            self._positions_snapshot = None
+
+    def _notify_liquidation(self, inst_id: Optional[str]):
+        if not inst_id or not self.on_liquidation:
+            return
+        logger.info(f"[PrivateWS] ⚡ Событие ликвидации по {inst_id}")
+        try:
+            self.on_liquidation(inst_id)
+        except Exception as e:
+            logger.error(f"[PrivateWS] Ошибка обработки ликвидации {inst_id}: {e}")
+
+    def _connect(self):
+        """Основной цикл соединения с переподключением"""
+        while self._running:
+            try:
+                self._ws = create_connection(self.url, timeout=30)
+                self._ws.settimeout(self.ping_interval)
+                self._login()
+
+                while self._running:
+                    try:
+                        message = self._ws.recv()
+                    except WebSocketTimeoutException:
+                        self._send("ping")
+                        continue
+
+                    if message == "pong":
+                        continue
+                    self._handle_message(json.loads(message))
+
+            except WebSocketConnectionClosedException:
+                logger.warning("[PrivateWS] Соединение закрыто")
+            except Exception as e:
+                logger.error(f"[PrivateWS] Ошибка соединения: {e}")
+            finally:
+                self._connected = False
+                if self._ws:
+                    try:
+                        self._ws.close()
+                    except Exception:
+                        pass
+
+            if self._running:
+                self._reconnect_attempts += 1
+                delay = min(5 * self._reconnect_attempts, 60)
+                logger.info(f"[PrivateWS] Переподключение через {delay} сек (попытка {self._reconnect_attempts})")
+                time.sleep(delay)
+
+    def start(self):
+        """Запуск в отдельном потоке"""
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._connect, name="okx-private-ws", daemon=True)
+        self._thread.start()
+        logger.info("[PrivateWS] Запуск приватного WebSocket")
+
+    def stop(self):
+        self._running = False
+        self._connected = False
+        if self._ws:
+            try:
+                self._ws.close()
+            except Exception:
+                pass
+
+    def is_connected(self) -> bool:
+        """Соединение авторизовано и подписки активны"""
+        return self._connected
@@ -1,9 +1,9 @@
 import json
-import sqlite3
 import time
 import threading
 from websocket import create_connection, WebSocketConnectionClosedException
 from decimal import Decimal
+from PositionBook import position_book
 import logging
 
 logger = logging.getLogger(__name__)
@@ -33,14 +33,10 @@ class CustomWebSocket:
         self._monitor_thread = None
 
     def _get_active_positions(self) -> set:
-        """Получаем активные позиции из БД"""
+        """Получаем активные SHORT позиции из книги позиций"""
         active = set()
         try:
-            with sqlite3.connect("data/positions.db") as conn:
-                # SHORT позиции
-                short = conn.execute("SELECT symbol FROM short_positions WHERE closed=0")
-                active.update(row[0] for row in short.fetchall())
-
+            active = set(position_book.snapshot("short"))
             print(f"Активные позиции: {active}")
         except Exception as e:
             print(f"Ошибка получения активных позиций: {e}")